@@ -0,0 +1,361 @@
+"""
+The adaptive context holds several interchangeable strategies and picks
+one per call instead of running whatever set_strategy installed. Which
+one is fastest depends on the input, so the timings are kept per bucket
+of an input feature, by default the power-of-two bucket of len(data).
+
+For every new bucket each strategy is first tried `min_samples` times.
+After that the context runs the strategy with the lowest moving average
+and spends at most `exploration` of the bucket's calls re-measuring the
+others, the least measured first, so a strategy that got faster is still
+noticed but exploration never costs more than that share.
+
+decisions() shows the table and why the last call went where it did;
+save() and load() persist the table as JSON so the next run starts
+where this one stopped.
+
+usage:
+    context = AdaptiveContext({"heap": HeapTopK(), "sort": SortTopK()}, table_path="topk.json")
+    context.execute_strategy(records)
+    context.save()
+"""
+import heapq
+import json
+import os
+import random
+import tempfile
+import time
+import typing
+import unittest
+
+from .strategy import Context, Strategy
+
+
+def size_bucket(data: typing.Any) -> int:
+    """
+    the default feature: bit length of the input size.
+    """
+    try:
+        return len(data).bit_length()
+    except TypeError:
+        return 0
+
+
+class TimingStats:
+    """
+    timing of one strategy in one bucket.
+    """
+    __slots__ = ("calls", "mean")
+
+    def __init__(self, calls: int = 0, mean: float = 0.0) -> None:
+        self.calls = calls
+        self.mean = mean
+
+    def record(self, seconds: float, alpha: float) -> None:
+        """
+        add a sample; plain average while warming up, EWMA afterwards.
+        """
+        self.calls += 1
+        weight = max(1.0 / self.calls, alpha)
+        self.mean += weight * (seconds - self.mean)
+
+
+class Bucket:
+    """
+    the statistics of every strategy for one feature value.
+    """
+    def __init__(self, names: typing.Iterable[str]) -> None:
+        self.stats = {name: TimingStats() for name in names}
+        self.calls = 0
+        self.explored = 0
+
+
+class AdaptiveContext(Context):
+    """
+    context that learns the fastest strategy per input bucket.
+    """
+    def __init__(
+        self,
+        strategies: typing.Mapping[str, Strategy],
+        feature: typing.Callable[[typing.Any], typing.Hashable] = size_bucket,
+        min_samples: int = 3,
+        exploration: float = 0.05,
+        alpha: float = 0.1,
+        table_path: typing.Optional[str] = None,
+        clock: typing.Callable[[], float] = time.perf_counter,
+    ) -> None:
+        if not strategies:
+            raise ValueError("at least one strategy is required")
+        self.strategies = dict(strategies)
+        super().__init__(next(iter(self.strategies.values())))
+        self.feature = feature
+        self.min_samples = min_samples
+        self.exploration = exploration
+        self.alpha = alpha
+        self.table_path = table_path
+        self.clock = clock
+        self.buckets: typing.Dict[typing.Hashable, Bucket] = {}
+        self.last_decision: typing.Optional[typing.Dict[str, typing.Any]] = None
+        if table_path is not None and os.path.exists(table_path):
+            self.load(table_path)
+
+    def _bucket(self, key: typing.Hashable) -> Bucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(self.strategies)
+        return bucket
+
+    def choose(self, key: typing.Hashable) -> typing.Tuple[str, str]:
+        """
+        the strategy for the next call in the bucket, and why.
+        """
+        bucket = self._bucket(key)
+        stats = bucket.stats
+        least = min(stats, key=lambda name: stats[name].calls)
+        if stats[least].calls < self.min_samples:
+            return least, "warmup"
+        best = min(stats, key=lambda name: stats[name].mean)
+        if len(stats) > 1 and bucket.explored < self.exploration * bucket.calls:
+            others = [name for name in stats if name != best]
+            return min(others, key=lambda name: stats[name].calls), "explore"
+        return best, "exploit"
+
+    def execute_strategy(self, data):
+        key = self.feature(data)
+        name, reason = self.choose(key)
+        bucket = self.buckets[key]
+        self._strategy = self.strategies[name]
+
+        started_at = self.clock()
+        result = self._strategy.execute(data)
+        seconds = self.clock() - started_at
+
+        bucket.calls += 1
+        if reason == "explore":
+            bucket.explored += 1
+        bucket.stats[name].record(seconds, self.alpha)
+        self.last_decision = {"bucket": key, "strategy": name, "reason": reason, "seconds": seconds}
+        return result
+
+    def best(self, key: typing.Hashable) -> typing.Optional[str]:
+        """
+        the strategy currently preferred for the bucket, None while unknown.
+        """
+        bucket = self.buckets.get(key)
+        if bucket is None or any(stats.calls < self.min_samples for stats in bucket.stats.values()):
+            return None
+        return min(bucket.stats, key=lambda name: bucket.stats[name].mean)
+
+    def decisions(self) -> typing.Dict[typing.Hashable, typing.Dict[str, typing.Any]]:
+        """
+        the learned table for inspection.
+        """
+        return {
+            key: {
+                "best": self.best(key),
+                "calls": bucket.calls,
+                "explored": bucket.explored,
+                "strategies": {
+                    name: {"calls": stats.calls, "mean": stats.mean} for name, stats in bucket.stats.items()
+                },
+            }
+            for key, bucket in sorted(self.buckets.items(), key=lambda item: str(item[0]))
+        }
+
+    def save(self, path: typing.Optional[str] = None) -> None:
+        """
+        write the table as JSON.
+        """
+        path = path or self.table_path
+        if path is None:
+            raise ValueError("no table path given")
+        table = [
+            {
+                "bucket": key,
+                "calls": bucket.calls,
+                "explored": bucket.explored,
+                "stats": {name: [stats.calls, stats.mean] for name, stats in bucket.stats.items()},
+            }
+            for key, bucket in self.buckets.items()
+        ]
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({"version": 1, "buckets": table}, file)
+        os.replace(temporary, path)
+
+    def load(self, path: typing.Optional[str] = None) -> None:
+        """
+        read a table written by save; strategies it does not know start fresh.
+        """
+        with open(path or self.table_path, encoding="utf-8") as file:
+            table = json.load(file)
+        for entry in table["buckets"]:
+            key = entry["bucket"]
+            bucket = self._bucket(tuple(key) if isinstance(key, list) else key)
+            bucket.calls = entry["calls"]
+            bucket.explored = entry["explored"]
+            for name, (calls, mean) in entry["stats"].items():
+                if name in bucket.stats:
+                    bucket.stats[name] = TimingStats(calls, mean)
+
+
+class HeapTopK(Strategy):
+    """
+    the k largest values with heapq.nlargest.
+    """
+    def __init__(self, k: int = 10) -> None:
+        self.k = k
+
+    def execute(self, data):
+        return heapq.nlargest(self.k, data)
+
+
+class SortTopK(Strategy):
+    """
+    the k largest values by sorting everything.
+    """
+    def __init__(self, k: int = 10) -> None:
+        self.k = k
+
+    def execute(self, data):
+        return sorted(data, reverse=True)[:self.k]
+
+
+class ScanTopK(Strategy):
+    """
+    the k largest values by repeated max, fine for tiny inputs.
+    """
+    def __init__(self, k: int = 10) -> None:
+        self.k = k
+
+    def execute(self, data):
+        remaining = list(data)
+        result = []
+        for _ in range(min(self.k, len(remaining))):
+            largest = max(remaining)
+            remaining.remove(largest)
+            result.append(largest)
+        return result
+
+
+def benchmark(calls: int = 3_000, seed: int = 5) -> typing.Dict[str, float]:
+    """
+    total seconds for a mixed workload of input sizes, adaptive (warm-up
+    and exploration included) against each fixed strategy.
+    """
+    rnd = random.Random(seed)
+    sizes = [rnd.choice((5, 50, 500, 50_000)) for _ in range(calls)]
+    pool = [rnd.random() for _ in range(max(sizes))]
+    inputs = [pool[:size] for size in sizes]
+    strategies = {"heap": HeapTopK(), "sort": SortTopK(), "scan": ScanTopK()}
+
+    results = {}
+    contexts = {name: Context(strategy) for name, strategy in strategies.items()}
+    contexts["adaptive"] = AdaptiveContext(strategies)
+    for name, context in contexts.items():
+        started_at = time.perf_counter()
+        for data in inputs:
+            context.execute_strategy(data)
+        results[f"{name}_seconds"] = time.perf_counter() - started_at
+    return results
+
+
+class SimulatedClock:
+    """
+    virtual clock advanced by the simulated strategies.
+    """
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class SimulatedStrategy(Strategy):
+    """
+    strategy whose cost is a function of the input size.
+    """
+    def __init__(self, clock: SimulatedClock, cost: typing.Callable[[int], float]) -> None:
+        self.clock = clock
+        self.cost = cost
+
+    def execute(self, data):
+        self.clock.now += self.cost(len(data))
+        return len(data)
+
+
+class TestAdaptiveContext(unittest.TestCase):
+    """
+    test adaptive context.
+    """
+    def make_context(self, **kwargs) -> typing.Tuple[AdaptiveContext, SimulatedClock]:
+        """
+        a quadratic strategy with no setup and a linear one with setup,
+        crossing over at about 100 items.
+        """
+        clock = SimulatedClock()
+        strategies = {
+            "quadratic": SimulatedStrategy(clock, lambda size: 1e-8 * size * size),
+            "linear": SimulatedStrategy(clock, lambda size: 1e-4 + 1e-8 * size),
+        }
+        return AdaptiveContext(strategies, clock=clock, **kwargs), clock
+
+    def test_converges_per_bucket(self) -> None:
+        """
+        small inputs go to the quadratic strategy, large to the linear one.
+        """
+        context, _ = self.make_context()
+        for _ in range(200):
+            for size in (8, 1_000):
+                context.execute_strategy([0] * size)
+        self.assertEqual(context.best(size_bucket([0] * 8)), "quadratic")
+        self.assertEqual(context.best(size_bucket([0] * 1_000)), "linear")
+        self.assertEqual(context.last_decision["bucket"], size_bucket([0] * 1_000))
+
+    def test_exploration_is_bounded(self) -> None:
+        """
+        after warm-up at most `exploration` of the calls are spent exploring.
+        """
+        context, _ = self.make_context(exploration=0.1)
+        for _ in range(1_000):
+            context.execute_strategy([0] * 8)
+        table = context.decisions()[size_bucket([0] * 8)]
+        self.assertLessEqual(table["explored"], 0.1 * table["calls"] + 1)
+        self.assertGreater(table["strategies"]["quadratic"]["calls"], 850)
+
+    def test_persistence(self) -> None:
+        """
+        a saved table lets the next context skip the warm-up.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "table.json")
+            context, _ = self.make_context(table_path=path)
+            for _ in range(20):
+                context.execute_strategy([0] * 1_000)
+            context.save()
+            restored, _ = self.make_context(table_path=path)
+        self.assertEqual(restored.decisions(), context.decisions())
+        restored.execute_strategy([0] * 1_000)
+        self.assertEqual(restored.last_decision["reason"], "exploit")
+
+    def test_real_strategies_agree(self) -> None:
+        """
+        every top-k strategy gives the same answer.
+        """
+        data = [random.random() for _ in range(300)]
+        expected = SortTopK().execute(data)
+        self.assertEqual(HeapTopK().execute(data), expected)
+        self.assertEqual(ScanTopK().execute(data), expected)
+
+    def test_benchmark(self) -> None:
+        """
+        the adaptive context is not slower than the worst fixed strategy.
+        """
+        results = benchmark(calls=600)
+        print(results)
+        worst = max(value for name, value in results.items() if name != "adaptive_seconds")
+        self.assertLess(results["adaptive_seconds"], worst)
+
+
+if __name__ == "__main__":
+    unittest.main()
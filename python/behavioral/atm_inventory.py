@@ -0,0 +1,308 @@
+"""
+The shared cassette inventory lets many withdrawals run against the same
+ATM cassettes at once without ever handing out a bill twice.
+
+Every denomination has its own lock and two counters: `on_hand`, the bills
+physically in the cassette, and `available`, the bills not yet promised to
+a withdrawal. A withdrawal is two-phase:
+
+    1) reserve: plan the bills with the dispensing engine on a snapshot of
+        the available counters, then take the locks of the planned
+        denominations (always largest first, so two withdrawals can never
+        deadlock) and move the bills from available into the reservation.
+        When another withdrawal got there first, the plan is redone; after
+        max_retries conflicts the withdrawal takes every lock and plans on
+        a stable inventory, so contention never turns into a refusal.
+
+    2) commit or release: once the hardware has dispensed, the reserved
+        bills leave on_hand; when the hardware fails, the reservation is
+        released and the bills become available again.
+
+usage:
+    inventory = SharedInventory({100: 50, 50: 50, 20: 100, 10: 100})
+    result = inventory.withdraw(230)
+"""
+import random
+import threading
+import time
+import typing
+import unittest
+
+from .chain_of_responsiblity import DispenseResult, DispensingEngine
+
+
+class Cassette:
+    """
+    one denomination of the shared inventory.
+    """
+    def __init__(self, denomination: int, count: int) -> None:
+        self.denomination = denomination
+        self.on_hand = count
+        self.available = count
+        self.lock = threading.Lock()
+
+
+class Reservation:
+    """
+    bills promised to one withdrawal until it commits or releases.
+    """
+    def __init__(self, inventory: "SharedInventory", amount: int, bills: typing.Dict[int, int]) -> None:
+        self.inventory = inventory
+        self.amount = amount
+        self.bills = bills
+        self.state = "reserved"
+
+    def commit(self) -> DispenseResult:
+        """
+        the bills left the machine.
+        """
+        self._finish("committed")
+        for denomination, count in self.bills.items():
+            cassette = self.inventory.cassettes[denomination]
+            with cassette.lock:
+                cassette.on_hand -= count
+        return DispenseResult(self.amount, self.bills)
+
+    def release(self) -> None:
+        """
+        give the bills back to other withdrawals.
+        """
+        self._finish("released")
+        for denomination, count in self.bills.items():
+            cassette = self.inventory.cassettes[denomination]
+            with cassette.lock:
+                cassette.available += count
+
+    def _finish(self, state: str) -> None:
+        if self.state != "reserved":
+            raise RuntimeError(f"reservation is already {self.state}")
+        self.state = state
+
+    def __enter__(self) -> "Reservation":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if self.state == "reserved":
+            if exc_type is None:
+                self.commit()
+            else:
+                self.release()
+
+
+class SharedInventory:
+    """
+    thread-safe cassette inventory with two-phase withdrawals.
+    """
+    def __init__(self, counts: typing.Dict[int, int], max_retries: int = 8) -> None:
+        self.cassettes = {
+            denomination: Cassette(denomination, count)
+            for denomination, count in sorted(counts.items(), reverse=True)
+        }
+        self.max_retries = max_retries
+        self.conflicts = 0
+        self._conflicts_lock = threading.Lock()
+
+    def snapshot(self) -> typing.Dict[int, int]:
+        """
+        available bills per denomination, read without locking.
+        """
+        return {denomination: cassette.available for denomination, cassette in self.cassettes.items()}
+
+    def on_hand(self) -> typing.Dict[int, int]:
+        """
+        bills physically in the cassettes.
+        """
+        return {denomination: cassette.on_hand for denomination, cassette in self.cassettes.items()}
+
+    def _try_reserve(self, bills: typing.Dict[int, int]) -> bool:
+        locks = [self.cassettes[denomination].lock for denomination in sorted(bills, reverse=True)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            if any(self.cassettes[denomination].available < count for denomination, count in bills.items()):
+                return False
+            for denomination, count in bills.items():
+                self.cassettes[denomination].available -= count
+            return True
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def reserve(self, amount: int) -> typing.Optional[Reservation]:
+        """
+        promise bills for the amount, None when it cannot be dispensed.
+        """
+        for _ in range(self.max_retries):
+            plan = DispensingEngine(self.snapshot()).plan(amount)
+            if not plan.success:
+                return None
+            if self._try_reserve(plan.bills):
+                return Reservation(self, amount, plan.bills)
+            with self._conflicts_lock:
+                self.conflicts += 1
+        return self._reserve_locked(amount)
+
+    def _reserve_locked(self, amount: int) -> typing.Optional[Reservation]:
+        locks = [cassette.lock for cassette in self.cassettes.values()]
+        for lock in locks:
+            lock.acquire()
+        try:
+            plan = DispensingEngine(self.snapshot()).plan(amount)
+            if not plan.success:
+                return None
+            for denomination, count in plan.bills.items():
+                self.cassettes[denomination].available -= count
+            return Reservation(self, amount, plan.bills)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def withdraw(
+        self,
+        amount: int,
+        hardware: typing.Optional[typing.Callable[[typing.Dict[int, int]], None]] = None,
+    ) -> DispenseResult:
+        """
+        reserve, run the hardware and commit; a hardware error releases the bills.
+        """
+        reservation = self.reserve(amount)
+        if reservation is None:
+            return DispenseResult(amount, {})
+        with reservation:
+            if hardware is not None:
+                hardware(reservation.bills)
+        return DispenseResult(amount, reservation.bills)
+
+
+class HardwareJam(Exception):
+    """
+    the simulated dispenser jammed.
+    """
+
+
+def benchmark(
+    thread_counts: typing.Sequence[int] = (1, 2, 4, 8, 16, 32),
+    withdrawals: int = 4_000,
+    seed: int = 11,
+) -> typing.List[typing.Dict[str, typing.Any]]:
+    """
+    withdrawals per second across thread counts, checking after every run
+    that no cassette was overdrawn and that every bill is accounted for.
+    """
+    results = []
+    for threads in thread_counts:
+        initial = {100: 400, 50: 400, 20: 1_000, 10: 1_000}
+        inventory = SharedInventory(initial)
+        dispensed = [0] * threads
+        rnd = random.Random(seed)
+        amounts = [rnd.randrange(10, 400, 10) for _ in range(withdrawals)]
+
+        jams = random.Random(seed)
+
+        def jam_sometimes(bills: typing.Dict[int, int]) -> None:
+            if jams.random() < 0.05:
+                raise HardwareJam()
+
+        def worker(index: int) -> None:
+            for amount in amounts[index::threads]:
+                try:
+                    result = inventory.withdraw(amount, jam_sometimes)
+                except HardwareJam:
+                    continue
+                if result.success:
+                    dispensed[index] += amount
+
+        pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+        started_at = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - started_at
+
+        remaining = inventory.on_hand()
+        total_before = sum(denomination * count for denomination, count in initial.items())
+        total_after = sum(denomination * count for denomination, count in remaining.items())
+        results.append({
+            "threads": threads,
+            "withdrawals_per_second": withdrawals / elapsed,
+            "conflicts": inventory.conflicts,
+            "overdrawn": any(count < 0 for count in remaining.values()),
+            "balanced": total_before - total_after == sum(dispensed),
+            "available_matches": inventory.snapshot() == remaining,
+        })
+    return results
+
+
+class TestSharedInventory(unittest.TestCase):
+    """
+    test shared inventory.
+    """
+    def test_withdraw(self) -> None:
+        """
+        a withdrawal takes its bills out of the cassettes.
+        """
+        inventory = SharedInventory({100: 2, 50: 1, 20: 5, 10: 0})
+        result = inventory.withdraw(260)
+        self.assertEqual(result.bills, {100: 2, 20: 3})
+        self.assertEqual(inventory.on_hand(), {100: 0, 50: 1, 20: 2, 10: 0})
+
+    def test_hardware_failure_releases(self) -> None:
+        """
+        a failed withdrawal gives its bills back.
+        """
+        inventory = SharedInventory({100: 2})
+
+        def jam(bills) -> None:
+            raise HardwareJam()
+
+        with self.assertRaises(HardwareJam):
+            inventory.withdraw(200, jam)
+        self.assertEqual(inventory.snapshot(), {100: 2})
+        self.assertEqual(inventory.on_hand(), {100: 2})
+
+    def test_reserved_bills_unavailable(self) -> None:
+        """
+        bills of an open reservation cannot be promised twice.
+        """
+        inventory = SharedInventory({100: 1, 50: 2})
+        reservation = inventory.reserve(100)
+        self.assertEqual(reservation.bills, {100: 1})
+        self.assertEqual(inventory.reserve(100).bills, {50: 2})
+        self.assertIsNone(inventory.reserve(100))
+        reservation.release()
+        with self.assertRaises(RuntimeError):
+            reservation.commit()
+        self.assertEqual(inventory.withdraw(100).bills, {100: 1})
+
+    def test_contention_is_not_a_refusal(self) -> None:
+        """
+        a withdrawal that keeps losing the race still gets its bills.
+        """
+        class Contended(SharedInventory):
+            """
+            every optimistic reservation loses to another withdrawal.
+            """
+            def _try_reserve(self, bills) -> bool:
+                return False
+
+        inventory = Contended({100: 1, 50: 1}, max_retries=3)
+        reservation = inventory.reserve(150)
+        self.assertEqual(reservation.bills, {100: 1, 50: 1})
+        self.assertEqual(inventory.conflicts, 3)
+        self.assertEqual(inventory.snapshot(), {100: 0, 50: 0})
+        self.assertIsNone(inventory.reserve(50))
+
+    def test_concurrent_withdrawals_never_overdraw(self) -> None:
+        """
+        1 to 32 threads drain the cassettes without overdrawing them.
+        """
+        for result in benchmark(thread_counts=(1, 4, 32), withdrawals=2_000):
+            print(result)
+            self.assertFalse(result["overdrawn"])
+            self.assertTrue(result["balanced"])
+            self.assertTrue(result["available_matches"])
+
+
+if __name__ == "__main__":
+    unittest.main()
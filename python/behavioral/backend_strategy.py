@@ -0,0 +1,373 @@
+"""
+Strategies with several backends for the same logical algorithm: scalar
+Python for single records and lists, vectorized NumPy for columnar
+batches. The backend is chosen from the type of the input:
+
+    {"amount": 15000, "rate_bp": 150}                      record -> python
+    {"amount": [15000, ...], "rate_bp": [150, ...]}        columns -> python
+    {"amount": numpy.array([...]), "rate_bp": ...}         columns -> numpy
+
+execute_batch (used by Context.execute_many) turns a chunk of records
+into columns and runs the fastest backend available for them. NumPy is
+optional; without it every input goes to the Python backend.
+
+check_parity runs every backend on the same randomized batches and
+reports any result that differs, so a new backend can be trusted before
+it is registered.
+
+usage:
+    context = Context(CommissionStrategy())
+    context.execute_strategy({"amount": 15000, "rate_bp": 150})
+    fees = list(context.execute_many(records, chunk_size=10_000))
+"""
+import abc
+import random
+import time
+import typing
+import unittest
+
+from .strategy import Context, Strategy
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+Columns = typing.Dict[str, typing.Any]
+
+INT64_MAX = 2 ** 63 - 1
+
+
+def is_columnar(data: typing.Any) -> bool:
+    """
+    whether the input is a dict of columns rather than one record.
+    """
+    return isinstance(data, dict) and bool(data) and all(
+        hasattr(column, "__len__") and not isinstance(column, (str, bytes)) for column in data.values()
+    )
+
+
+class Backend(abc.ABC):
+    """
+    one implementation of a logical algorithm.
+    """
+    name = ""
+
+    @abc.abstractmethod
+    def accepts(self, data: typing.Any) -> bool:
+        """
+        whether the backend can run this input natively.
+        """
+
+    @abc.abstractmethod
+    def execute(self, data: typing.Any) -> typing.Any:
+        """
+        run the algorithm.
+        """
+
+    def convert(self, columns: Columns) -> typing.Any:
+        """
+        columns of Python lists in the backend's native batch type.
+        """
+        return columns
+
+    def to_list(self, result: typing.Any) -> list:
+        """
+        a batch result as a plain list, for comparison.
+        """
+        return list(result)
+
+
+class MultiBackendStrategy(Strategy):
+    """
+    strategy that dispatches to the first backend accepting the input.
+    """
+    backends: typing.Sequence[Backend] = ()
+
+    def backend_for(self, data: typing.Any) -> Backend:
+        """
+        the backend that runs this input.
+        """
+        for backend in self.backends:
+            if backend.accepts(data):
+                return backend
+        raise TypeError(f"no backend for {type(data).__name__} input")
+
+    def execute(self, data):
+        return self.backend_for(data).execute(data)
+
+    def execute_batch(self, records: typing.Sequence[dict]) -> list:
+        """
+        run a chunk of records as one columnar batch on the best backend.
+        """
+        if not records:
+            return []
+        columns = {name: [record[name] for record in records] for name in records[0]}
+        backend = self.backends[0]
+        return backend.to_list(backend.execute(backend.convert(columns)))
+
+
+class PythonCommission(Backend):
+    """
+    commission in Python, per record or over columns of lists.
+    """
+    name = "python"
+
+    def __init__(self, minimum: int) -> None:
+        self.minimum = minimum
+
+    def accepts(self, data):
+        return isinstance(data, dict)
+
+    def execute(self, data):
+        minimum = self.minimum
+        if not is_columnar(data):
+            return max(data["amount"] * data["rate_bp"] // 10_000, minimum)
+        return [
+            max(amount * rate // 10_000, minimum) for amount, rate in zip(data["amount"], data["rate_bp"])
+        ]
+
+
+class NumpyCommission(Backend):
+    """
+    commission vectorized over int64 columns. Batches whose products could
+    leave int64 are computed over object arrays of Python ints instead, so
+    they do not wrap around. Narrower integer columns are widened to int64
+    first; float columns are left to the Python backend, which rounds them
+    the way it rounds Python floats.
+    """
+    name = "numpy"
+
+    def __init__(self, minimum: int) -> None:
+        self.minimum = minimum
+
+    def accepts(self, data):
+        return numpy is not None and is_columnar(data) and all(
+            isinstance(column, numpy.ndarray) and (column.dtype == object or column.dtype.kind in "iu")
+            for column in data.values()
+        )
+
+    @staticmethod
+    def _widen(column):
+        if column.dtype == object or column.dtype == numpy.int64:
+            return column
+        if numpy.can_cast(column.dtype, numpy.int64):
+            return column.astype(numpy.int64)
+        return column.astype(object)
+
+    @staticmethod
+    def _magnitude(column) -> int:
+        return max(abs(int(column.min())), abs(int(column.max()))) if len(column) else 0
+
+    def execute(self, data):
+        amount, rate = self._widen(data["amount"]), self._widen(data["rate_bp"])
+        exact = object in (amount.dtype, rate.dtype)
+        if exact or self._magnitude(amount) * self._magnitude(rate) > INT64_MAX:
+            amount, rate = amount.astype(object), rate.astype(object)
+        return numpy.maximum(amount * rate // 10_000, self.minimum)
+
+    def convert(self, columns):
+        try:
+            return {name: numpy.asarray(column, dtype=numpy.int64) for name, column in columns.items()}
+        except OverflowError:
+            return {name: numpy.asarray(column, dtype=object) for name, column in columns.items()}
+
+    def to_list(self, result):
+        return result.tolist()
+
+
+class CommissionStrategy(MultiBackendStrategy):
+    """
+    payment commission: amount * rate in basis points, at least `minimum`.
+    amounts are integers (tiyin) so every backend rounds the same way.
+    """
+    def __init__(self, minimum: int = 100) -> None:
+        backends: typing.List[Backend] = [PythonCommission(minimum)]
+        if numpy is not None:
+            backends.insert(0, NumpyCommission(minimum))
+        self.backends = backends
+
+
+def random_commission_columns(rnd: random.Random, size: int) -> Columns:
+    """
+    random commission input, including the edges; the largest amounts
+    make amount * rate overflow int64.
+    """
+    edges = (0, 1, 9_999, 10_000, 2 ** 62, INT64_MAX, 2 ** 64)
+    amounts = [rnd.choice(edges + (rnd.randrange(10 ** 9),) * 3) for _ in range(size)]
+    rates = [rnd.choice((0, 1, 150, 10_000, rnd.randrange(10_000))) for _ in range(size)]
+    return {"amount": amounts, "rate_bp": rates}
+
+
+def check_parity(
+    strategy: MultiBackendStrategy,
+    make_columns: typing.Callable[[random.Random, int], Columns],
+    trials: int = 50,
+    max_size: int = 500,
+    seed: int = 0,
+) -> typing.List[str]:
+    """
+    run every backend, and the per-record path, on randomized batches;
+    returns a description of every mismatch (empty when all agree).
+    """
+    rnd = random.Random(seed)
+    mismatches = []
+    for trial in range(trials):
+        columns = make_columns(rnd, rnd.randrange(max_size + 1))
+        size = len(next(iter(columns.values())))
+        records = [{name: column[index] for name, column in columns.items()} for index in range(size)]
+        expected = [strategy.execute(record) for record in records]
+        for backend in strategy.backends:
+            batch = backend.convert(columns)
+            if not backend.accepts(batch):
+                mismatches.append(f"trial {trial}: {backend.name} rejects its own batch type")
+                continue
+            got = backend.to_list(backend.execute(batch))
+            if got != expected:
+                index = next(
+                    (index for index, (left, right) in enumerate(zip(got, expected)) if left != right),
+                    min(len(got), len(expected)),
+                )
+                mismatches.append(f"trial {trial}: {backend.name} differs at {index} of {size}")
+        if strategy.execute_batch(records) != expected:
+            mismatches.append(f"trial {trial}: execute_batch differs")
+    return mismatches
+
+
+def benchmark(sizes: typing.Sequence[int] = (100, 10_000, 1_000_000), seed: int = 1) -> typing.List[dict]:
+    """
+    seconds per batch for every backend, and per record calls.
+    """
+    rnd = random.Random(seed)
+    strategy = CommissionStrategy()
+    results = []
+    for size in sizes:
+        columns = random_commission_columns(rnd, size)
+        row: typing.Dict[str, float] = {"size": size}
+        records = [{"amount": amount, "rate_bp": rate} for amount, rate in zip(*columns.values())]
+        started_at = time.perf_counter()
+        for record in records:
+            strategy.execute(record)
+        row["per_record_seconds"] = time.perf_counter() - started_at
+        for backend in strategy.backends:
+            batch = backend.convert(columns)
+            started_at = time.perf_counter()
+            backend.execute(batch)
+            row[f"{backend.name}_seconds"] = time.perf_counter() - started_at
+        results.append(row)
+    return results
+
+
+class TestBackendStrategy(unittest.TestCase):
+    """
+    test multi-backend strategies.
+    """
+    def test_selection_by_type(self) -> None:
+        """
+        records and list columns go to Python, arrays to NumPy.
+        """
+        strategy = CommissionStrategy(minimum=100)
+        self.assertEqual(strategy.backend_for({"amount": 1, "rate_bp": 1}).name, "python")
+        self.assertEqual(strategy.backend_for({"amount": [1], "rate_bp": [1]}).name, "python")
+        self.assertEqual(strategy.execute({"amount": 1_000_000, "rate_bp": 150}), 15_000)
+        self.assertEqual(strategy.execute({"amount": [1_000_000, 10], "rate_bp": [150, 150]}), [15_000, 100])
+        with self.assertRaises(TypeError):
+            strategy.execute([1, 2])
+
+    @unittest.skipUnless(numpy is not None, "numpy is not installed")
+    def test_numpy_selection(self) -> None:
+        """
+        int64 columns run vectorized.
+        """
+        strategy = CommissionStrategy()
+        columns = {"amount": numpy.array([1_000_000]), "rate_bp": numpy.array([150])}
+        self.assertEqual(strategy.backend_for(columns).name, "numpy")
+        self.assertEqual(strategy.execute(columns).tolist(), [15_000])
+
+    def test_parity(self) -> None:
+        """
+        every available backend agrees on randomized input.
+        """
+        strategy = CommissionStrategy()
+        self.assertEqual(check_parity(strategy, random_commission_columns, trials=30), [])
+        if len(strategy.backends) < 2:
+            self.skipTest("only the python backend is available, no backends were compared")
+
+    @unittest.skipUnless(numpy is not None, "numpy is not installed")
+    def test_numpy_does_not_overflow(self) -> None:
+        """
+        products beyond int64 are computed exactly, not wrapped.
+        """
+        backend = NumpyCommission(100)
+        for amounts in ([2 ** 62, 1], [2 ** 64, 1]):
+            batch = backend.convert({"amount": amounts, "rate_bp": [10_000, 150]})
+            self.assertEqual(backend.to_list(backend.execute(batch)), [amounts[0], 100])
+
+    @unittest.skipUnless(numpy is not None, "numpy is not installed")
+    def test_numpy_column_dtypes(self) -> None:
+        """
+        narrow and unsigned integer columns do not wrap; float columns go to the Python backend.
+        """
+        strategy = CommissionStrategy()
+        for dtype in (numpy.int32, numpy.uint32, numpy.uint64):
+            columns = {
+                "amount": numpy.array([2_000_000_000, 1_000], dtype=dtype),
+                "rate_bp": numpy.array([10_000, 150], dtype=dtype),
+            }
+            self.assertEqual(strategy.backend_for(columns).name, "numpy")
+            self.assertEqual(strategy.execute(columns).tolist(), [2_000_000_000, 100])
+        floats = {"amount": numpy.array([1_000.0, 3_333.0]), "rate_bp": numpy.array([150.0, 10_000.0])}
+        self.assertEqual(strategy.backend_for(floats).name, "python")
+        self.assertEqual(strategy.execute(floats), PythonCommission(100).execute(floats))
+        mixed = {"amount": numpy.array([2 ** 64], dtype=object), "rate_bp": numpy.array([1])}
+        self.assertEqual(strategy.backend_for(mixed).name, "numpy")
+        self.assertEqual(strategy.execute(mixed).tolist(), [2 ** 64 // 10_000])
+
+    def test_parity_catches_a_broken_backend(self) -> None:
+        """
+        the harness reports a backend that rounds differently.
+        """
+        class RoundingCommission(PythonCommission):
+            """
+            rounds half up instead of down.
+            """
+            def execute(self, data):
+                return [
+                    max((amount * rate + 5_000) // 10_000, self.minimum)
+                    for amount, rate in zip(data["amount"], data["rate_bp"])
+                ]
+
+        class Broken(CommissionStrategy):
+            """
+            commission with the broken backend registered first.
+            """
+            def __init__(self) -> None:
+                super().__init__()
+                self.backends = [RoundingCommission(100), PythonCommission(100)]
+
+            def execute(self, data):
+                return PythonCommission(100).execute(data)
+
+        self.assertTrue(check_parity(Broken(), random_commission_columns, trials=5))
+
+    def test_execute_many(self) -> None:
+        """
+        streamed chunks go through the columnar path.
+        """
+        records = ({"amount": index * 1_000, "rate_bp": 150} for index in range(2_000))
+        results = list(Context(CommissionStrategy()).execute_many(records, chunk_size=300))
+        self.assertEqual(results, [max(index * 1_000 * 150 // 10_000, 100) for index in range(2_000)])
+
+    def test_benchmark(self) -> None:
+        """
+        every columnar backend beats per record calls on a large batch.
+        """
+        rows = benchmark(sizes=(100, 100_000))
+        for row in rows:
+            print(row)
+        for backend in CommissionStrategy().backends:
+            self.assertLess(rows[-1][f"{backend.name}_seconds"], rows[-1]["per_record_seconds"])
+
+
+if __name__ == "__main__":
+    unittest.main()
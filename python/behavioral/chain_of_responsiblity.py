@@ -36,73 +36,313 @@ example:
                     the concept of using the Chain of Responsibility pattern to get cash from an ATM.
 """
 import abc
+import math
+import typing
+import unittest
+from io import StringIO
+from unittest.mock import patch
+
+
+class DispenseResult:
+    """
+    the outcome of a withdrawal.
+    """
+    def __init__(self, amount: int, bills: typing.Dict[int, int]) -> None:
+        self.amount = amount
+        self.bills = bills
+
+    @property
+    def success(self) -> bool:
+        """
+        true when the whole amount has been dispensed.
+        """
+        return sum(denomination * count for denomination, count in self.bills.items()) == self.amount
+
+    @property
+    def bill_count(self) -> int:
+        """
+        number of bills handed out.
+        """
+        return sum(self.bills.values())
+
+    def __repr__(self) -> str:
+        return f"DispenseResult(amount={self.amount}, bills={self.bills})"
+
+
+class DispensingEngine:
+    """
+    the ATM dispensing engine over per-denomination cassettes.
+
+    inventory maps a denomination to the number of bills in its cassette,
+    None stands for an unlimited cassette. The engine makes one greedy pass
+    over the cassettes, which is already minimal for the usual 100/50/20/10
+    cassettes, and falls back to a bounded knapsack when the greedy pass
+    gets stuck on limited stock, e.g. 60 out of {50: 1, 20: 3}.
+    """
+    def __init__(self, inventory: typing.Dict[int, typing.Optional[int]]) -> None:
+        self.inventory = dict(sorted(inventory.items(), reverse=True))
+
+    def _available(self, denomination: int, amount: int) -> int:
+        count = self.inventory[denomination]
+        return amount // denomination if count is None else min(count, amount // denomination)
+
+    def greedy(self, amount: int) -> typing.Optional[typing.Dict[int, int]]:
+        """
+        single pass from the largest bill, None when it leaves a remainder.
+        """
+        bills = {}
+        remainder = amount
+        for denomination in self.inventory:
+            num_bills = self._available(denomination, remainder)
+            if num_bills > 0:
+                bills[denomination] = num_bills
+                remainder -= num_bills * denomination
+        return bills if remainder == 0 else None
+
+    def optimal(self, amount: int) -> typing.Optional[typing.Dict[int, int]]:
+        """
+        exact combination with the fewest bills under the cassette limits.
+        """
+        if not self.inventory:
+            return {} if amount == 0 else None
+        unit = math.gcd(*self.inventory)
+        if amount % unit:
+            return None
+        target = amount // unit
+
+        # split every cassette into 1, 2, 4, ... bundles: a 0/1 knapsack
+        # over the bundles covers every count up to the cassette size.
+        bundles = []
+        for denomination in self.inventory:
+            remaining = self._available(denomination, amount)
+            size = 1
+            while remaining > 0:
+                take = min(size, remaining)
+                bundles.append((denomination, take))
+                remaining -= take
+                size *= 2
+
+        infinity = target + 1
+        fewest = [0] + [infinity] * target
+        taken = []
+        for denomination, take in bundles:
+            value = denomination // unit * take
+            used = bytearray(target + 1)
+            for total in range(target, value - 1, -1):
+                candidate = fewest[total - value] + take
+                if candidate < fewest[total]:
+                    fewest[total] = candidate
+                    used[total] = 1
+            taken.append(used)
+
+        if fewest[target] >= infinity:
+            return None
+
+        bills: typing.Dict[int, int] = {}
+        total = target
+        for (denomination, take), used in zip(reversed(bundles), reversed(taken)):
+            if used[total]:
+                bills[denomination] = bills.get(denomination, 0) + take
+                total -= denomination // unit * take
+        return dict(sorted(bills.items(), reverse=True))
+
+    def plan(self, amount: int) -> DispenseResult:
+        """
+        the bills for the amount without touching the inventory.
+        """
+        bills = self.greedy(amount)
+        if bills is None:
+            bills = self.optimal(amount)
+        return DispenseResult(amount, bills or {})
+
+    def dispense(self, amount: int) -> DispenseResult:
+        """
+        plan the withdrawal and take the bills out of the cassettes.
+        """
+        result = self.plan(amount)
+        if result.success:
+            for denomination, count in result.bills.items():
+                if self.inventory[denomination] is not None:
+                    self.inventory[denomination] -= count
+        return result
 
 
 class CashDispenser(abc.ABC):
     """
     Handler interface
     """
-    def __init__(self):
+    denomination: int = 0
+
+    def __init__(self, count: typing.Optional[int] = None):
         self.next_handler = None  # Initialize next_handler to None
+        self.count = count  # bills in the cassette, None for unlimited
 
-    @abc.abstractmethod
-    def dispense(self, amount):
+    def chain(self) -> typing.List["CashDispenser"]:
+        """
+        this handler and every handler after it.
+        """
+        handlers = []
+        handler = self
+        while handler is not None:
+            handlers.append(handler)
+            handler = handler.next_handler
+        return handlers
+
+    def dispense(self, amount) -> DispenseResult:
         """
         disperses the given amount.
         """
+        handlers = self.chain()
+        engine = DispensingEngine({handler.denomination: handler.count for handler in handlers})
+        result = engine.dispense(amount)
+
+        for handler in handlers:
+            handler.count = engine.inventory[handler.denomination]
+            num_bills = result.bills.get(handler.denomination, 0)
+            if num_bills > 0:
+                print(f"Dispensing {num_bills} ${handler.denomination} bills")
+        if not result.success:
+            print(f"Cannot dispense ${amount}")
+        return result
 
 
 class HundredDollarDispenser(CashDispenser):
     """
     ConcreteHandler for $100 bills
     """
-    def dispense(self, amount):
-        num_bills = amount // 100
-        remainder = amount % 100
-        if num_bills > 0:
-            print(f"Dispensing {num_bills} $100 bills")
-        if remainder > 0 and self.next_handler:
-            self.next_handler.dispense(remainder)
+    denomination = 100
 
 
 class FiftyDollarDispenser(CashDispenser):
     """
     ConcreteHandler for $50 bills
     """
-    def dispense(self, amount):
-        num_bills = amount // 50
-        remainder = amount % 50
-        if num_bills > 0:
-            print(f"Dispensing {num_bills} $50 bills")
-        if remainder > 0 and self.next_handler:
-            self.next_handler.dispense(remainder)
+    denomination = 50
 
 
 class TwentyDollarDispenser(CashDispenser):
     """
     ConcreteHandler for $20 bills.
     """
-    def dispense(self, amount):
-        num_bills = amount // 20
-        remainder = amount % 20
-        if num_bills > 0:
-            print(f"Dispensing {num_bills} $20 bills")
-        if remainder > 0 and self.next_handler:
-            self.next_handler.dispense(remainder)
+    denomination = 20
 
 
 class TenDollarDispenser(CashDispenser):
     """
     ConcreteHandler for $10 bills
     """
-    def dispense(self, amount):
-        num_bills = amount // 10
-        remainder = amount % 10
+    denomination = 10
+
+
+def build_chain(counts: typing.Optional[typing.Dict[int, int]] = None) -> CashDispenser:
+    """
+    link the $100 -> $50 -> $20 -> $10 chain with optional cassette counts.
+    """
+    counts = counts or {}
+    handlers = [
+        dispenser_class(counts.get(dispenser_class.denomination))
+        for dispenser_class in (
+            HundredDollarDispenser, FiftyDollarDispenser, TwentyDollarDispenser, TenDollarDispenser
+        )
+    ]
+    for handler, next_handler in zip(handlers, handlers[1:]):
+        handler.next_handler = next_handler
+    return handlers[0]
+
+
+class TestDispensingEngine(unittest.TestCase):
+    """
+    test dispensing engine.
+    """
+    def test_greedy_with_unlimited_cassettes(self) -> None:
+        """
+        unlimited cassettes are served by the greedy pass.
+        """
+        engine = DispensingEngine({100: None, 50: None, 20: None, 10: None})
+        result = engine.dispense(230)
+        self.assertTrue(result.success)
+        self.assertEqual(result.bills, {100: 2, 20: 1, 10: 1})
+
+    def test_undispensable_amount(self) -> None:
+        """
+        235 cannot be dispensed and nothing leaves the cassettes.
+        """
+        engine = DispensingEngine({100: 5, 50: 5, 20: 5, 10: 5})
+        result = engine.dispense(235)
+        self.assertFalse(result.success)
+        self.assertEqual(result.bills, {})
+        self.assertEqual(engine.inventory, {100: 5, 50: 5, 20: 5, 10: 5})
+
+    def test_limited_stock_falls_back_to_optimal(self) -> None:
+        """
+        greedy gets stuck on 60 with one $50 and no $10 bills.
+        """
+        engine = DispensingEngine({100: 0, 50: 1, 20: 3, 10: 0})
+        self.assertIsNone(engine.greedy(60))
+        result = engine.dispense(60)
+        self.assertEqual(result.bills, {20: 3})
+        self.assertEqual(engine.inventory, {100: 0, 50: 1, 20: 0, 10: 0})
 
-        if num_bills > 0:
-            print(f"Dispensing {num_bills} $10 bills")
-        if remainder > 0 and self.next_handler:
-            self.next_handler.dispense(remainder)
+    def test_optimal_minimises_bill_count(self) -> None:
+        """
+        the knapsack picks the fewest bills among exact combinations.
+        """
+        engine = DispensingEngine({50: 3, 30: 5, 20: 10})
+        self.assertEqual(engine.optimal(120), {50: 2, 20: 1})
+        self.assertEqual(engine.optimal(90), {30: 3})
+
+    def test_optimal_matches_brute_force(self) -> None:
+        """
+        the knapsack agrees with an exhaustive search on small cassettes.
+        """
+        inventory = {100: 2, 50: 1, 20: 4, 10: 1}
+        engine = DispensingEngine(inventory)
+        for amount in range(0, 500, 10):
+            best = None
+            for a in range(3):
+                for b in range(2):
+                    for c in range(5):
+                        for d in range(2):
+                            if 100 * a + 50 * b + 20 * c + 10 * d == amount:
+                                best = min(best or 99, a + b + c + d)
+            result = engine.plan(amount)
+            self.assertEqual(result.bill_count if result.success else None, best)
+
+
+class TestCashDispenserChain(unittest.TestCase):
+    """
+    test chain facade over the engine.
+    """
+    def test_chain_output(self) -> None:
+        """
+        the chain prints the same lines as before.
+        """
+        with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            result = build_chain().dispense(230)
+        self.assertTrue(result.success)
+        self.assertEqual(
+            mock_stdout.getvalue().splitlines(),
+            ["Dispensing 2 $100 bills", "Dispensing 1 $20 bills", "Dispensing 1 $10 bills"],
+        )
+
+    def test_chain_reports_failure(self) -> None:
+        """
+        the chain no longer drops the $5 of a $235 withdrawal silently.
+        """
+        with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            result = build_chain().dispense(235)
+        self.assertFalse(result.success)
+        self.assertEqual(mock_stdout.getvalue().strip(), "Cannot dispense $235")
+
+    def test_chain_updates_cassettes(self) -> None:
+        """
+        handlers keep the remaining bills of their cassette.
+        """
+        head = build_chain({100: 1, 50: 0, 20: 5, 10: 0})
+        with patch("sys.stdout", new_callable=StringIO):
+            result = head.dispense(160)
+        self.assertEqual(result.bills, {100: 1, 20: 3})
+        self.assertEqual([handler.count for handler in head.chain()], [0, 0, 2, 0])
 
 
 # Client code to set up the chain
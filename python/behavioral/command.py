@@ -41,12 +41,32 @@ use cases:
         undo and redo functionality in applications.
 """
 import abc
+import collections
+import typing
+import unittest
+from io import StringIO
+from unittest.mock import patch
 
 
 class Command(abc.ABC):
     """
     Command interface.
     """
+    # executing the command twice in a row has the effect of executing it once
+    idempotent = False
+
+    def coalesce_key(self) -> typing.Optional[tuple]:
+        """
+        (receiver, attribute) that execute and undo both overwrite, or None.
+        """
+        return None
+
+    def lane_key(self) -> typing.Any:
+        """
+        object whose commands must run one at a time and in order, or None.
+        """
+        return None
+
     @abc.abstractmethod
     def execute(self) -> None:
         """
@@ -64,26 +84,48 @@ class Light:
     """
     Light receiver.
     """
+    def __init__(self):
+        self.is_on = False
+
     def turn_on(self):
         """
         Turn on command.
         """
+        self.is_on = True
         print("Light is on")
 
     def turn_off(self):
         """
         Turn off command.
         """
+        self.is_on = False
         print("Light is off")
 
+    def snapshot(self) -> dict:
+        """
+        capture the receiver state.
+        """
+        return {"is_on": self.is_on}
+
+    def restore(self, state: dict) -> None:
+        """
+        bring the receiver back to a captured state.
+        """
+        self.is_on = state["is_on"]
+
 
 class LightOnCommand(Command):
     """
     Concrete command to turn on the light.
     """
+    idempotent = True
+
     def __init__(self, light: Light) -> None:
         self.light: Light = light
 
+    def coalesce_key(self) -> tuple:
+        return (self.light, "is_on")
+
     def execute(self) -> None:
         self.light.turn_on()
 
@@ -91,14 +133,99 @@ class LightOnCommand(Command):
         self.light.turn_off()
 
 
+class LightOffCommand(Command):
+    """
+    Concrete command to turn off the light.
+    """
+    idempotent = True
+
+    def __init__(self, light: Light) -> None:
+        self.light: Light = light
+
+    def coalesce_key(self) -> tuple:
+        return (self.light, "is_on")
+
+    def execute(self) -> None:
+        self.light.turn_off()
+
+    def undo(self) -> None:
+        self.light.turn_on()
+
+
+class RingBuffer:
+    """
+    Fixed-capacity stack: pushing onto a full buffer evicts the oldest item.
+    """
+    def __init__(self, capacity: int) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._items: typing.List[typing.Any] = [None] * capacity
+        self._start = 0
+        self._size = 0
+
+    def append(self, item) -> typing.Any:
+        """
+        Push the item and return the evicted oldest item, or None.
+        """
+        evicted = None
+        if self._size == self.capacity:
+            evicted = self._items[self._start]
+            self._items[self._start] = item
+            self._start = (self._start + 1) % self.capacity
+        else:
+            self._items[(self._start + self._size) % self.capacity] = item
+            self._size += 1
+        return evicted
+
+    def pop(self) -> typing.Any:
+        """
+        Pop the newest item.
+        """
+        if not self._size:
+            raise IndexError("pop from an empty ring buffer")
+        self._size -= 1
+        index = (self._start + self._size) % self.capacity
+        item, self._items[index] = self._items[index], None
+        return item
+
+    def clear(self) -> None:
+        """
+        Drop every item; O(1) when empty, otherwise proportional to the
+        items dropped, so it is amortized O(1) per append.
+        """
+        for offset in range(self._size):
+            self._items[(self._start + offset) % self.capacity] = None
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> typing.Iterator[typing.Any]:
+        for offset in range(self._size):
+            yield self._items[(self._start + offset) % self.capacity]
+
+
 class RemoteControl:
     """
     The invoker class with undo/redo functionality.
+
+    The history keeps at most `capacity` commands. Every `snapshot_every`
+    commands the state of the receivers is captured; commands that fall
+    off the history are folded into the newest snapshot taken before them,
+    so restore_snapshot() can still rewind past the undo depth while memory
+    stays flat.
     """
-    def __init__(self):
+    def __init__(self, capacity: int = 1000, snapshot_every: int = 100, receivers=()):
         self.command = None
-        self.command_history = []
-        self.redo_stack = []
+        self.command_history = RingBuffer(capacity)
+        self.redo_stack = RingBuffer(capacity)
+        self.snapshot_every = snapshot_every
+        self.receivers = list(receivers)
+        self.position = 0  # commands applied since the start of the session
+        self.snapshots: typing.Deque[typing.Tuple[int, list]] = collections.deque()
+        self._take_snapshot()
 
     def set_command(self, command):
         """
@@ -106,13 +233,37 @@ class RemoteControl:
         """
         self.command = command
 
+    def _take_snapshot(self) -> None:
+        while self.snapshots and self.snapshots[-1][0] >= self.position:
+            self.snapshots.pop()
+        self.snapshots.append(
+            (self.position, [receiver.snapshot() for receiver in self.receivers])
+        )
+
+    def _prepare_history(self) -> None:
+        # the snapshot must be taken before the command changes the receivers
+        if self.position % self.snapshot_every == 0 and self.snapshots[-1][0] != self.position:
+            self._take_snapshot()
+
+    def _push_history(self, command) -> None:
+        self.position += 1
+        if self.command_history.append(command) is not None:
+            oldest = self.position - len(self.command_history)
+            # fold: keep only the newest snapshot at or before the oldest command
+            while len(self.snapshots) > 1 and self.snapshots[1][0] <= oldest:
+                self.snapshots.popleft()
+
     def press_button(self):
         """
         Execute the command and add it to the history.
         """
         if self.command:
+            # snapshots past this point belong to the undone branch
+            while len(self.snapshots) > 1 and self.snapshots[-1][0] > self.position:
+                self.snapshots.pop()
+            self._prepare_history()
             self.command.execute()
-            self.command_history.append(self.command)
+            self._push_history(self.command)
             self.redo_stack.clear()
 
     def press_undo(self):
@@ -121,6 +272,7 @@ class RemoteControl:
         """
         if self.command_history:
             command = self.command_history.pop()
+            self.position -= 1
             command.undo()
             self.redo_stack.append(command)
 
@@ -130,8 +282,147 @@ class RemoteControl:
         """
         if self.redo_stack:
             command = self.redo_stack.pop()
+            self._prepare_history()
             command.execute()
-            self.command_history.append(command)
+            self._push_history(command)
+
+    def restore_snapshot(self):
+        """
+        Rewind the receivers to the oldest snapshot and drop the history.
+        """
+        position, states = self.snapshots[0]
+        for receiver, state in zip(self.receivers, states):
+            receiver.restore(state)
+        self.position = position
+        self.snapshots.clear()
+        self.snapshots.append((position, states))
+        self.command_history.clear()
+        self.redo_stack.clear()
+
+
+class TestRingBuffer(unittest.TestCase):
+    """
+    test ring buffer.
+    """
+    def test_eviction_order(self) -> None:
+        """
+        a full buffer evicts the oldest item and pops the newest.
+        """
+        ring = RingBuffer(3)
+        self.assertEqual([ring.append(item) for item in range(5)], [None, None, None, 0, 1])
+        self.assertEqual(list(ring), [2, 3, 4])
+        self.assertEqual(ring.pop(), 4)
+        ring.append(5)
+        self.assertEqual(list(ring), [2, 3, 5])
+        with self.assertRaises(IndexError):
+            RingBuffer(1).pop()
+
+    def test_clear(self) -> None:
+        """
+        clear drops only the occupied slots and the buffer stays usable.
+        """
+        ring = RingBuffer(3)
+        ring.clear()
+        for item in range(4):
+            ring.append(item)
+        ring.clear()
+        self.assertEqual(len(ring), 0)
+        self.assertEqual(ring._items, [None] * 3)
+        ring.append(7)
+        self.assertEqual(list(ring), [7])
+
+
+class TestRemoteControl(unittest.TestCase):
+    """
+    test remote control history.
+    """
+    def setUp(self) -> None:
+        self.light = Light()
+        self.remote = RemoteControl(capacity=4, snapshot_every=2, receivers=[self.light])
+        self.on = LightOnCommand(self.light)
+        self.off = LightOffCommand(self.light)
+        self.stdout = patch("sys.stdout", new_callable=StringIO)
+        self.stdout.start()
+
+    def tearDown(self) -> None:
+        self.stdout.stop()
+
+    def press(self, *commands) -> None:
+        """
+        press the button once per command.
+        """
+        for command in commands:
+            self.remote.set_command(command)
+            self.remote.press_button()
+
+    def test_undo_redo(self) -> None:
+        """
+        undo and redo keep working on the bounded history.
+        """
+        self.press(self.on)
+        self.remote.press_undo()
+        self.assertFalse(self.light.is_on)
+        self.remote.press_redo()
+        self.assertTrue(self.light.is_on)
+
+    def test_failed_command_is_not_recorded(self) -> None:
+        """
+        a command that raises stays out of the history and keeps the redo stack.
+        """
+        class Failing(LightOnCommand):
+            """
+            command that fails before touching the light.
+            """
+            def execute(self):
+                raise RuntimeError("bulb is missing")
+
+        self.press(self.on)
+        self.remote.press_undo()
+        with self.assertRaises(RuntimeError):
+            self.press(Failing(self.light))
+        self.assertEqual(self.remote.position, 0)
+        self.assertEqual(len(self.remote.command_history), 0)
+        self.assertEqual(len(self.remote.redo_stack), 1)
+
+    def test_undo_depth_is_bounded(self) -> None:
+        """
+        only the last `capacity` commands can be undone.
+        """
+        self.press(*[self.on, self.off] * 50)
+        self.assertEqual(len(self.remote.command_history), 4)
+        for _ in range(10):
+            self.remote.press_undo()
+        self.assertEqual(len(self.remote.command_history), 0)
+        self.assertEqual(len(self.remote.redo_stack), 4)
+
+    def test_snapshots_stay_flat(self) -> None:
+        """
+        evicted commands are folded so the snapshot count stays bounded.
+        """
+        self.press(*[self.on, self.off] * 500)
+        self.assertLessEqual(len(self.remote.snapshots), 4 // 2 + 1)
+        self.assertLessEqual(self.remote.snapshots[0][0], self.remote.position - 4)
+
+    def test_new_branch_drops_snapshots(self) -> None:
+        """
+        snapshots of undone commands are dropped by a new command.
+        """
+        self.press(self.on, self.off, self.on, self.off)
+        for _ in range(3):
+            self.remote.press_undo()
+        self.press(self.off)
+        self.assertTrue(all(position <= 1 for position, _ in self.remote.snapshots))
+
+    def test_restore_snapshot(self) -> None:
+        """
+        the snapshot rewinds the receiver past the undo depth.
+        """
+        self.press(self.on, self.off, self.on, self.on, self.off, self.on, self.off, self.on)
+        position, states = self.remote.snapshots[0]
+        self.remote.restore_snapshot()
+        self.assertEqual(self.remote.position, position)
+        self.assertEqual(self.light.snapshot(), states[0])
+        self.assertEqual(len(self.remote.command_history), 0)
 
 
 # Client code
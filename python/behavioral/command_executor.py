@@ -0,0 +1,442 @@
+"""
+The command executor turns the command pattern into a job queue. Instead
+of running every command on the invoker thread like RemoteControl does,
+commands are submitted into a bounded priority queue and a pool of worker
+threads runs them.
+
+    priority:     lower numbers run first, like queue.PriorityQueue.
+    ordering:     commands for the same receiver form one lane that runs
+                  strictly in submission order and never on two workers at
+                  once, so an undo always runs after the execute it undoes.
+                  Priority picks between lanes.
+    backpressure: submit blocks while the queue is full and raises
+                  queue.Full when its timeout runs out.
+
+Submitters get a concurrent.futures.Future; asyncio code can await it with
+asyncio.wrap_future.
+
+usage:
+    with CommandExecutor(workers=4, maxsize=1000) as executor:
+        future = executor.submit(LightOnCommand(light), priority=0)
+        future.result()
+"""
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import queue
+import threading
+import time
+import typing
+import unittest
+
+from .command import Command
+
+
+class Job:
+    """
+    one queued command.
+    """
+    __slots__ = ("command", "undo", "priority", "future", "enqueued_at")
+
+    def __init__(self, command: Command, undo: bool, priority: int) -> None:
+        self.command = command
+        self.undo = undo
+        self.priority = priority
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class CommandExecutor:
+    """
+    bounded priority executor for commands.
+    """
+    def __init__(self, workers: int = 4, maxsize: int = 1000) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._lanes: typing.Dict[typing.Any, typing.Deque[Job]] = {}
+        self._ready: typing.List[typing.Tuple[int, int, typing.Any]] = []
+        self._running: typing.Set[typing.Any] = set()
+        self._sequence = itertools.count()
+        self._size = 0
+        self._shutdown = False
+        self._stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "max_depth": 0,
+            "wait_total": 0.0, "wait_max": 0.0, "run_total": 0.0, "run_max": 0.0,
+        }
+        self._workers = [
+            threading.Thread(target=self._work, name=f"command-worker-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @staticmethod
+    def _receiver_of(command: Command) -> typing.Any:
+        lane = command.lane_key()
+        if lane is not None:
+            return lane
+        key = command.coalesce_key()
+        return key[0] if key is not None else None
+
+    def submit(
+        self,
+        command: Command,
+        priority: int = 0,
+        undo: bool = False,
+        receiver: typing.Any = None,
+        timeout: typing.Optional[float] = None,
+    ) -> concurrent.futures.Future:
+        """
+        queue the command (or its undo); blocks while the queue is full.
+
+        receiver selects the lane; by default it is the command's lane_key,
+        else the receiver of its coalesce_key, and commands with neither
+        share a lane with every other job of the same command object, so
+        its undo still waits for its execute.
+        """
+        job = Job(command, undo, priority)
+        lane_key = receiver if receiver is not None else self._receiver_of(command)
+        if lane_key is None:
+            lane_key = command
+        lane_key = id(lane_key)
+
+        with self._not_full:
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+            if not self._not_full.wait_for(lambda: self._shutdown or self._size < self.maxsize, timeout):
+                raise queue.Full("command queue is full")
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+
+            lane = self._lanes.setdefault(lane_key, collections.deque())
+            lane.append(job)
+            if len(lane) == 1 and lane_key not in self._running:
+                heapq.heappush(self._ready, (priority, next(self._sequence), lane_key))
+                self._not_empty.notify()
+            self._size += 1
+            self._stats["submitted"] += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], self._size)
+        return job.future
+
+    def _work(self) -> None:
+        while True:
+            with self._not_empty:
+                self._not_empty.wait_for(lambda: self._ready or self._shutdown)
+                if not self._ready:
+                    return
+                _, _, lane_key = heapq.heappop(self._ready)
+                job = self._lanes[lane_key].popleft()
+                self._running.add(lane_key)
+                self._size -= 1
+                self._not_full.notify()
+
+            started_at = time.perf_counter()
+            failed = True
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        result = job.command.undo() if job.undo else job.command.execute()
+                    except Exception as exc:  # pylint: disable=W0718
+                        job.future.set_exception(exc)
+                    except BaseException as exc:
+                        job.future.set_exception(exc)
+                        raise
+                    else:
+                        job.future.set_result(result)
+                        failed = False
+                else:
+                    failed = False
+            finally:
+                # a BaseException must not leave the lane blocked forever
+                with self._lock:
+                    self._running.discard(lane_key)
+                    lane = self._lanes[lane_key]
+                    if lane:
+                        heapq.heappush(self._ready, (lane[0].priority, next(self._sequence), lane_key))
+                        self._not_empty.notify()
+                    else:
+                        del self._lanes[lane_key]
+            finished_at = time.perf_counter()
+
+            with self._lock:
+                wait = started_at - job.enqueued_at
+                run = finished_at - started_at
+                stats = self._stats
+                stats["failed" if failed else "completed"] += 1
+                stats["wait_total"] += wait
+                stats["wait_max"] = max(stats["wait_max"], wait)
+                stats["run_total"] += run
+                stats["run_max"] = max(stats["run_max"], run)
+
+    def metrics(self) -> typing.Dict[str, float]:
+        """
+        queue depth, wait time and run time.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            done = stats["completed"] + stats["failed"]
+            stats["depth"] = self._size
+            stats["wait_avg"] = stats.pop("wait_total") / done if done else 0.0
+            stats["run_avg"] = stats.pop("run_total") / done if done else 0.0
+        return stats
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        stop accepting commands; workers drain the queue and exit.
+        """
+        with self._lock:
+            self._shutdown = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def __enter__(self) -> "CommandExecutor":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.shutdown()
+
+
+class Account:
+    """
+    receiver that records the order of operations.
+    """
+    def __init__(self) -> None:
+        self.log: typing.List[str] = []
+        self.balance = 0
+
+
+class DepositCommand(Command):
+    """
+    deposit money into the account.
+    """
+    def __init__(self, account: Account, amount: int, delay: float = 0.0) -> None:
+        self.account = account
+        self.amount = amount
+        self.delay = delay
+
+    def lane_key(self) -> Account:
+        return self.account
+
+    def execute(self) -> int:
+        time.sleep(self.delay)
+        self.account.balance += self.amount
+        self.account.log.append(f"+{self.amount}")
+        return self.account.balance
+
+    def undo(self) -> int:
+        time.sleep(self.delay)
+        self.account.balance -= self.amount
+        self.account.log.append(f"-{self.amount}")
+        return self.account.balance
+
+
+class FailingCommand(Command):
+    """
+    command that always raises.
+    """
+    def execute(self) -> None:
+        raise ValueError("boom")
+
+    def undo(self) -> None:
+        raise ValueError("boom")
+
+
+class TestCommandExecutor(unittest.TestCase):
+    """
+    test command executor.
+    """
+    def test_future_result(self) -> None:
+        """
+        the submitter gets the command's return value.
+        """
+        account = Account()
+        with CommandExecutor(workers=2) as executor:
+            self.assertEqual(executor.submit(DepositCommand(account, 5), receiver=account).result(), 5)
+
+    def test_per_receiver_order(self) -> None:
+        """
+        an undo never overtakes the execute of the same receiver.
+        """
+        accounts = [Account() for _ in range(4)]
+        with CommandExecutor(workers=8) as executor:
+            for account in accounts:
+                for amount in range(1, 20):
+                    command = DepositCommand(account, amount, delay=0.0005)
+                    executor.submit(command, priority=20 - amount, receiver=account)
+                    executor.submit(command, priority=0, undo=True, receiver=account)
+        for account in accounts:
+            self.assertEqual(account.balance, 0)
+            self.assertEqual(account.log[:4], ["+1", "-1", "+2", "-2"])
+
+    def test_command_lane_without_receiver(self) -> None:
+        """
+        without a lane key the undo still waits for its own execute.
+        """
+        class Anonymous(DepositCommand):
+            """
+            deposit that declares no lane.
+            """
+            def lane_key(self) -> None:
+                return None
+
+        for _ in range(20):
+            account = Account()
+            with CommandExecutor(workers=2) as executor:
+                command = Anonymous(account, 1, delay=0.002)
+                executor.submit(command)
+                executor.submit(command, undo=True)
+            self.assertEqual(account.log, ["+1", "-1"])
+
+    def test_lane_key_groups_commands(self) -> None:
+        """
+        different commands on the same account share its lane.
+        """
+        account = Account()
+        with CommandExecutor(workers=4) as executor:
+            for amount in range(1, 30):
+                executor.submit(DepositCommand(account, amount, delay=0.0005))
+        self.assertEqual(account.log, [f"+{amount}" for amount in range(1, 30)])
+
+    def test_base_exception_releases_the_lane(self) -> None:
+        """
+        a command that kills its worker does not block the rest of its lane.
+        """
+        account = Account()
+
+        class Exit(DepositCommand):
+            """
+            raise SystemExit on the worker.
+            """
+            def execute(self) -> int:
+                raise SystemExit()
+
+        with CommandExecutor(workers=2) as executor:
+            failed = executor.submit(Exit(account, 1))
+            done = executor.submit(DepositCommand(account, 2))
+            self.assertEqual(done.result(timeout=5), 2)
+            with self.assertRaises(SystemExit):
+                failed.result(timeout=5)
+
+    def test_shutdown_wakes_blocked_submitters(self) -> None:
+        """
+        a submitter waiting on a full queue fails instead of enqueuing late.
+        """
+        gate = threading.Event()
+        errors = []
+
+        class Wait(Command):
+            """
+            block the worker.
+            """
+            def execute(self) -> None:
+                gate.wait()
+
+            def undo(self) -> None:
+                """
+                nothing to undo.
+                """
+
+        executor = CommandExecutor(workers=1, maxsize=1)
+        executor.submit(Wait())
+        time.sleep(0.05)
+        executor.submit(Wait())
+
+        def submit() -> None:
+            try:
+                executor.submit(Wait())
+            except RuntimeError as exc:
+                errors.append(exc)
+
+        submitter = threading.Thread(target=submit)
+        submitter.start()
+        time.sleep(0.05)
+        executor.shutdown(wait=False)
+        submitter.join(timeout=5)
+        gate.set()
+        executor.shutdown()
+        self.assertFalse(submitter.is_alive())
+        self.assertEqual(len(errors), 1)
+
+    def test_priority_between_lanes(self) -> None:
+        """
+        the most urgent lane runs first.
+        """
+        order = []
+        blocker = threading.Event()
+
+        class Record(Command):
+            """
+            record the run order.
+            """
+            def __init__(self, name: str) -> None:
+                self.name = name
+
+            def execute(self) -> None:
+                blocker.wait()
+                order.append(self.name)
+
+            def undo(self) -> None:
+                """
+                nothing to undo.
+                """
+
+        with CommandExecutor(workers=1) as executor:
+            executor.submit(Record("first"))
+            time.sleep(0.05)
+            executor.submit(Record("low"), priority=9)
+            executor.submit(Record("high"), priority=1)
+            blocker.set()
+        self.assertEqual(order, ["first", "high", "low"])
+
+    def test_backpressure(self) -> None:
+        """
+        a full queue rejects submissions after the timeout.
+        """
+        gate = threading.Event()
+
+        class Wait(Command):
+            """
+            block the worker.
+            """
+            def execute(self) -> None:
+                gate.wait()
+
+            def undo(self) -> None:
+                """
+                nothing to undo.
+                """
+
+        executor = CommandExecutor(workers=1, maxsize=2)
+        executor.submit(Wait())
+        time.sleep(0.05)
+        executor.submit(Wait())
+        executor.submit(Wait())
+        with self.assertRaises(queue.Full):
+            executor.submit(Wait(), timeout=0.05)
+        self.assertEqual(executor.metrics()["depth"], 2)
+        gate.set()
+        executor.shutdown()
+
+    def test_metrics_and_failures(self) -> None:
+        """
+        failures reach the future and the metrics.
+        """
+        with CommandExecutor(workers=2) as executor:
+            future = executor.submit(FailingCommand())
+            with self.assertRaises(ValueError):
+                future.result()
+            account = Account()
+            executor.submit(DepositCommand(account, 1, delay=0.01), receiver=account).result()
+        metrics = executor.metrics()
+        self.assertEqual((metrics["completed"], metrics["failed"], metrics["depth"]), (1, 1, 0))
+        self.assertGreaterEqual(metrics["run_max"], 0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,442 @@
+"""
+The command journal makes the remote control's history survive a restart.
+Every press, undo and redo is appended to an on-disk journal as a fixed
+3-byte record:
+
+    op    uint8   1 = execute, 2 = undo, 3 = redo
+    code  uint16  the registered command
+
+behind an 8-byte file header. Fixed-size records keep the writer a plain
+append and let the reader decode a memory-mapped journal of millions of
+entries with struct.iter_unpack; a record torn by a crash is simply shorter
+than 3 bytes and is ignored, and recover() cuts it off before new records
+are appended.
+
+fsync policies:
+    always: fsync after every record, nothing is ever lost.
+    group:  records are batched and fsynced together once `group_size`
+        records are pending or `group_interval` seconds have passed,
+        a crash loses at most one group.
+    never:  leave flushing to the operating system.
+
+usage:
+    registry = CommandRegistry()
+    registry.register(1, LightOnCommand(light))
+    remote = JournaledRemoteControl("remote.journal", registry)
+    remote.recover()
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import typing
+import unittest
+
+from .command import Command, RemoteControl
+
+MAGIC = b"CMDJ\x00\x01\x00\x00"
+RECORD = struct.Struct("<BH")
+
+EXECUTE = 1
+UNDO = 2
+REDO = 3
+
+
+class CommandRegistry:
+    """
+    maps journal codes to command objects and back.
+    """
+    def __init__(self) -> None:
+        self.commands: typing.Dict[int, Command] = {}
+        self.codes: typing.Dict[Command, int] = {}
+
+    def register(self, code: int, command: Command) -> None:
+        """
+        register the command under the code.
+        """
+        if code in self.commands:
+            raise ValueError(f"code {code} is already registered")
+        self.commands[code] = command
+        self.codes[command] = code
+
+
+class JournalWriter:
+    """
+    append-only journal writer with group commit.
+    """
+    def __init__(
+        self,
+        path: str,
+        fsync: str = "group",
+        group_size: int = 512,
+        group_interval: float = 0.01,
+    ) -> None:
+        if fsync not in ("always", "group", "never"):
+            raise ValueError(f"unknown fsync policy: {fsync}")
+        self.fsync = fsync
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.syncs = 0
+        self._buffer = bytearray()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+        self._file = open(path, "ab")  # pylint: disable=R1732
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+            self._sync_locked()
+
+        self._flusher = None
+        if fsync == "group":
+            self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._flusher.start()
+
+    def append(self, op: int, code: int) -> None:
+        """
+        append one record.
+        """
+        with self._lock:
+            self._buffer += RECORD.pack(op, code)
+            self._pending += 1
+            if self.fsync == "always" or self._pending >= self.group_size:
+                self._sync_locked()
+
+    def _sync_locked(self) -> None:
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+        self._file.flush()
+        if self.fsync != "never":
+            os.fsync(self._file.fileno())
+            self.syncs += 1
+        self._pending = 0
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self.group_interval):
+            with self._lock:
+                if self._pending:
+                    self._sync_locked()
+
+    def sync(self) -> None:
+        """
+        make every appended record durable now.
+        """
+        with self._lock:
+            self._sync_locked()
+
+    def close(self) -> None:
+        """
+        sync and close the journal; closing twice is a no-op.
+        """
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            if self._file.closed:
+                return
+            self._sync_locked()
+            self._file.close()
+
+
+class JournalReader:
+    """
+    memory-mapped journal reader.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def records(self) -> typing.List[typing.Tuple[int, int]]:
+        """
+        every complete record of the journal.
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= len(MAGIC):
+            return []
+        with open(self.path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                if buffer[:len(MAGIC)] != MAGIC:
+                    raise ValueError(f"{self.path} is not a command journal")
+                end = len(MAGIC) + (len(buffer) - len(MAGIC)) // RECORD.size * RECORD.size
+                with memoryview(buffer)[len(MAGIC):end] as view:
+                    return list(RECORD.iter_unpack(view))
+
+
+class JournaledRemoteControl(RemoteControl):
+    """
+    remote control that journals every press, undo and redo.
+    """
+    def __init__(self, path: str, registry: CommandRegistry, fsync: str = "group", **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+        self.registry = registry
+        self.fsync = fsync
+        self.journal: typing.Optional[JournalWriter] = None
+
+    def recover(self) -> int:
+        """
+        replay the journal onto the receivers and start journaling.
+        """
+        records = JournalReader(self.path).records()
+        commands = self.registry.commands
+        for index, (op, code) in enumerate(records):
+            if op == EXECUTE:
+                if code not in commands:
+                    raise ValueError(f"record {index}: unknown command code {code}")
+                self.command = commands[code]
+                super().press_button()
+            elif op == UNDO:
+                super().press_undo()
+            elif op == REDO:
+                super().press_redo()
+            else:
+                raise ValueError(f"record {index}: unknown op code {op}")
+
+        # cut off a torn record, or the next append would be misaligned
+        if os.path.exists(self.path):
+            size = len(MAGIC) + len(records) * RECORD.size
+            if os.path.getsize(self.path) < len(MAGIC):
+                size = 0
+            if os.path.getsize(self.path) > size:
+                os.truncate(self.path, size)
+        self.journal = JournalWriter(self.path, self.fsync)
+        return len(records)
+
+    def _writer(self) -> JournalWriter:
+        if self.journal is None:
+            raise RuntimeError("call recover() before using a journaled remote control")
+        return self.journal
+
+    def press_button(self):
+        if self.command:
+            journal = self._writer()
+            code = self.registry.codes.get(self.command)
+            if code is None:
+                raise KeyError(f"{self.command!r} is not registered in the command registry")
+            super().press_button()
+            journal.append(EXECUTE, code)
+
+    def press_undo(self):
+        if self.command_history:
+            journal = self._writer()
+            super().press_undo()
+            journal.append(UNDO, 0)
+
+    def press_redo(self):
+        if self.redo_stack:
+            journal = self._writer()
+            super().press_redo()
+            journal.append(REDO, 0)
+
+    def close(self) -> None:
+        """
+        close the journal.
+        """
+        if self.journal is not None:
+            self.journal.close()
+
+
+class Counter:
+    """
+    quiet receiver for the benchmark.
+    """
+    def __init__(self) -> None:
+        self.value = 0
+
+
+class IncrementCommand(Command):
+    """
+    add one to the counter.
+    """
+    def __init__(self, counter: Counter) -> None:
+        self.counter = counter
+
+    def execute(self) -> None:
+        self.counter.value += 1
+
+    def undo(self) -> None:
+        self.counter.value -= 1
+
+
+def benchmark(records: int = 100_000, always_records: int = 2_000) -> typing.Dict[str, float]:
+    """
+    journal writes per second per fsync policy and replay records per second.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for policy, count in (("always", always_records), ("group", records), ("never", records)):
+            path = os.path.join(directory, f"{policy}.journal")
+            writer = JournalWriter(path, fsync=policy)
+            started_at = time.perf_counter()
+            for index in range(count):
+                writer.append(EXECUTE if index % 4 else UNDO, 1)
+            writer.close()
+            results[f"{policy}_writes_per_second"] = count / (time.perf_counter() - started_at)
+
+        counter = Counter()
+        registry = CommandRegistry()
+        registry.register(1, IncrementCommand(counter))
+        remote = JournaledRemoteControl(os.path.join(directory, "never.journal"), registry, fsync="never")
+        started_at = time.perf_counter()
+        replayed = remote.recover()
+        results["replay_records_per_second"] = replayed / (time.perf_counter() - started_at)
+        remote.close()
+    return results
+
+
+class TestCommandJournal(unittest.TestCase):
+    """
+    test command journal.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+        self.path = os.path.join(self.directory.name, "remote.journal")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def remote(self, fsync: str = "group") -> typing.Tuple[JournaledRemoteControl, Counter]:
+        """
+        a fresh remote over the journal.
+        """
+        counter = Counter()
+        registry = CommandRegistry()
+        registry.register(1, IncrementCommand(counter))
+        remote = JournaledRemoteControl(self.path, registry, fsync=fsync)
+        remote.recover()
+        remote.set_command(registry.commands[1])
+        return remote, counter
+
+    def test_restart_restores_history(self) -> None:
+        """
+        state, undo and redo survive a restart.
+        """
+        remote, _ = self.remote()
+        for _ in range(5):
+            remote.press_button()
+        remote.press_undo()
+        remote.press_undo()
+        remote.press_redo()
+        remote.close()
+
+        remote, counter = self.remote()
+        self.assertEqual(counter.value, 4)
+        self.assertEqual(len(remote.command_history), 4)
+        remote.press_redo()
+        self.assertEqual(counter.value, 5)
+        remote.close()
+
+    def test_torn_record_ignored(self) -> None:
+        """
+        a half-written last record is skipped on replay.
+        """
+        remote, _ = self.remote(fsync="always")
+        remote.press_button()
+        remote.press_button()
+        remote.close()
+        with open(self.path, "ab") as file:
+            file.write(b"\x01")
+        self.assertEqual(JournalReader(self.path).records(), [(EXECUTE, 1), (EXECUTE, 1)])
+
+    def test_torn_tail_then_more_writes(self) -> None:
+        """
+        recovery drops the torn record so later records stay aligned.
+        """
+        remote, _ = self.remote(fsync="always")
+        remote.press_button()
+        remote.press_button()
+        remote.close()
+        with open(self.path, "ab") as file:
+            file.write(b"\x01")
+
+        remote, counter = self.remote(fsync="always")
+        self.assertEqual(counter.value, 2)
+        remote.press_button()
+        remote.press_undo()
+        remote.close()
+        self.assertEqual(
+            JournalReader(self.path).records(), [(EXECUTE, 1), (EXECUTE, 1), (EXECUTE, 1), (UNDO, 0)]
+        )
+        remote, counter = self.remote()
+        self.assertEqual(counter.value, 2)
+        remote.close()
+
+    def test_unknown_op_rejected(self) -> None:
+        """
+        a record with an unknown op code stops the replay.
+        """
+        with open(self.path, "wb") as file:
+            file.write(MAGIC + RECORD.pack(EXECUTE, 1) + RECORD.pack(9, 0))
+        with self.assertRaises(ValueError):
+            self.remote()
+
+    def test_press_before_recover(self) -> None:
+        """
+        using the remote before recover() is a clear error.
+        """
+        registry = CommandRegistry()
+        registry.register(1, IncrementCommand(Counter()))
+        remote = JournaledRemoteControl(self.path, registry)
+        remote.set_command(registry.commands[1])
+        with self.assertRaises(RuntimeError):
+            remote.press_button()
+
+    def test_unregistered_command_has_no_effect(self) -> None:
+        """
+        an unregistered command is rejected before it runs or enters history.
+        """
+        counter = Counter()
+        registry = CommandRegistry()
+        registry.register(1, IncrementCommand(counter))
+        remote = JournaledRemoteControl(self.path, registry)
+        remote.recover()
+        remote.set_command(registry.commands[1])
+        remote.press_button()
+        remote.set_command(IncrementCommand(counter))
+        with self.assertRaises(KeyError):
+            remote.press_button()
+        self.assertEqual((counter.value, len(remote.command_history)), (1, 1))
+        remote.press_undo()
+        remote.close()
+        remote.close()
+
+        replayed = Counter()
+        registry = CommandRegistry()
+        registry.register(1, IncrementCommand(replayed))
+        restored = JournaledRemoteControl(self.path, registry)
+        restored.recover()
+        restored.close()
+        self.assertEqual(replayed.value, counter.value)
+
+    def test_group_commit_batches_fsyncs(self) -> None:
+        """
+        group commit needs far fewer fsyncs than records.
+        """
+        writer = JournalWriter(self.path, fsync="group", group_size=100, group_interval=60)
+        for _ in range(1_000):
+            writer.append(EXECUTE, 1)
+        writer.close()
+        self.assertLessEqual(writer.syncs, 12)
+        self.assertEqual(len(JournalReader(self.path).records()), 1_000)
+
+    def test_unknown_journal(self) -> None:
+        """
+        a file without the journal header is rejected.
+        """
+        with open(self.path, "wb") as file:
+            file.write(b"not a journal")
+        with self.assertRaises(ValueError):
+            JournalReader(self.path).records()
+
+    def test_benchmark(self) -> None:
+        """
+        group commit writes faster than fsync per record.
+        """
+        result = benchmark(records=20_000, always_records=200)
+        print(result)
+        self.assertGreater(result["group_writes_per_second"], result["always_writes_per_second"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,512 @@
+"""
+Concurrent observer dispatch: Subject.notify calls the observers one after
+another on the thread that assigned the state, so a single slow observer
+holds up the state change and every observer behind it.
+
+ConcurrentSubject gives every observer a mailbox, a bounded queue. A
+fixed pool of worker threads drains the mailboxes, however many observers
+there are; a mailbox with pending notifications is scheduled on the pool
+once and handled by one worker at a time, so every observer still sees
+its notifications in order. notify only puts the new state into the
+mailboxes and returns; observers run in parallel and a slow one only
+falls behind itself. What happens when a mailbox is full is chosen per
+observer:
+
+    DROP_OLDEST  discard the oldest pending state (the default).
+    BLOCK        make the notifying thread wait for room.
+    COALESCE     replace the newest pending state with the new one,
+                 extending its change list.
+
+Observers get a StateSnapshot instead of the subject, so subject.state is
+the state they were notified of, not whatever it is by the time they run.
+metrics() reports the lag from notify to update per observer and
+slow_observers() names the ones that cannot keep up.
+
+usage:
+    subject = ConcurrentSubject(capacity=100)
+    subject.attach(fast_observer)
+    subject.attach(slow_observer, policy=COALESCE)
+    subject.state = 3
+    subject.drain()
+"""
+import collections
+import queue
+import threading
+import time
+import typing
+import unittest
+import weakref
+
+from .observer import ChangeListObserver, CountingObserver, Observer, Range, Subject
+
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+COALESCE = "coalesce"
+
+
+class StateSnapshot:
+    """
+    the subject as seen at notify time.
+    """
+    __slots__ = ("subject", "state")
+
+    def __init__(self, subject: Subject, state: typing.Any) -> None:
+        self.subject = subject
+        self.state = state
+
+    def __getattr__(self, name: str) -> typing.Any:
+        return getattr(self.subject, name)
+
+
+class Dispatcher:
+    """
+    the worker pool draining the mailboxes of one subject.
+    """
+    def __init__(self, workers: int) -> None:
+        self.ready: "queue.SimpleQueue[typing.Optional[Mailbox]]" = queue.SimpleQueue()
+        self.threads = [
+            threading.Thread(target=self._run, name=f"observer-dispatch-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def schedule(self, mailbox: "Mailbox") -> None:
+        """
+        hand a mailbox with pending notifications to the pool.
+        """
+        self.ready.put(mailbox)
+
+    def _run(self) -> None:
+        while True:
+            mailbox = self.ready.get()
+            if mailbox is None:
+                return
+            mailbox.deliver_next()
+
+    def close(self) -> None:
+        """
+        stop the workers once the mailboxes scheduled so far are handled.
+        """
+        for _ in self.threads:
+            self.ready.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+class Mailbox:
+    """
+    bounded queue of one observer, drained by the dispatcher.
+
+    scheduled is set while the mailbox waits on the dispatcher or one of
+    its workers delivers from it, so no two workers deliver to the same
+    observer at once.
+    """
+    def __init__(
+        self, subject: Subject, observer: Observer, capacity: int, policy: str, dispatcher: Dispatcher
+    ) -> None:
+        if policy not in (DROP_OLDEST, BLOCK, COALESCE):
+            raise ValueError(f"unknown overflow policy {policy!r}")
+        self.subject = subject
+        self.observer = weakref.ref(observer)
+        self.name = f"{type(observer).__name__}@{id(observer):x}"
+        self.capacity = capacity
+        self.policy = policy
+        self.pending: typing.Deque[list] = collections.deque()
+        self.busy = False
+        self.closed = False
+        self.scheduled = False
+        self.dispatcher = dispatcher
+        self.condition = threading.Condition()
+        self.stats = {
+            "delivered": 0, "dropped": 0, "coalesced": 0, "errors": 0, "max_depth": 0,
+            "lag_total": 0.0, "lag_max": 0.0, "lag_last": 0.0, "blocked": 0.0,
+        }
+
+    def put(self, state: typing.Any, changes: typing.Optional[list]) -> None:
+        """
+        queue a notification, applying the overflow policy when full.
+        """
+        with self.condition:
+            if self.closed:
+                return
+            if len(self.pending) >= self.capacity:
+                if self.policy == COALESCE:
+                    newest = self.pending[-1]
+                    if changes is not None:
+                        newest[1] = (newest[1] if newest[1] is not None else [newest[0]]) + changes
+                    elif newest[1] is not None and newest[1][-1] != state:
+                        newest[1].append(state)
+                    newest[0] = state
+                    self.stats["coalesced"] += 1
+                    return
+                if self.policy == DROP_OLDEST:
+                    self.pending.popleft()
+                    self.stats["dropped"] += 1
+                else:
+                    started_at = time.monotonic()
+                    self.condition.wait_for(lambda: len(self.pending) < self.capacity or self.closed)
+                    self.stats["blocked"] += time.monotonic() - started_at
+            self.pending.append([state, changes, time.monotonic()])
+            self.stats["max_depth"] = max(self.stats["max_depth"], len(self.pending))
+            self.condition.notify_all()
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.dispatcher.schedule(self)
+
+    def deliver_next(self) -> None:
+        """
+        deliver the oldest pending notification, on a dispatcher worker;
+        reschedules the mailbox while more are pending, so observers share
+        the workers in turn.
+        """
+        with self.condition:
+            if not self.pending:
+                self.scheduled = False
+                return
+            state, changes, enqueued_at = self.pending.popleft()
+            self.busy = True
+            self.condition.notify_all()
+
+        observer = self.observer()
+        if observer is None:
+            with self.condition:
+                self.pending.clear()
+                self.closed = True
+                self.busy = False
+                self.scheduled = False
+                self.condition.notify_all()
+            return
+        lag = time.monotonic() - enqueued_at
+        snapshot = StateSnapshot(self.subject, state)
+        try:
+            if changes is not None and getattr(observer, "wants_changes", False):
+                observer.update_many(snapshot, changes)
+            else:
+                observer.update(snapshot)
+            failed = False
+        except Exception:  # pylint: disable=W0718
+            failed = True
+        del observer
+
+        with self.condition:
+            self.busy = False
+            stats = self.stats
+            stats["errors" if failed else "delivered"] += 1
+            stats["lag_total"] += lag
+            stats["lag_max"] = max(stats["lag_max"], lag)
+            stats["lag_last"] = lag
+            self.scheduled = bool(self.pending)
+            self.condition.notify_all()
+            if not self.scheduled:
+                return
+        self.dispatcher.schedule(self)
+
+    def idle(self) -> bool:
+        """
+        whether everything queued has been delivered.
+        """
+        return not self.pending and not self.busy
+
+    def metrics(self) -> typing.Dict[str, float]:
+        """
+        depth, drops and lag of this observer.
+        """
+        with self.condition:
+            stats = dict(self.stats)
+            handled = stats["delivered"] + stats["errors"]
+            stats["depth"] = len(self.pending)
+            stats["lag_avg"] = stats.pop("lag_total") / handled if handled else 0.0
+        return stats
+
+    def close(self) -> None:
+        """
+        accept no more notifications; pending ones are still delivered.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class ConcurrentSubject(Subject):
+    """
+    subject that notifies its observers on a pool of `workers` threads.
+    """
+    def __init__(self, capacity: int = 100, policy: str = DROP_OLDEST, workers: int = 8) -> None:
+        super().__init__()
+        self.capacity = capacity
+        self.policy = policy
+        self.workers = workers
+        self._mailboxes: typing.Dict[int, Mailbox] = {}
+        self._mailbox_lock = threading.Lock()
+        self._dispatcher: typing.Optional[Dispatcher] = None
+
+    def _mailbox(self, observer, capacity, policy) -> Mailbox:
+        # call with the mailbox lock held
+        if self._dispatcher is None:
+            self._dispatcher = Dispatcher(self.workers)
+        mailbox = self._mailboxes[id(observer)] = Mailbox(self, observer, capacity, policy, self._dispatcher)
+        return mailbox
+
+    def attach(self, observer, predicate=None, policy=None, capacity=None):
+        """
+        attacher; policy and capacity override the subject's defaults.
+        """
+        super().attach(observer, predicate)
+        with self._mailbox_lock:
+            mailbox = self._mailboxes.get(id(observer))
+            if mailbox is not None and mailbox.observer() is observer:
+                if policy is None and capacity is None:
+                    return
+                mailbox.close()
+            self._mailbox(observer, capacity or self.capacity, policy or self.policy)
+
+    def detach(self, observer):
+        super().detach(observer)
+        with self._mailbox_lock:
+            mailbox = self._mailboxes.get(id(observer))
+            if mailbox is not None and mailbox.observer() is observer:
+                del self._mailboxes[id(observer)]
+                mailbox.close()
+
+    def _deliver(self, observer, changes):
+        mailbox = self._mailboxes.get(id(observer))
+        if mailbox is None or mailbox.observer() is not observer:
+            with self._mailbox_lock:
+                if mailbox is not None:
+                    mailbox.close()
+                mailbox = self._mailbox(observer, self.capacity, self.policy)
+        mailbox.put(self._state, changes)
+
+    def drain(self, timeout: typing.Optional[float] = None) -> bool:
+        """
+        wait until every observer has caught up; False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for mailbox in list(self._mailboxes.values()):
+            with mailbox.condition:
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                if not mailbox.condition.wait_for(lambda mailbox=mailbox: mailbox.idle() or mailbox.closed,
+                                                  remaining):
+                    return False
+        return True
+
+    def metrics(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        """
+        per observer metrics, slowest (by average lag) first.
+        """
+        rows = {
+            mailbox.name: mailbox.metrics()
+            for mailbox in list(self._mailboxes.values()) if mailbox.observer() is not None
+        }
+        return dict(sorted(rows.items(), key=lambda item: -item[1]["lag_avg"]))
+
+    def slow_observers(self, lag: float = 0.1) -> typing.List[Observer]:
+        """
+        the observers whose average lag exceeds lag seconds or that lose
+        notifications to their overflow policy.
+        """
+        slow = []
+        for mailbox in list(self._mailboxes.values()):
+            observer = mailbox.observer()
+            stats = mailbox.metrics()
+            if observer is not None and (stats["lag_avg"] > lag or stats["dropped"] or stats["coalesced"]):
+                slow.append(observer)
+        return slow
+
+    def close(self) -> None:
+        """
+        stop the worker pool after every mailbox has drained.
+        """
+        with self._mailbox_lock:
+            mailboxes = list(self._mailboxes.values())
+            self._mailboxes.clear()
+            dispatcher, self._dispatcher = self._dispatcher, None
+        for mailbox in mailboxes:
+            mailbox.close()
+        for mailbox in mailboxes:
+            with mailbox.condition:
+                mailbox.condition.wait_for(mailbox.idle)
+        if dispatcher is not None:
+            dispatcher.close()
+
+
+class SlowObserver(CountingObserver):
+    """
+    observer that takes `delay` seconds per update and records the states.
+    """
+    def __init__(self, delay: float) -> None:
+        super().__init__()
+        self.delay = delay
+        self.states: typing.List[typing.Any] = []
+
+    def update(self, subject):
+        time.sleep(self.delay)
+        self.states.append(subject.state)
+        super().update(subject)
+
+
+def benchmark(changes: int = 200, fast_observers: int = 20, delay: float = 0.01) -> typing.Dict[str, float]:
+    """
+    seconds the state setter spends on `changes` assignments with one slow
+    observer among fast ones, sequential against concurrent dispatch.
+    """
+    results = {}
+    for label, subject in (("sequential", Subject()), ("concurrent", ConcurrentSubject(capacity=10))):
+        population = [CountingObserver() for _ in range(fast_observers)] + [SlowObserver(delay)]
+        for observer in population:
+            subject.attach(observer)
+        started_at = time.perf_counter()
+        for value in range(changes):
+            subject.state = value
+        results[f"{label}_setter_seconds"] = time.perf_counter() - started_at
+        if isinstance(subject, ConcurrentSubject):
+            subject.drain()
+            subject.close()
+    return results
+
+
+class TestConcurrentSubject(unittest.TestCase):
+    """
+    test concurrent subject.
+    """
+    def test_slow_observer_is_isolated(self) -> None:
+        """
+        the setter and fast observers do not wait for the slow one.
+        """
+        subject = ConcurrentSubject(capacity=2)
+        fast = SlowObserver(0.0)
+        slow = SlowObserver(0.05)
+        subject.attach(fast, capacity=100)
+        subject.attach(slow)
+        started_at = time.perf_counter()
+        for value in range(20):
+            subject.state = value
+        self.assertLess(time.perf_counter() - started_at, 0.05)
+        self.assertTrue(subject.drain(timeout=5))
+        self.assertEqual(fast.states, list(range(20)))
+        self.assertEqual(slow.states[-2:], [18, 19])
+        self.assertLess(len(slow.states), 20)
+        self.assertEqual(subject.slow_observers(lag=0.02), [slow])
+        self.assertGreater(next(iter(subject.metrics().values()))["dropped"], 0)
+        subject.close()
+
+    def test_block_policy(self) -> None:
+        """
+        a blocking mailbox delivers everything and makes the setter wait.
+        """
+        subject = ConcurrentSubject(capacity=1, policy=BLOCK)
+        observer = SlowObserver(0.01)
+        subject.attach(observer)
+        started_at = time.perf_counter()
+        for value in range(10):
+            subject.state = value
+        self.assertGreater(time.perf_counter() - started_at, 0.05)
+        subject.drain()
+        self.assertEqual(observer.states, list(range(10)))
+        self.assertGreater(subject.metrics()[next(iter(subject.metrics()))]["blocked"], 0)
+        subject.close()
+
+    def test_coalesce_policy(self) -> None:
+        """
+        coalescing keeps the latest state and merges change lists.
+        """
+        subject = ConcurrentSubject(capacity=1)
+        gate = threading.Event()
+
+        class Gated(ChangeListObserver):
+            """
+            wait for the gate before taking updates.
+            """
+            def update_many(self, subject, changes):
+                gate.wait()
+                super().update_many(subject, changes)
+
+        observer = Gated()
+        subject.attach(observer, policy=COALESCE)
+        for value in range(5):
+            with subject.batch():
+                subject.state = value
+        gate.set()
+        subject.drain()
+        self.assertEqual(observer.received[-1][-1], 4)
+        self.assertEqual(sum(observer.received, []), list(range(5)))
+        subject.close()
+
+    def test_coalesce_unbatched_into_batch(self) -> None:
+        """
+        a plain notification coalesced into a pending batch extends its change list.
+        """
+        subject = ConcurrentSubject(capacity=1)
+        gate = threading.Event()
+
+        class Gated(ChangeListObserver):
+            """
+            wait for the gate before taking updates.
+            """
+            def update_many(self, subject, changes):
+                gate.wait()
+                super().update_many(subject, changes)
+
+        observer = Gated()
+        subject.attach(observer, policy=COALESCE)
+        with subject.batch():
+            subject.state = 0
+        while subject.metrics()[next(iter(subject.metrics()))]["depth"]:
+            time.sleep(0.001)
+        with subject.batch():
+            subject.state = 1
+        subject.state = 2
+        subject.state = 3
+        gate.set()
+        subject.drain()
+        self.assertEqual(sum(observer.received, []), [0, 1, 2, 3])
+        subject.close()
+
+    def test_pool_is_bounded(self) -> None:
+        """
+        many observers share a fixed number of threads and each sees its states in order.
+        """
+        before = threading.active_count()
+        subject = ConcurrentSubject(capacity=100, workers=4)
+        observers = [SlowObserver(0.0) for _ in range(2000)]
+        for observer in observers:
+            subject.attach(observer)
+        self.assertLessEqual(threading.active_count() - before, 4)
+        for value in range(20):
+            subject.state = value
+        self.assertTrue(subject.drain(timeout=10))
+        for observer in observers:
+            self.assertEqual(observer.states, list(range(20)))
+        subject.close()
+        self.assertEqual(threading.active_count(), before)
+
+    def test_snapshot_and_predicates(self) -> None:
+        """
+        observers see the state they were notified of, filtered as usual.
+        """
+        subject = ConcurrentSubject()
+        observer = SlowObserver(0.0)
+        subject.attach(observer, predicate=Range(low=3))
+        for value in range(6):
+            subject.state = value
+        subject.drain()
+        self.assertEqual(observer.states, [3, 4, 5])
+        subject.detach(observer)
+        subject.state = 9
+        subject.drain()
+        self.assertEqual(observer.states, [3, 4, 5])
+        subject.close()
+
+    def test_benchmark(self) -> None:
+        """
+        concurrent dispatch frees the setter from the slow observer.
+        """
+        results = benchmark(changes=50, fast_observers=10, delay=0.005)
+        print(results)
+        self.assertLess(results["concurrent_setter_seconds"], results["sequential_setter_seconds"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,527 @@
+"""
+Delta-based undo: commands no longer hand-code their inverse and receivers
+with large state are no longer snapshotted in full before every command.
+
+A receiver derives from Recordable and keeps its big collections in a
+TrackedDict or TrackedList. While a DeltaCommand runs, every first write
+to an attribute or dict key and every list operation records the old value
+in a delta. The delta is pickled and zlib-compressed once the command is
+done; undo decompresses it and rolls the writes back in reverse order. The
+cost of a command is proportional to what it changed, not to the size of
+the receiver.
+
+usage:
+    class RestockCommand(DeltaCommand):
+        def apply(self):
+            self.receiver.items[self.sku] += self.quantity
+
+    remote.set_command(RestockCommand(inventory, "sku-1", 5))
+    remote.press_button()
+    remote.press_undo()
+"""
+import abc
+import copy
+import operator
+import pickle
+import time
+import typing
+import unittest
+import zlib
+
+from .command import Command, RemoteControl
+
+ATTRIBUTE = 0
+DICT_KEY = 1
+LIST_SET = 2
+LIST_INSERT = 3
+LIST_DELETE = 4
+LIST_REPLACE = 5
+
+
+class Recorder:
+    """
+    collects the old values written during one command.
+    """
+    def __init__(self) -> None:
+        self.entries: typing.List[tuple] = []
+        self._seen: typing.Set[tuple] = set()
+
+    def first_write(self, kind: int, name: str, key: typing.Any, had: bool, old: typing.Any) -> None:
+        """
+        record the old value unless this slot was already written.
+        """
+        slot = (kind, name, key)
+        if slot not in self._seen:
+            self._seen.add(slot)
+            self.entries.append((kind, name, key, had, old))
+
+    def list_operation(self, kind: int, name: str, index: int, old: typing.Any = None) -> None:
+        """
+        record a list operation; indices shift, so every one counts.
+        """
+        self.entries.append((kind, name, index, True, old))
+
+
+class Recordable:
+    """
+    receiver mixin that reports attribute writes to the active recorder.
+    """
+    _recorder: typing.Optional[Recorder] = None
+
+    def __setattr__(self, name: str, value: typing.Any) -> None:
+        recorder = self._recorder
+        # `x += ...` rebinds the attribute to the same, already recorded, object
+        if recorder is not None and name != "_recorder" and self.__dict__.get(name, self) is not value:
+            had = name in self.__dict__
+            recorder.first_write(ATTRIBUTE, name, None, had, self.__dict__.get(name))
+        if isinstance(value, (TrackedDict, TrackedList)):
+            value.bind(self, name)
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name: str) -> None:
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.first_write(ATTRIBUTE, name, None, True, self.__dict__.get(name))
+        object.__delattr__(self, name)
+
+
+class TrackedDict(dict):
+    """
+    dict that records the old value of every key written by a command.
+    undo restores the items, not necessarily their insertion order.
+    """
+    _owner: typing.Optional[Recordable] = None
+    _name = ""
+
+    def bind(self, owner: Recordable, name: str) -> None:
+        """
+        attach the dict to the receiver attribute holding it.
+        """
+        self._owner = owner
+        self._name = name
+
+    def _record(self, key: typing.Any) -> None:
+        recorder = self._owner._recorder if self._owner is not None else None
+        if recorder is not None:
+            recorder.first_write(DICT_KEY, self._name, key, key in self, self.get(key))
+
+    def __setitem__(self, key, value) -> None:
+        self._record(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key) -> None:
+        self._record(key)
+        super().__delitem__(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._record(key)
+        return super().pop(key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._record(key)
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def popitem(self):
+        if self:
+            self._record(next(reversed(self)))
+        return super().popitem()
+
+    def clear(self) -> None:
+        for key in self:
+            self._record(key)
+        super().clear()
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+
+class TrackedList(list):
+    """
+    list that records every change made by a command; in-place
+    operations touching many items (sort, reverse, clear, *=) record
+    a copy of the whole list.
+    """
+    _owner: typing.Optional[Recordable] = None
+    _name = ""
+
+    def bind(self, owner: Recordable, name: str) -> None:
+        """
+        attach the list to the receiver attribute holding it.
+        """
+        self._owner = owner
+        self._name = name
+
+    def _recorder(self) -> typing.Optional[Recorder]:
+        return self._owner._recorder if self._owner is not None else None
+
+    def _position(self, index) -> int:
+        index = operator.index(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("list index out of range")
+        return index
+
+    def __setitem__(self, index, value) -> None:
+        if isinstance(index, slice):
+            raise TypeError("slice assignment is not tracked")
+        recorder = self._recorder()
+        if recorder is not None:
+            index = self._position(index)
+            recorder.list_operation(LIST_SET, self._name, index, self[index])
+        super().__setitem__(index, value)
+
+    def append(self, value) -> None:
+        recorder = self._recorder()
+        if recorder is not None:
+            recorder.list_operation(LIST_INSERT, self._name, len(self))
+        super().append(value)
+
+    def extend(self, values) -> None:
+        for value in values:
+            self.append(value)
+
+    def insert(self, index, value) -> None:
+        recorder = self._recorder()
+        if recorder is not None:
+            # where list.insert actually puts the item
+            index = operator.index(index)
+            index = max(len(self) + index, 0) if index < 0 else min(index, len(self))
+            recorder.list_operation(LIST_INSERT, self._name, index)
+        super().insert(index, value)
+
+    def pop(self, index=-1):
+        recorder = self._recorder()
+        if recorder is not None:
+            if not self:
+                raise IndexError("pop from empty list")
+            index = self._position(index)
+            recorder.list_operation(LIST_DELETE, self._name, index, self[index])
+        return super().pop(index)
+
+    def __delitem__(self, index) -> None:
+        if isinstance(index, slice):
+            raise TypeError("slice deletion is not tracked")
+        self.pop(index)
+
+    def remove(self, value) -> None:
+        self.pop(self.index(value))
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def _replace(self) -> None:
+        recorder = self._recorder()
+        if recorder is not None:
+            recorder.list_operation(LIST_REPLACE, self._name, None, list(self))
+
+    def __imul__(self, times):
+        self._replace()
+        return super().__imul__(times)
+
+    def clear(self) -> None:
+        self._replace()
+        super().clear()
+
+    def sort(self, *args, **kwargs) -> None:
+        self._replace()
+        super().sort(*args, **kwargs)
+
+    def reverse(self) -> None:
+        self._replace()
+        super().reverse()
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+
+def rollback(receiver: Recordable, entries: typing.List[tuple]) -> None:
+    """
+    undo the recorded writes, newest first.
+    """
+    state = receiver.__dict__
+    for kind, name, key, had, old in reversed(entries):
+        if kind == ATTRIBUTE:
+            if had:
+                setattr(receiver, name, old)
+            else:
+                state.pop(name, None)
+        elif kind == DICT_KEY:
+            container = state[name]
+            if had:
+                dict.__setitem__(container, key, old)
+            else:
+                dict.pop(container, key, None)
+        elif kind == LIST_SET:
+            list.__setitem__(state[name], key, old)
+        elif kind == LIST_INSERT:
+            list.pop(state[name], key)
+        elif kind == LIST_REPLACE:
+            list.__setitem__(state[name], slice(None), old)
+        else:
+            list.insert(state[name], key, old)
+
+
+class DeltaCommand(Command):
+    """
+    command with built-in undo from compressed deltas.
+    """
+    def __init__(self, receiver: Recordable) -> None:
+        self.receiver = receiver
+        self.delta = b""
+
+    @abc.abstractmethod
+    def apply(self) -> None:
+        """
+        change the receiver.
+        """
+
+    def execute(self) -> None:
+        recorder = Recorder()
+        object.__setattr__(self.receiver, "_recorder", recorder)
+        try:
+            self.apply()
+        finally:
+            object.__setattr__(self.receiver, "_recorder", None)
+        self.delta = zlib.compress(pickle.dumps(recorder.entries, pickle.HIGHEST_PROTOCOL))
+
+    def undo(self) -> None:
+        rollback(self.receiver, pickle.loads(zlib.decompress(self.delta)))
+        self.delta = b""
+
+
+class Warehouse(Recordable):
+    """
+    receiver with a large stock table and an audit trail.
+    """
+    def __init__(self, skus: int = 0) -> None:
+        self.stock = TrackedDict((f"sku-{index}", 100) for index in range(skus))
+        self.audit = TrackedList()
+        self.total = 100 * skus
+
+
+class RestockCommand(DeltaCommand):
+    """
+    add items to one sku.
+    """
+    def __init__(self, warehouse: Warehouse, sku: str, quantity: int) -> None:
+        super().__init__(warehouse)
+        self.sku = sku
+        self.quantity = quantity
+
+    def apply(self) -> None:
+        warehouse = self.receiver
+        warehouse.stock[self.sku] = warehouse.stock.get(self.sku, 0) + self.quantity
+        warehouse.total += self.quantity
+        warehouse.audit.append((self.sku, self.quantity))
+
+
+class SnapshotRestockCommand(Command):
+    """
+    the same restock with full-snapshot undo, the baseline.
+    """
+    def __init__(self, warehouse: Warehouse, sku: str, quantity: int) -> None:
+        self.warehouse = warehouse
+        self.sku = sku
+        self.quantity = quantity
+        self.snapshot: typing.Optional[dict] = None
+
+    def execute(self) -> None:
+        self.snapshot = copy.deepcopy(self.warehouse.__dict__)
+        self.warehouse.stock[self.sku] = self.warehouse.stock.get(self.sku, 0) + self.quantity
+        self.warehouse.total += self.quantity
+        self.warehouse.audit.append((self.sku, self.quantity))
+
+    def undo(self) -> None:
+        self.warehouse.__dict__.update(self.snapshot)
+        self.snapshot = None
+
+
+def benchmark(skus: int = 50_000, commands: int = 50) -> typing.Dict[str, float]:
+    """
+    bytes kept for undo and latency per command, delta against full snapshot.
+    """
+    results = {}
+    for name, command_class in (("delta", RestockCommand), ("snapshot", SnapshotRestockCommand)):
+        warehouse = Warehouse(skus)
+        remote = RemoteControl(capacity=commands)
+        started_at = time.perf_counter()
+        for index in range(commands):
+            remote.set_command(command_class(warehouse, f"sku-{index}", 5))
+            remote.press_button()
+        elapsed = time.perf_counter() - started_at
+
+        if name == "delta":
+            kept = sum(len(command.delta) for command in remote.command_history)
+        else:
+            kept = sum(len(pickle.dumps(command.snapshot)) for command in remote.command_history)
+        results[f"{name}_bytes_per_command"] = kept / commands
+        results[f"{name}_seconds_per_command"] = elapsed / commands
+    return results
+
+
+class TestDeltaUndo(unittest.TestCase):
+    """
+    test delta undo.
+    """
+    def test_undo_restores_state(self) -> None:
+        """
+        undo brings back attributes, dict keys and list contents.
+        """
+        warehouse = Warehouse(10)
+        before = (dict(warehouse.stock), list(warehouse.audit), warehouse.total)
+        remote = RemoteControl()
+        for sku in ("sku-1", "sku-1", "new-sku"):
+            remote.set_command(RestockCommand(warehouse, sku, 3))
+            remote.press_button()
+        self.assertEqual(warehouse.stock["sku-1"], 106)
+        for _ in range(3):
+            remote.press_undo()
+        self.assertEqual((dict(warehouse.stock), list(warehouse.audit), warehouse.total), before)
+        self.assertNotIn("new-sku", warehouse.stock)
+        remote.press_redo()
+        self.assertEqual(warehouse.stock["sku-1"], 103)
+
+    def test_list_operations(self) -> None:
+        """
+        set, insert and pop on a tracked list are rolled back.
+        """
+        class Edit(DeltaCommand):
+            """
+            edit the audit trail.
+            """
+            def apply(self) -> None:
+                audit = self.receiver.audit
+                audit[0] = "changed"
+                audit.insert(1, "inserted")
+                audit.pop()
+                audit.extend(["x", "y"])
+                self.receiver.note = "new attribute"
+                self.receiver.stock = TrackedDict()
+
+        warehouse = Warehouse()
+        warehouse.audit.extend(["a", "b", "c"])
+        command = Edit(warehouse)
+        command.execute()
+        self.assertEqual(warehouse.audit, ["changed", "inserted", "b", "x", "y"])
+        command.undo()
+        self.assertEqual(warehouse.audit, ["a", "b", "c"])
+        self.assertFalse(hasattr(warehouse, "note"))
+        self.assertIsInstance(warehouse.stock, TrackedDict)
+        self.assertIs(warehouse.stock._owner, warehouse)  # pylint: disable=W0212
+
+    def test_bulk_and_in_place_operations(self) -> None:
+        """
+        +=, del, remove, sort, reverse, clear and the dict bulk
+        operations are rolled back as well.
+        """
+        class Edit(DeltaCommand):
+            """
+            rewrite the audit trail and the stock table.
+            """
+            def apply(self) -> None:
+                receiver = self.receiver
+                receiver.audit += ["x"]
+                del receiver.audit[0]
+                receiver.audit.remove("c")
+                receiver.audit.append("a")
+                receiver.audit.sort()
+                receiver.audit.reverse()
+                receiver.audit *= 2
+                receiver.stock |= {"sku-9": 1}
+                receiver.stock.popitem()
+                receiver.stock.popitem()
+                receiver.stock.clear()
+                receiver.stock["new"] = 5
+
+        warehouse = Warehouse(3)
+        warehouse.audit.extend(["a", "b", "c"])
+        before = (list(warehouse.audit), dict(warehouse.stock))
+        command = Edit(warehouse)
+        command.execute()
+        self.assertEqual(warehouse.audit, ["x", "b", "a"] * 2)
+        self.assertEqual(dict(warehouse.stock), {"new": 5})
+        command.undo()
+        self.assertEqual((list(warehouse.audit), dict(warehouse.stock)), before)
+
+        audit = warehouse.audit
+        with self.assertRaises(TypeError):
+            del audit[0:1]
+
+    def test_list_indices(self) -> None:
+        """
+        negative indices land where list puts them, bad ones raise like list.
+        """
+        class Edit(DeltaCommand):
+            """
+            run one list operation on the audit trail.
+            """
+            def __init__(self, warehouse: Warehouse, operation: typing.Callable[[list], None]) -> None:
+                super().__init__(warehouse)
+                self.operation = operation
+
+            def apply(self) -> None:
+                self.operation(self.receiver.audit)
+
+        def assign(audit, index) -> None:
+            audit[index] = "z"
+
+        warehouse = Warehouse()
+        warehouse.audit.extend(["a", "b", "c"])
+        for operation, expected in (
+            (lambda audit: audit.insert(-1, "x"), ["a", "b", "x", "c"]),
+            (lambda audit: audit.insert(-10, "x"), ["x", "a", "b", "c"]),
+            (lambda audit: audit.insert(10, "x"), ["a", "b", "c", "x"]),
+            (lambda audit: assign(audit, -1), ["a", "b", "z"]),
+            (lambda audit: audit.pop(-3), ["b", "c"]),
+        ):
+            command = Edit(warehouse, operation)
+            command.execute()
+            self.assertEqual(warehouse.audit, expected)
+            command.undo()
+            self.assertEqual(warehouse.audit, ["a", "b", "c"])
+
+        for operation in (
+            lambda audit: audit.pop(5), lambda audit: audit.pop(-4),
+            lambda audit: assign(audit, 10), lambda audit: assign(audit, -4),
+        ):
+            with self.assertRaises(IndexError):
+                Edit(warehouse, operation).execute()
+            self.assertEqual(warehouse.audit, ["a", "b", "c"])
+
+        with self.assertRaises(IndexError):
+            Edit(Warehouse(), lambda audit: audit.pop()).execute()
+
+    def test_delta_is_small(self) -> None:
+        """
+        the delta does not grow with the receiver.
+        """
+        small, large = Warehouse(10), Warehouse(100_000)
+        for warehouse in (small, large):
+            command = RestockCommand(warehouse, "sku-3", 1)
+            command.execute()
+            self.assertLess(len(command.delta), 200)
+
+    def test_benchmark(self) -> None:
+        """
+        deltas use less memory and time than full snapshots.
+        """
+        result = benchmark(skus=20_000, commands=10)
+        print(result)
+        self.assertLess(result["delta_bytes_per_command"] * 100, result["snapshot_bytes_per_command"])
+        self.assertLess(result["delta_seconds_per_command"], result["snapshot_seconds_per_command"])
+
+
+if __name__ == "__main__":
+    unittest.main()
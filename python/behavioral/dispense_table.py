@@ -0,0 +1,261 @@
+"""
+The dispense table answers "can I dispense X?" quotes in O(1). Instead of
+walking the chain of dispensers for every quote, a precomputation stage
+fills one flat array with the optimal bill breakdown of every amount up to
+a configurable maximum for a given set of denominations.
+
+The table is built for unlimited cassettes. A lookup checks the stored
+breakdown against the current inventory (one comparison per denomination);
+only when a withdrawal has emptied a cassette below what a breakdown needs
+is that single entry recomputed by the dispensing engine and written back.
+A refill can make cheaper breakdowns possible again, so restocking rebuilds
+the table.
+
+usage:
+    table = DispenseTable([100, 50, 20, 10], max_amount=10_000)
+    table.can_dispense(230)
+    table.lookup(230).bills
+"""
+import array
+import contextlib
+import io
+import math
+import random
+import time
+import typing
+import unittest
+
+from .chain_of_responsiblity import DispenseResult, DispensingEngine, build_chain
+
+IMPOSSIBLE = 0xFFFFFFFF
+
+
+class DispenseTable:
+    """
+    the array-backed lookup table of optimal bill breakdowns.
+    """
+    def __init__(
+        self,
+        denominations: typing.Iterable[int],
+        max_amount: int,
+        inventory: typing.Optional[typing.Dict[int, typing.Optional[int]]] = None,
+    ) -> None:
+        self.denominations = sorted(set(denominations), reverse=True)
+        self.max_amount = max_amount
+        self.unit = math.gcd(*self.denominations)
+        self.inventory = {denomination: None for denomination in self.denominations}
+        self.inventory.update(inventory or {})
+        self.repairs = 0
+        self.build()
+
+    def build(self) -> None:
+        """
+        fill the table with the unlimited-cassette optimum of every amount.
+        """
+        width = len(self.denominations)
+        rows = self.max_amount // self.unit + 1
+        steps = [denomination // self.unit for denomination in self.denominations]
+
+        fewest = array.array("I", [IMPOSSIBLE]) * rows
+        last = array.array("b", [-1]) * rows
+        fewest[0] = 0
+        for total in range(1, rows):
+            best = IMPOSSIBLE
+            for index, step in enumerate(steps):
+                if step <= total and fewest[total - step] + 1 < best:
+                    best = fewest[total - step] + 1
+                    last[total] = index
+            fewest[total] = best
+
+        counts = array.array("I", [0]) * (rows * width)
+        for total in range(1, rows):
+            index = last[total]
+            if index < 0:
+                continue
+            previous = total - steps[index]
+            counts[total * width:total * width + width] = counts[previous * width:previous * width + width]
+            counts[total * width + index] += 1
+
+        self.fewest = fewest
+        self.counts = counts
+
+    def _row(self, amount: int) -> int:
+        if amount < 0 or amount > self.max_amount:
+            raise ValueError(f"amount {amount} is outside the table (max {self.max_amount})")
+        if amount % self.unit:
+            return -1
+        return amount // self.unit
+
+    def _fits(self, row: int) -> bool:
+        width = len(self.denominations)
+        base = row * width
+        for index, denomination in enumerate(self.denominations):
+            count = self.inventory[denomination]
+            if count is not None and self.counts[base + index] > count:
+                return False
+        return True
+
+    def _repair(self, row: int, amount: int) -> None:
+        self.repairs += 1
+        width = len(self.denominations)
+        # the table promises the fewest bills, which the engine's greedy
+        # first pass does not guarantee for non-canonical denominations
+        bills = DispensingEngine(self.inventory).optimal(amount)
+        self.fewest[row] = sum(bills.values()) if bills is not None else IMPOSSIBLE
+        for index, denomination in enumerate(self.denominations):
+            self.counts[row * width + index] = (bills or {}).get(denomination, 0)
+
+    def lookup(self, amount: int) -> DispenseResult:
+        """
+        the optimal bills for the amount under the current inventory.
+        """
+        row = self._row(amount)
+        if row < 0:
+            return DispenseResult(amount, {})
+        if self.fewest[row] != IMPOSSIBLE and not self._fits(row):
+            self._repair(row, amount)
+        if self.fewest[row] == IMPOSSIBLE:
+            return DispenseResult(amount, {})
+
+        base = row * len(self.denominations)
+        return DispenseResult(amount, {
+            denomination: self.counts[base + index]
+            for index, denomination in enumerate(self.denominations)
+            if self.counts[base + index]
+        })
+
+    def can_dispense(self, amount: int) -> bool:
+        """
+        quote whether the amount can be dispensed right now.
+        """
+        row = self._row(amount)
+        if row < 0 or self.fewest[row] == IMPOSSIBLE:
+            return False
+        if not self._fits(row):
+            self._repair(row, amount)
+        return self.fewest[row] != IMPOSSIBLE
+
+    def withdraw(self, amount: int) -> DispenseResult:
+        """
+        dispense the amount and take the bills out of the inventory.
+        """
+        result = self.lookup(amount)
+        if result.success:
+            for denomination, count in result.bills.items():
+                if self.inventory[denomination] is not None:
+                    self.inventory[denomination] -= count
+        return result
+
+    def restock(self, inventory: typing.Dict[int, typing.Optional[int]]) -> None:
+        """
+        refill cassettes and rebuild the table.
+        """
+        self.inventory.update(inventory)
+        self.build()
+
+
+def benchmark(queries: int = 20_000, max_amount: int = 5_000, seed: int = 3) -> typing.Dict[str, float]:
+    """
+    quotes per second of the table against walking the CashDispenser
+    chain, for random amounts.
+    """
+    rnd = random.Random(seed)
+    amounts = [rnd.randrange(0, max_amount + 1, 5) for _ in range(queries)]
+    inventory = {100: None, 50: None, 20: None, 10: None}
+
+    started_at = time.perf_counter()
+    table = DispenseTable(inventory, max_amount, inventory)
+    build = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for amount in amounts:
+        table.can_dispense(amount)
+    table_time = time.perf_counter() - started_at
+
+    chain = build_chain()
+    started_at = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for amount in amounts:
+            chain.dispense(amount)
+    chain_time = time.perf_counter() - started_at
+
+    return {
+        "build_seconds": build,
+        "table_quotes_per_second": queries / table_time,
+        "chain_quotes_per_second": queries / chain_time,
+    }
+
+
+class TestDispenseTable(unittest.TestCase):
+    """
+    test dispense table.
+    """
+    def test_matches_engine(self) -> None:
+        """
+        every entry agrees with the dispensing engine on bill count.
+        """
+        inventory = {100: None, 50: None, 20: None, 10: None}
+        table = DispenseTable(inventory, 2_000)
+        engine = DispensingEngine(inventory)
+        for amount in range(0, 2_001, 5):
+            expected = engine.plan(amount)
+            result = table.lookup(amount)
+            self.assertEqual(result.success, expected.success)
+            self.assertEqual(result.bill_count, expected.bill_count)
+
+    def test_non_canonical_denominations(self) -> None:
+        """
+        the table finds 30 + 30 where greedy would pay 40 + 10 + 10.
+        """
+        table = DispenseTable([40, 30, 10], 100)
+        self.assertEqual(table.lookup(60).bills, {30: 2})
+        self.assertFalse(table.can_dispense(5))
+
+    def test_incremental_repair(self) -> None:
+        """
+        only the entries that no longer fit the cassettes are recomputed.
+        """
+        table = DispenseTable([100, 50, 20, 10], 1_000, {100: 1, 50: 1, 20: 10, 10: 0})
+        self.assertEqual(table.withdraw(100).bills, {100: 1})
+        self.assertEqual(table.lookup(60).bills, {20: 3})
+        self.assertEqual(table.repairs, 1)
+        self.assertEqual(table.lookup(60).bills, {20: 3})
+        self.assertEqual(table.repairs, 1)
+        self.assertFalse(table.can_dispense(1_000))
+
+    def test_repair_is_optimal(self) -> None:
+        """
+        a repaired entry has the fewest bills even where greedy would not.
+        """
+        table = DispenseTable([40, 30, 10], 200, {40: 1, 30: 3, 10: 2})
+        self.assertEqual(table.lookup(90).bills, {30: 3})
+        self.assertEqual(table.repairs, 1)
+
+    def test_restock(self) -> None:
+        """
+        a refill brings back the cheaper breakdowns.
+        """
+        table = DispenseTable([100, 50, 20, 10], 1_000, {100: 0, 50: 0, 20: 10, 10: 10})
+        self.assertEqual(table.lookup(200).bill_count, 10)
+        table.restock({100: 5})
+        self.assertEqual(table.lookup(200).bills, {100: 2})
+
+    def test_out_of_range(self) -> None:
+        """
+        amounts beyond the table are rejected.
+        """
+        table = DispenseTable([10], 100)
+        with self.assertRaises(ValueError):
+            table.lookup(110)
+
+    def test_benchmark(self) -> None:
+        """
+        table lookups are faster than walking the chain.
+        """
+        result = benchmark(queries=5_000)
+        print(result)
+        self.assertGreater(result["table_quotes_per_second"], result["chain_quotes_per_second"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,344 @@
+"""
+The event mediator routes dozens of event types between hundreds of
+components. ConcreteMediator compares the event against hard-coded
+strings for two known components; here components subscribe to the event
+types they care about and notify looks the subscribers up in a handler
+table, one dict lookup per event however many components there are.
+
+Subscriptions may use wildcards ("trip.*", "*.failed", "*"). Wildcard
+patterns are compiled to regular expressions once, and the list of
+handlers for a concrete event type (exact subscribers plus every matching
+wildcard, in subscription order) is resolved on first use and cached in
+the table until the subscriptions change. The table is a bounded LRU, so
+events carrying ids in their names cannot grow it without limit.
+
+Handlers are called as handler(sender, event, payload). notify calls them
+synchronously and warns about coroutine handlers it has to skip;
+`await anotify(...)` also awaits coroutine handlers, concurrently.
+
+usage:
+    mediator = EventMediator()
+    mediator.subscribe("driver", lambda sender, event, payload: driver.finish_trip())
+    mediator.subscribe("payment.*", lambda sender, event, payload: payment.pay())
+    mediator.notify(None, "payment.requested")
+"""
+import asyncio
+import collections
+import fnmatch
+import gc
+import inspect
+import itertools
+import random
+import re
+import time
+import typing
+import unittest
+import warnings
+from io import StringIO
+from unittest.mock import patch
+
+from .mediator import Driver, Mediator, Payment
+
+Handler = typing.Callable[[typing.Any, str, typing.Any], typing.Any]
+
+
+class Subscription:
+    """
+    the token returned by subscribe.
+    """
+    __slots__ = ("pattern", "handler", "is_async", "order", "matcher")
+
+    def __init__(self, pattern: str, handler: Handler, order: int) -> None:
+        self.pattern = pattern
+        self.handler = handler
+        self.is_async = inspect.iscoroutinefunction(handler)
+        self.order = order
+        self.matcher = re.compile(fnmatch.translate(pattern)).match if is_wildcard(pattern) else None
+
+
+def is_wildcard(pattern: str) -> bool:
+    """
+    whether the pattern contains a wildcard.
+    """
+    return any(char in pattern for char in "*?[")
+
+
+class EventMediator(Mediator):
+    """
+    mediator with subscription by event type and table dispatch.
+    """
+    def __init__(self, table_size: int = 4096) -> None:
+        self._exact: typing.Dict[str, typing.List[Subscription]] = {}
+        self._wildcards: typing.List[Subscription] = []
+        self._table: typing.OrderedDict[str, typing.Tuple[Subscription, ...]] = collections.OrderedDict()
+        self.table_size = table_size
+        self._order = itertools.count()
+
+    def subscribe(self, pattern: str, handler: Handler) -> Subscription:
+        """
+        call handler for every event matching the pattern.
+        """
+        subscription = Subscription(pattern, handler, next(self._order))
+        if subscription.matcher is None:
+            self._exact.setdefault(pattern, []).append(subscription)
+        else:
+            self._wildcards.append(subscription)
+        self._table.clear()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        stop the subscription.
+        """
+        if subscription.matcher is None:
+            subscriptions = self._exact.get(subscription.pattern, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self._exact.pop(subscription.pattern, None)
+        elif subscription in self._wildcards:
+            self._wildcards.remove(subscription)
+        self._table.clear()
+
+    def handlers(self, event: str) -> typing.Tuple[Subscription, ...]:
+        """
+        the subscriptions for the event, resolved once and cached.
+        """
+        table = self._table
+        try:
+            resolved = table[event]
+        except KeyError:
+            pass
+        else:
+            table.move_to_end(event)
+            return resolved
+        matched = list(self._exact.get(event, ()))
+        matched += [subscription for subscription in self._wildcards if subscription.matcher(event)]
+        matched.sort(key=lambda subscription: subscription.order)
+        resolved = table[event] = tuple(matched)
+        if len(table) > self.table_size:
+            table.popitem(last=False)
+        return resolved
+
+    def notify(self, sender, event, payload=None) -> int:
+        """
+        deliver the event synchronously; returns the number of handlers
+        called. coroutine handlers are skipped with a RuntimeWarning, use
+        anotify for them.
+        """
+        called = 0
+        for subscription in self.handlers(event):
+            if subscription.is_async:
+                warnings.warn(
+                    f"coroutine handler for {event!r} skipped by notify, use anotify", RuntimeWarning, 2
+                )
+            else:
+                subscription.handler(sender, event, payload)
+                called += 1
+        return called
+
+    async def anotify(self, sender, event, payload=None) -> int:
+        """
+        deliver the event, awaiting coroutine handlers concurrently.
+        """
+        subscriptions = self.handlers(event)
+        pending = []
+        try:
+            for subscription in subscriptions:
+                if subscription.is_async:
+                    pending.append(subscription.handler(sender, event, payload))
+                else:
+                    subscription.handler(sender, event, payload)
+        except BaseException:
+            # never awaited, so close them instead of leaking warnings
+            for coroutine in pending:
+                coroutine.close()
+            raise
+        if pending:
+            await asyncio.gather(*pending)
+        return len(subscriptions)
+
+
+class LinearMediator(EventMediator):
+    """
+    the same subscriptions matched one by one on every event, the baseline.
+    """
+    def notify(self, sender, event, payload=None) -> int:
+        subscriptions = [
+            subscription
+            for subscriptions in self._exact.values() for subscription in subscriptions
+        ] + self._wildcards
+        delivered = 0
+        for subscription in sorted(subscriptions, key=lambda subscription: subscription.order):
+            if subscription.pattern == event or (subscription.matcher and subscription.matcher(event)):
+                subscription.handler(sender, event, payload)
+                delivered += 1
+        return delivered
+
+
+def benchmark(
+    subscriber_counts: typing.Sequence[int] = (10, 100, 1000),
+    event_types: int = 50,
+    events: int = 20_000,
+    seed: int = 9,
+) -> typing.List[typing.Dict[str, float]]:
+    """
+    events per second of table dispatch and linear matching as the number
+    of subscribers grows; one subscriber in ten uses a wildcard.
+    """
+    rnd = random.Random(seed)
+    names = [f"{group}.{index}" for index in range(event_types) for group in ("trip", "payment")]
+    stream = [rnd.choice(names) for _ in range(events)]
+    results = []
+
+    def handler(sender, event, payload) -> None:
+        """
+        subscriber doing no work.
+        """
+
+    for subscribers in subscriber_counts:
+        row: typing.Dict[str, float] = {"subscribers": subscribers}
+        patterns = [
+            rnd.choice(("trip.*", "payment.*")) if index % 10 == 0 else rnd.choice(names)
+            for index in range(subscribers)
+        ]
+        for label, mediator_class in (("table", EventMediator), ("linear", LinearMediator)):
+            mediator = mediator_class()
+            for pattern in patterns:
+                mediator.subscribe(pattern, handler)
+
+            sample = stream if label == "table" else stream[:max(events // subscribers, 200)]
+            started_at = time.perf_counter()
+            for event in sample:
+                mediator.notify(None, event)
+            row[f"{label}_events_per_second"] = len(sample) / (time.perf_counter() - started_at)
+        results.append(row)
+    return results
+
+
+class TestEventMediator(unittest.TestCase):
+    """
+    test event mediator.
+    """
+    def test_exact_and_wildcard_order(self) -> None:
+        """
+        exact and wildcard subscribers run in subscription order.
+        """
+        mediator = EventMediator()
+        received = []
+        mediator.subscribe("trip.*", lambda sender, event, payload: received.append(("wild", event)))
+        mediator.subscribe("trip.finished", lambda sender, event, payload: received.append(("one", payload)))
+        mediator.subscribe("*", lambda sender, event, payload: received.append(("all", event)))
+        self.assertEqual(mediator.notify(None, "trip.finished", 42), 3)
+        self.assertEqual(received, [("wild", "trip.finished"), ("one", 42), ("all", "trip.finished")])
+        self.assertEqual(mediator.notify(None, "payment.done"), 1)
+
+    def test_unsubscribe_invalidates_table(self) -> None:
+        """
+        unsubscribed handlers are no longer called.
+        """
+        mediator = EventMediator()
+        calls = []
+        token = mediator.subscribe("driver", lambda sender, event, payload: calls.append(event))
+        mediator.notify(None, "driver")
+        mediator.unsubscribe(token)
+        self.assertEqual(mediator.notify(None, "driver"), 0)
+        self.assertEqual(calls, ["driver"])
+
+    def test_components(self) -> None:
+        """
+        the driver and payment components behind the event table.
+        """
+        driver, payment = Driver(), Payment()
+        mediator = EventMediator()
+        mediator.subscribe("driver", lambda sender, event, payload: driver.finish_trip())
+        mediator.subscribe("payment", lambda sender, event, payload: payment.pay())
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            mediator.notify(None, "driver")
+            mediator.notify(None, "payment")
+        self.assertEqual(
+            stdout.getvalue().splitlines(), ["trip finished successfully", "payment was successfull"]
+        )
+
+    def test_async_delivery(self) -> None:
+        """
+        coroutine handlers are awaited concurrently by anotify.
+        """
+        mediator = EventMediator()
+        received = []
+
+        async def slow(sender, event, payload) -> None:
+            await asyncio.sleep(0.05)
+            received.append(payload)
+
+        for _ in range(5):
+            mediator.subscribe("trip.*", slow)
+        mediator.subscribe("trip.started", lambda sender, event, payload: received.append("sync"))
+
+        started_at = time.perf_counter()
+        asyncio.run(mediator.anotify(None, "trip.started", "async"))
+        self.assertLess(time.perf_counter() - started_at, 0.2)
+        self.assertEqual(sorted(received), ["async"] * 5 + ["sync"])
+
+    def test_notify_skips_coroutines_loudly(self) -> None:
+        """
+        notify warns about coroutine handlers and does not count them.
+        """
+        mediator = EventMediator()
+
+        async def handler(sender, event, payload) -> None:
+            """
+            coroutine subscriber.
+            """
+
+        mediator.subscribe("trip.*", handler)
+        mediator.subscribe("trip.started", lambda sender, event, payload: None)
+        with self.assertWarns(RuntimeWarning):
+            self.assertEqual(mediator.notify(None, "trip.started"), 1)
+
+    def test_anotify_closes_coroutines_on_error(self) -> None:
+        """
+        a raising sync handler does not leave created coroutines behind.
+        """
+        mediator = EventMediator()
+
+        async def handler(sender, event, payload) -> None:
+            """
+            coroutine subscriber.
+            """
+
+        def fail(sender, event, payload) -> None:
+            raise ValueError("boom")
+
+        mediator.subscribe("trip", handler)
+        mediator.subscribe("trip", fail)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            with self.assertRaises(ValueError):
+                asyncio.run(mediator.anotify(None, "trip"))
+            gc.collect()
+        self.assertFalse([warning for warning in caught if "never awaited" in str(warning.message)])
+
+    def test_table_is_bounded(self) -> None:
+        """
+        the handler table keeps only the most recent event names.
+        """
+        mediator = EventMediator(table_size=100)
+        mediator.subscribe("trip.*", lambda sender, event, payload: None)
+        for trip_id in range(1_000):
+            mediator.notify(None, f"trip.{trip_id}")
+        self.assertEqual(len(mediator._table), 100)  # pylint: disable=W0212
+        self.assertIn("trip.999", mediator._table)  # pylint: disable=W0212
+
+    def test_benchmark(self) -> None:
+        """
+        table dispatch beats linear matching with many subscribers.
+        """
+        results = benchmark(subscriber_counts=(10, 300), events=5_000)
+        for row in results:
+            print(row)
+        self.assertGreater(results[-1]["table_events_per_second"], results[-1]["linear_events_per_second"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+"""
+The compiled handler chain runs long middleware-style chains of
+responsibility without recursion. Handlers are still linked one to the
+next like the cash dispensers, but instead of every handler calling
+`self.next_handler.handle(...)` (one stack frame per hop, and a
+RecursionError past ~1000 handlers) the chain is compiled once into a flat
+tuple that a plain loop walks.
+
+Handlers declare the request kinds they accept. Compilation builds an index
+from kind to the handlers that apply, in chain order, so a request only
+visits the handlers of its kind plus the ones that accept everything.
+
+usage:
+    head = KindHandler("auth")
+    head.set_next(KindHandler("payment")).set_next(FinalHandler())
+    chain = CompiledChain(head)
+    chain.handle(Request("payment", {"amount": 100}))
+"""
+import time
+import typing
+import unittest
+
+
+class Request:
+    """
+    the request travelling through the chain.
+    """
+    def __init__(self, kind: str, payload: typing.Any = None) -> None:
+        self.kind = kind
+        self.payload = payload
+        self.visited = 0
+
+
+class Handler:
+    """
+    Handler interface.
+
+    kinds is the set of request kinds the handler accepts, an empty set
+    accepts every kind. handle returns None to pass the request on and
+    anything else to stop the chain with that result.
+    """
+    kinds: typing.FrozenSet[str] = frozenset()
+
+    def __init__(self) -> None:
+        self.next_handler: typing.Optional["Handler"] = None
+
+    def set_next(self, handler: "Handler") -> "Handler":
+        """
+        link the next handler and return it for chaining.
+        """
+        self.next_handler = handler
+        return handler
+
+    def accepts(self, kind: str) -> bool:
+        """
+        whether the handler applies to the kind.
+        """
+        return not self.kinds or kind in self.kinds
+
+    def handle(self, request: Request) -> typing.Any:
+        """
+        process the request.
+        """
+        request.visited += 1
+
+    def handle_recursive(self, request: Request) -> typing.Any:
+        """
+        the classic recursive walk, kept as the baseline.
+        """
+        result = self.handle(request) if self.accepts(request.kind) else None
+        if result is None and self.next_handler is not None:
+            return self.next_handler.handle_recursive(request)
+        return result
+
+
+class CompiledChain:
+    """
+    the linked chain flattened into per-kind handler tuples.
+    """
+    def __init__(self, head: Handler) -> None:
+        self.handlers: typing.Tuple[Handler, ...] = ()
+        self.index: typing.Dict[str, typing.Tuple[Handler, ...]] = {}
+        self.fallback: typing.Tuple[Handler, ...] = ()
+        self.compile(head)
+
+    def compile(self, head: Handler) -> None:
+        """
+        walk the links once and rebuild the index; call again after relinking.
+        """
+        handlers = []
+        seen = set()
+        handler = head
+        while handler is not None:
+            if id(handler) in seen:
+                raise ValueError("the handler chain contains a cycle")
+            seen.add(id(handler))
+            handlers.append(handler)
+            handler = handler.next_handler
+
+        kinds = set()
+        for handler in handlers:
+            kinds.update(handler.kinds)
+
+        self.handlers = tuple(handlers)
+        self.fallback = tuple(handler for handler in handlers if not handler.kinds)
+        self.index = {
+            kind: tuple(handler for handler in handlers if handler.accepts(kind))
+            for kind in kinds
+        }
+
+    def handle(self, request: Request) -> typing.Any:
+        """
+        run the request through the handlers of its kind.
+        """
+        for handler in self.index.get(request.kind, self.fallback):
+            result = handler.handle(request)
+            if result is not None:
+                return result
+        return None
+
+
+class KindHandler(Handler):
+    """
+    handler for a single kind, used by the benchmark.
+    """
+    def __init__(self, kind: str) -> None:
+        super().__init__()
+        self.kinds = frozenset({kind})
+
+
+class FinalHandler(Handler):
+    """
+    handler that accepts everything and completes the request.
+    """
+    def handle(self, request: Request) -> typing.Any:
+        request.visited += 1
+        return request.visited
+
+
+def build(length: int, kinds: int = 10) -> Handler:
+    """
+    a chain of `length` single-kind handlers closed by a final handler.
+    """
+    head = handler = KindHandler("kind-0")
+    for position in range(1, length - 1):
+        handler = handler.set_next(KindHandler(f"kind-{position % kinds}"))
+    handler.set_next(FinalHandler())
+    return head
+
+
+def benchmark(lengths: typing.Sequence[int] = (10, 100, 1000), requests: int = 2_000) -> typing.List[dict]:
+    """
+    requests per second of the recursive walk and the compiled chain.
+    """
+    results = []
+    for length in lengths:
+        head = build(length)
+        chain = CompiledChain(head)
+        batch = [Request(f"kind-{position % 10}") for position in range(requests)]
+
+        started_at = time.perf_counter()
+        for request in batch:
+            chain.handle(request)
+        compiled = requests / (time.perf_counter() - started_at)
+
+        try:
+            started_at = time.perf_counter()
+            for request in batch:
+                head.handle_recursive(request)
+            recursive: typing.Any = requests / (time.perf_counter() - started_at)
+        except RecursionError:
+            recursive = "RecursionError"
+
+        results.append({"handlers": length, "compiled": compiled, "recursive": recursive})
+    return results
+
+
+class TestCompiledChain(unittest.TestCase):
+    """
+    test compiled chain.
+    """
+    def test_same_result_as_recursive(self) -> None:
+        """
+        the compiled chain stops where the recursive walk stops.
+        """
+        head = build(50)
+        chain = CompiledChain(head)
+        for kind in ("kind-3", "kind-7", "unknown"):
+            self.assertEqual(chain.handle(Request(kind)), head.handle_recursive(Request(kind)))
+
+    def test_visits_only_matching_handlers(self) -> None:
+        """
+        a request visits its own kind's handlers and the catch-all ones.
+        """
+        chain = CompiledChain(build(100))
+        request = Request("kind-3")
+        self.assertEqual(chain.handle(request), 11)
+        self.assertEqual(chain.handle(Request("unknown")), 1)
+
+    def test_no_recursion_limit(self) -> None:
+        """
+        a chain far beyond the recursion limit still runs.
+        """
+        head = build(5_000, kinds=1)
+        with self.assertRaises(RecursionError):
+            head.handle_recursive(Request("kind-0"))
+        self.assertEqual(CompiledChain(head).handle(Request("kind-0")), 5_000)
+
+    def test_cycle_rejected(self) -> None:
+        """
+        a chain linked back to itself cannot be compiled.
+        """
+        head = Handler()
+        head.set_next(Handler()).set_next(head)
+        with self.assertRaises(ValueError):
+            CompiledChain(head)
+
+    def test_benchmark(self) -> None:
+        """
+        the compiled chain outruns the recursive walk at every length.
+        """
+        for result in benchmark(lengths=(10, 100), requests=500):
+            print(result)
+            self.assertGreater(result["compiled"], result["recursive"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,335 @@
+"""
+The macro command queues several commands, simplifies the queue and runs
+what is left as one undoable unit.
+
+Simplification rules:
+    1) setters: commands that declare a coalesce_key overwrite one piece of
+        receiver state, so only the last writer of a key counts, e.g.
+        light on, light off -> light off, and light on, undo light on ->
+        light off. The key's attribute is read before the macro runs; undo
+        replays the inverse of the last writer through the receiver's own
+        methods whenever the attribute changed, and falls back to the
+        receiver's snapshot()/restore() only if that does not bring the old
+        value back.
+
+    2) inverse pairs: any other command followed by its own undo cancels
+        out, since undo reverses execute.
+
+    3) repeats: the same idempotent command twice in a row runs once.
+
+A command without a coalesce_key is a barrier: setters are never merged
+across it.
+
+usage:
+    macro = MacroCommand()
+    macro.add(LightOnCommand(light)).add(LightOffCommand(light))
+    remote.set_command(macro)
+    remote.press_button()
+"""
+import random
+import typing
+import unittest
+from io import StringIO
+from unittest.mock import patch
+
+from .command import Command, LightOffCommand, LightOnCommand, Light, RemoteControl
+
+Step = typing.Tuple[Command, bool]  # (command, run its undo instead of execute)
+
+
+class MacroCommand(Command):
+    """
+    Composite command that coalesces its queue before running it.
+    """
+    def __init__(self, commands: typing.Iterable[Command] = ()) -> None:
+        self.queue: typing.List[Step] = [(command, False) for command in commands]
+        self.plan: typing.List[Step] = []
+        self._before: typing.List[typing.Tuple[Step, typing.Any, typing.Any]] = []
+
+    def add(self, command: Command) -> "MacroCommand":
+        """
+        queue the execution of the command.
+        """
+        self.queue.append((command, False))
+        return self
+
+    def add_undo(self, command: Command) -> "MacroCommand":
+        """
+        queue the undo of the command.
+        """
+        self.queue.append((command, True))
+        return self
+
+    @staticmethod
+    def _setter_key(command: Command) -> typing.Optional[tuple]:
+        key = command.coalesce_key()
+        if key is None or not hasattr(key[0], "snapshot") or not hasattr(key[0], key[1]):
+            return None
+        return key
+
+    def simplify(self) -> typing.List[Step]:
+        """
+        the queue with redundant steps removed.
+        """
+        stack: typing.List[typing.Optional[Step]] = []
+        last_writer: typing.Dict[tuple, int] = {}
+        barrier = 0
+
+        for command, inverted in self.queue:
+            key = self._setter_key(command)
+            if key is not None:
+                index = last_writer.get(key)
+                if index is not None and index >= barrier:
+                    stack[index] = None
+                last_writer[key] = len(stack)
+                stack.append((command, inverted))
+                continue
+
+            top = stack[-1] if stack else None
+            if top is not None and top[0] is command:
+                if top[1] != inverted:
+                    stack.pop()
+                    while stack and stack[-1] is None:
+                        stack.pop()
+                    barrier = len(stack)
+                    continue
+                if command.idempotent:
+                    continue
+            stack.append((command, inverted))
+            barrier = len(stack)
+
+        return [step for step in stack if step is not None]
+
+    def execute(self) -> None:
+        self.plan = self.simplify()
+        last_writer: typing.Dict[typing.Tuple[int, str], Step] = {}
+        before = {}
+        for command, inverted in self.plan:
+            key = self._setter_key(command)
+            if key is not None:
+                receiver, attribute = key
+                last_writer[(id(receiver), attribute)] = (command, inverted)
+                if id(receiver) not in before:
+                    before[id(receiver)] = receiver.snapshot()
+        self._before = [
+            (step, getattr(step[0].coalesce_key()[0], attribute), before[receiver_id])
+            for (receiver_id, attribute), step in last_writer.items()
+        ]
+
+        for command, inverted in self.plan:
+            if inverted:
+                command.undo()
+            else:
+                command.execute()
+
+    def undo(self) -> None:
+        for command, inverted in reversed(self.plan):
+            if self._setter_key(command) is not None:
+                continue
+            if inverted:
+                command.execute()
+            else:
+                command.undo()
+        for (command, inverted), old, state in reversed(self._before):
+            receiver, attribute = command.coalesce_key()
+            if getattr(receiver, attribute) == old:
+                continue
+            if inverted:
+                command.execute()
+            else:
+                command.undo()
+            if getattr(receiver, attribute) != old:
+                receiver.restore(state)
+
+
+class CountingLight(Light):
+    """
+    Light that counts receiver calls instead of printing.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+
+    def turn_on(self):
+        self.calls += 1
+        self.is_on = True
+
+    def turn_off(self):
+        self.calls += 1
+        self.is_on = False
+
+
+class Volume:
+    """
+    receiver with relative changes.
+    """
+    def __init__(self) -> None:
+        self.level = 0
+        self.calls = 0
+
+
+class VolumeUpCommand(Command):
+    """
+    raise the volume by one step.
+    """
+    def __init__(self, volume: Volume) -> None:
+        self.volume = volume
+
+    def execute(self) -> None:
+        self.volume.calls += 1
+        self.volume.level += 1
+
+    def undo(self) -> None:
+        self.volume.calls += 1
+        self.volume.level -= 1
+
+
+def benchmark(macros: int = 1_000, length: int = 20, seed: int = 5) -> typing.Dict[str, float]:
+    """
+    receiver calls of running every step against running the coalesced
+    macros, on streams of light switches, volume changes and undos.
+    """
+    rnd = random.Random(seed)
+    lights = [CountingLight() for _ in range(3)]
+    volume = Volume()
+    commands: typing.List[Command] = [VolumeUpCommand(volume)]
+    for light in lights:
+        commands += [LightOnCommand(light), LightOffCommand(light)]
+
+    streams = []
+    for _ in range(macros):
+        macro = MacroCommand()
+        for _ in range(length):
+            if macro.queue and rnd.random() < 0.2:
+                macro.add_undo(macro.queue[-1][0])
+            else:
+                macro.add(rnd.choice(commands))
+        streams.append(macro)
+
+    naive = sum(len(macro.queue) for macro in streams)
+
+    for receiver in lights + [volume]:
+        receiver.calls = 0
+    remote = RemoteControl()
+    for macro in streams:
+        remote.set_command(macro)
+        remote.press_button()
+    coalesced = sum(receiver.calls for receiver in lights + [volume])
+    return {"naive_calls": naive, "coalesced_calls": coalesced, "saved": 1 - coalesced / naive}
+
+
+class TestMacroCommand(unittest.TestCase):
+    """
+    test macro command.
+    """
+    def setUp(self) -> None:
+        self.light = CountingLight()
+        self.on = LightOnCommand(self.light)
+        self.off = LightOffCommand(self.light)
+        self.volume = Volume()
+        self.up = VolumeUpCommand(self.volume)
+
+    def test_on_then_undo_is_one_call(self) -> None:
+        """
+        a light switched on and undone needs a single receiver call.
+        """
+        macro = MacroCommand().add(self.on).add_undo(self.on)
+        self.assertEqual(macro.simplify(), [(self.on, True)])
+        self.light.is_on = True
+        macro.execute()
+        self.assertFalse(self.light.is_on)
+        self.assertEqual(self.light.calls, 1)
+
+    def test_last_writer_wins(self) -> None:
+        """
+        on, on, off, on collapses to the last on.
+        """
+        macro = MacroCommand([self.on, self.on, self.off, self.on])
+        self.assertEqual(macro.simplify(), [(self.on, False)])
+
+    def test_inverse_pairs_cancel(self) -> None:
+        """
+        a relative command followed by its undo disappears.
+        """
+        macro = MacroCommand([self.up, self.up]).add_undo(self.up).add_undo(self.up)
+        self.assertEqual(macro.simplify(), [])
+
+    def test_barrier(self) -> None:
+        """
+        setters are not merged across a command without a key.
+        """
+        macro = MacroCommand([self.on, self.up, self.off])
+        self.assertEqual(len(macro.simplify()), 3)
+
+    def test_undo_as_one_unit(self) -> None:
+        """
+        undo restores every receiver the macro touched.
+        """
+        macro = MacroCommand([self.up, self.on, self.up, self.off, self.on])
+        remote = RemoteControl()
+        remote.set_command(macro)
+        remote.press_button()
+        self.assertEqual((self.light.is_on, self.volume.level), (True, 2))
+        remote.press_undo()
+        self.assertEqual((self.light.is_on, self.volume.level), (False, 0))
+        remote.press_redo()
+        self.assertEqual((self.light.is_on, self.volume.level), (True, 2))
+
+    def test_undo_goes_through_the_receiver(self) -> None:
+        """
+        undoing a macro calls the receiver's methods, not restore().
+        """
+        light = Light()
+        remote = RemoteControl()
+        remote.set_command(MacroCommand([LightOnCommand(light)]))
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            remote.press_button()
+            remote.press_undo()
+        self.assertEqual(stdout.getvalue(), "Light is on\nLight is off\n")
+        self.assertFalse(light.is_on)
+
+        light.is_on = True
+        macro = MacroCommand([LightOnCommand(light)])
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            macro.execute()
+            macro.undo()
+        self.assertEqual(stdout.getvalue(), "Light is on\n")
+        self.assertTrue(light.is_on)
+
+    def test_same_final_state_as_naive(self) -> None:
+        """
+        the coalesced macro ends in the same state as running every step.
+        """
+        rnd = random.Random(1)
+        for _ in range(200):
+            light, volume = CountingLight(), Volume()
+            commands = [LightOnCommand(light), LightOffCommand(light), VolumeUpCommand(volume)]
+            macro = MacroCommand()
+            for _ in range(10):
+                if macro.queue and rnd.random() < 0.3:
+                    macro.add_undo(macro.queue[-1][0])
+                else:
+                    macro.add(rnd.choice(commands))
+            for command, inverted in macro.queue:
+                if inverted:
+                    command.undo()
+                else:
+                    command.execute()
+            expected = (light.is_on, volume.level)
+            light.is_on, volume.level = False, 0
+            macro.execute()
+            self.assertEqual((light.is_on, volume.level), expected)
+            macro.undo()
+            self.assertEqual((light.is_on, volume.level), (False, 0))
+
+    def test_benchmark(self) -> None:
+        """
+        realistic streams save receiver calls.
+        """
+        result = benchmark(macros=200)
+        print(result)
+        self.assertLess(result["coalesced_calls"], result["naive_calls"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,49 +5,317 @@ for monitoring and reacting to changes in a system.
 This pattern is especially useful in scenarios where an
 object,known as the subject, needs to automatically notify a
 list of other objects,known as observers, about any state changes.
+
+The subject keeps its observers in an insertion-ordered registry keyed by
+identity and holds them through weak references: attach and detach are
+O(1) and an observer that is no longer referenced anywhere else drops out
+of the registry on its own instead of leaking.
+
+Observers that only care about some states subscribe with a predicate,
+Equals(value) or Range(low, high), either passed to attach or declared as
+a `predicate` attribute. The subject indexes them, equality in a hash
+table and ranges by their sorted end points, so notify only calls the
+observers whose predicate matches instead of fanning out to everyone.
+Unconditional observers are called first, then the matching ones in
+subscription order.
+
+Bulk updates can defer notification. Inside `with subject.batch():` state
+assignments are only recorded, and when the outermost batch exits the
+observers are notified once, of the final state. In debounce mode
+(`subject.debounce(seconds)`) the same happens on a timer thread once the
+state has been quiet for that long. Observers that set `wants_changes`
+receive update_many(subject, changes) instead, with every state assigned
+meanwhile, repeated values collapsed.
 """
 import abc
+import bisect
+import contextlib
+import itertools
+import random
+import threading
+import time
+import typing
+import unittest
+import weakref
+
+
+class Equals:
+    """
+    predicate: the state equals value.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def matches(self, state):
+        """
+        whether the predicate holds for the state.
+        """
+        return state == self.value
+
+
+class Range:
+    """
+    predicate: low <= state < high, None leaves a side open.
+    """
+    __slots__ = ("low", "high")
+
+    def __init__(self, low=None, high=None):
+        self.low = low
+        self.high = high
+
+    def matches(self, state):
+        """
+        whether the predicate holds for the state.
+        """
+        return (self.low is None or self.low <= state) and (self.high is None or state < self.high)
+
+
+class PredicateIndex:
+    """
+    the predicate subscriptions of a subject, indexed for lookup by state.
+
+    equality predicates live in a hash table and are added and removed in
+    O(1). the sorted end points of all ranges cut the line into segments,
+    and every range is stored in the O(log n) nodes of a segment tree
+    covering its segments; a lookup collects the nodes on one leaf-to-root
+    path. ranges added or removed since the tree was built are kept aside
+    (checked one by one, filtered out) until there are enough of them to
+    pay for a rebuild, so attach and detach stay cheap.
+    """
+    def __init__(self, predicates: typing.Optional[typing.Dict[int, typing.Any]] = None) -> None:
+        self.equal: typing.Dict[typing.Any, typing.Dict[int, int]] = {}
+        self.ranges: typing.Dict[int, typing.Tuple[int, Range]] = {}
+        self.others: typing.Dict[int, typing.Tuple[int, typing.Any]] = {}
+        self._entries: typing.Dict[int, typing.Tuple[int, typing.Any]] = {}
+        self._sequence = itertools.count()
+        self._added: typing.Dict[int, typing.Tuple[int, Range]] = {}
+        self._removed: typing.Set[int] = set()
+        self.rebuilds = 0
+        self.bounds: typing.List[typing.Any] = []
+        self.size = 1
+        self.nodes: typing.Dict[int, typing.List[typing.Tuple[int, int]]] = {}
+        for key, predicate in (predicates or {}).items():
+            self.add(key, predicate)
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: int, predicate) -> None:
+        """
+        subscribe the key, replacing its previous predicate.
+        """
+        self.discard(key)
+        entry = (next(self._sequence), predicate)
+        self._entries[key] = entry
+        if isinstance(predicate, Equals):
+            try:
+                self.equal.setdefault(predicate.value, {})[key] = entry[0]
+                return
+            except TypeError:
+                pass
+        elif isinstance(predicate, Range):
+            self.ranges[key] = entry
+            self._added[key] = entry
+            return
+        self.others[key] = entry
+
+    def discard(self, key: int) -> None:
+        """
+        unsubscribe the key if it is subscribed.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        predicate = entry[1]
+        if self.others.pop(key, None) is not None:
+            return
+        if isinstance(predicate, Equals):
+            bucket = self.equal[predicate.value]
+            del bucket[key]
+            if not bucket:
+                del self.equal[predicate.value]
+        elif self._added.pop(key, None) is None:
+            self._removed.add(key)
+            del self.ranges[key]
+        else:
+            del self.ranges[key]
+
+    def _build(self) -> None:
+        self.rebuilds += 1
+        self._added.clear()
+        self._removed.clear()
+        bounds = {bound for _, predicate in self.ranges.values() for bound in (predicate.low, predicate.high)}
+        bounds.discard(None)
+        self.bounds = sorted(bounds)
+        self.size = 1
+        while self.size < len(self.bounds) + 1:
+            self.size *= 2
+        self.nodes = {}
+        for key, (order, predicate) in self.ranges.items():
+            first = 0 if predicate.low is None else bisect.bisect_right(self.bounds, predicate.low)
+            last = self.size if predicate.high is None else bisect.bisect_right(self.bounds, predicate.high)
+            first += self.size
+            last += self.size
+            while first < last:
+                if first & 1:
+                    self.nodes.setdefault(first, []).append((order, key))
+                    first += 1
+                if last & 1:
+                    last -= 1
+                    self.nodes.setdefault(last, []).append((order, key))
+                first //= 2
+                last //= 2
+
+    def match(self, state) -> typing.List[int]:
+        """
+        keys of the subscriptions matching the state, in subscription order.
+        """
+        if len(self._added) + len(self._removed) > 64 + len(self.ranges) // 16:
+            self._build()
+        try:
+            matched = [(order, key) for key, order in self.equal.get(state, {}).items()]
+        except TypeError:
+            matched = []
+        if self.nodes:
+            try:
+                node = bisect.bisect_right(self.bounds, state) + self.size
+            except TypeError:
+                node = 0
+            removed = self._removed
+            while node:
+                matched += [entry for entry in self.nodes.get(node, ()) if entry[1] not in removed]
+                node //= 2
+        for key, (order, predicate) in self._added.items():
+            try:
+                if predicate.matches(state):
+                    matched.append((order, key))
+            except TypeError:
+                pass
+        matched += [
+            (order, key) for key, (order, predicate) in self.others.items() if predicate.matches(state)
+        ]
+        matched.sort()
+        return [key for _, key in matched]
 
 
 class Observer(abc.ABC):
     """
     the oberver abstraction.
     """
+    predicate = None
+    wants_changes = False
+
     def update(self, subject):
         """
         updater.
         """
 
+    def update_many(self, subject, changes):
+        """
+        updater for deferred notifications, changes lists the states
+        assigned since the last one.
+        """
+        self.update(subject)
+
 
 class Subject:
     """
     the subject class.
     """
     def __init__(self):
-        self._observers = []
+        self._observers = weakref.WeakValueDictionary()
+        self._filtered = weakref.WeakValueDictionary()
+        self._predicates = {}
+        self._index = PredicateIndex()
         self._state = None
+        self._lock = threading.Lock()
+        self._changes = []
+        self._batch_depth = 0
+        self._debounce_interval = None
+        self._deadline = 0.0
+        self._timer = None
 
-    def attach(self, observer):
+    def attach(self, observer, predicate=None):
         """
-        attacher
+        attacher, O(1); the observer is held weakly.
+        with a predicate it is only notified of the states matching it.
         """
-        if observer not in self._observers:
-            self._observers.append(observer)
+        key = id(observer)
+        if predicate is None:
+            predicate = getattr(observer, "predicate", None)
+        with self._lock:
+            if predicate is None:
+                self._drop_filtered(key, observer)
+                self._observers.setdefault(key, observer)
+            else:
+                if self._observers.get(key) is observer:
+                    del self._observers[key]
+                self._filtered[key] = observer
+                self._predicates[key] = predicate
+                self._index.add(key, predicate)
 
     def detach(self, observer):
         """
-        detacher.
+        detacher, O(1).
         """
-        try:
-            self._observers.remove(observer)
-        except ValueError:
-            pass
+        key = id(observer)
+        with self._lock:
+            if self._observers.get(key) is observer:
+                del self._observers[key]
+            self._drop_filtered(key, observer)
+
+    def _drop_filtered(self, key, observer):
+        if self._filtered.get(key) is observer:
+            del self._filtered[key]
+            del self._predicates[key]
+            self._index.discard(key)
+
+    @property
+    def observers(self):
+        """
+        the live observers: the unconditional ones in attach order, then
+        the ones with a predicate in subscription order.
+        """
+        with self._lock:
+            return list(self._observers.values()) + list(self._filtered.values())
+
+    def matching(self, state):
+        """
+        the observers to notify of the state.
+        """
+        with self._lock:
+            return list(self._observers.values()) + self._match_filtered(state)
+
+    def _match_filtered(self, state):
+        # call with the lock held: purges dead keys from the index
+        matched = []
+        if self._predicates:
+            dead = []
+            for key in self._index.match(state):
+                observer = self._filtered.get(key)
+                if observer is None:
+                    dead.append(key)
+                else:
+                    matched.append(observer)
+            for key in dead:
+                del self._predicates[key]
+                self._index.discard(key)
+        return matched
 
     def notify(self):
         """
         notifier.
         """
-        for observer in self._observers:
+        for observer in self.matching(self._state):
+            self._deliver(observer, None)
+
+    def _deliver(self, observer, changes):
+        if changes is not None and getattr(observer, "wants_changes", False):
+            observer.update_many(self, changes)
+        else:
             observer.update(self)
 
     @property
@@ -60,13 +328,99 @@ class Subject:
     @state.setter
     def state(self, value):
         self._state = value
-        self.notify()
+        if self._batch_depth or self._debounce_interval is not None:
+            self._defer(value)
+        else:
+            self.notify()
+
+    def _defer(self, value):
+        with self._lock:
+            if not self._changes or self._changes[-1] != value:
+                self._changes.append(value)
+        if self._debounce_interval is not None and not self._batch_depth:
+            self._schedule()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        defer notifications until the outermost batch exits.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                if self._debounce_interval is None:
+                    self.flush()
+                elif self._changes:
+                    self._schedule()
+
+    def debounce(self, interval):
+        """
+        notify only after interval seconds without state changes;
+        None switches back to immediate notification.
+        """
+        self._debounce_interval = interval
+        if interval is None:
+            with self._lock:
+                timer, self._timer = self._timer, None
+            if timer is not None:
+                timer.cancel()
+            self.flush()
+
+    def _schedule(self):
+        with self._lock:
+            self._deadline = time.monotonic() + self._debounce_interval
+            if self._timer is None:
+                self._timer = threading.Timer(self._debounce_interval, self._on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            remaining = self._deadline - time.monotonic()
+            if remaining > 0 or self._batch_depth:
+                self._timer = threading.Timer(max(remaining, 0.001), self._on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+            self._timer = None
+        self.flush()
+
+    def flush(self):
+        """
+        deliver the deferred notifications now.
+        """
+        with self._lock:
+            changes, self._changes = self._changes, []
+        if not changes:
+            return
+        matched = self.matching(self._state)
+        for observer in matched:
+            self._deliver(observer, changes)
+
+        # change list observers also hear about states they matched in between;
+        # only the index is asked, the unconditional observers were all notified
+        if len(changes) > 1 and self._predicates:
+            notified = {id(observer) for observer in matched}
+            late = []
+            with self._lock:
+                for state in changes[:-1]:
+                    for observer in self._match_filtered(state):
+                        if id(observer) not in notified and getattr(observer, "wants_changes", False):
+                            notified.add(id(observer))
+                            late.append(observer)
+            for observer in late:
+                self._deliver(observer, changes)
 
 
 class ConcreteObserverA(Observer):
     """
     implementation of Observer.
     """
+    predicate = Range(high=3)
+
     def update(self, subject):
         if subject.state < 3:
             print("ConcreteObserverA: Reacted to event")
@@ -76,20 +430,449 @@ class ConcreteObserverB(Observer):
     """
     implementation of Observer.
     """
+    predicate = Range(low=3)
+
     def update(self, subject):
         if subject.state >= 3:
             print("ConcreteObserverB: Reacted to event")
 
 
-subject = Subject()
+class ListSubject(Subject):
+    """
+    the same subject over a plain list with strong references, the baseline.
+    """
+    def __init__(self):
+        super().__init__()
+        self._observers = []
+
+    def attach(self, observer, predicate=None):
+        if observer not in self._observers:
+            self._observers.append(observer)
+
+    def detach(self, observer):
+        try:
+            self._observers.remove(observer)
+        except ValueError:
+            pass
+
+    @property
+    def observers(self):
+        return list(self._observers)
+
+    def matching(self, state):
+        return list(self._observers)
+
+
+class CountingObserver(Observer):
+    """
+    observer that counts its updates.
+    """
+    def __init__(self):
+        self.updates = 0
+
+    def update(self, subject):
+        self.updates += 1
+
+
+class FilteringObserver(CountingObserver):
+    """
+    observer that filters on its predicate itself, as ConcreteObserverA does.
+    """
+    def __init__(self, predicate):
+        super().__init__()
+        self.predicate = predicate
+
+    def update(self, subject):
+        if self.predicate.matches(subject.state):
+            self.updates += 1
+
+
+def selectivity_benchmark(
+    observer_counts: typing.Sequence[int] = (100, 1_000, 10_000, 100_000), notifications: int = 1_000
+) -> typing.List[typing.Dict[str, float]]:
+    """
+    seconds per notify of the predicate index against full fan-out, when
+    each state matches about one observer in a thousand (or one at least).
+    the index is built by a first notify outside the timing.
+    """
+    results = []
+    for count in observer_counts:
+        row: typing.Dict[str, float] = {"observers": count}
+        width = max(count // 1_000, 1)
+        population = [
+            FilteringObserver(Equals(index) if index % 2 else Range(index, index + width))
+            for index in range(count)
+        ]
+        states = [(index * 7919) % count for index in range(notifications)]
+        for label, subject_class in (("indexed", Subject), ("fan_out", ListSubject)):
+            subject_ = subject_class()
+            for observer in population:
+                subject_.attach(observer)
+            subject_.state = states[0]
+            started_at = time.perf_counter()
+            for state in states:
+                subject_.state = state
+            row[f"{label}_seconds_per_notify"] = (time.perf_counter() - started_at) / notifications
+        results.append(row)
+    return results
+
+
+class ChangeListObserver(CountingObserver):
+    """
+    observer that keeps the change lists it receives.
+    """
+    wants_changes = True
+
+    def __init__(self):
+        super().__init__()
+        self.received = []
+
+    def update_many(self, subject, changes):
+        self.updates += 1
+        self.received.append(list(changes))
+
+
+def batch_benchmark(observers: int = 100, changes: int = 1_000) -> typing.Dict[str, typing.Dict[str, float]]:
+    """
+    update calls and seconds for `changes` state assignments, notified
+    immediately, in one batch and debounced.
+    """
+    results = {}
+    for label in ("immediate", "batch", "debounce"):
+        subject_ = Subject()
+        population = [CountingObserver() for _ in range(observers)]
+        for observer in population:
+            subject_.attach(observer)
+        if label == "debounce":
+            subject_.debounce(0.01)
+
+        started_at = time.perf_counter()
+        with subject_.batch() if label == "batch" else contextlib.nullcontext():
+            for value in range(changes):
+                subject_.state = value % 10
+        if label == "debounce":
+            subject_.debounce(None)
+        elapsed = time.perf_counter() - started_at
+        results[label] = {
+            "update_calls": sum(observer.updates for observer in population), "seconds": elapsed
+        }
+    return results
+
+
+def benchmark(observers: int = 100_000) -> typing.Dict[str, typing.Dict[str, float]]:
+    """
+    seconds to attach, notify once and detach `observers` observers.
+    the list baseline is quadratic, so it is measured on a tenth of them
+    and scaled up.
+    """
+    results = {}
+    population = [CountingObserver() for _ in range(observers)]
+    for label, subject_class, size in (
+        ("registry", Subject, observers), ("list", ListSubject, max(observers // 10, 1))
+    ):
+        sample = population[:size]
+        subject_ = subject_class()
+        timings = {}
+
+        started_at = time.perf_counter()
+        for observer in sample:
+            subject_.attach(observer)
+        timings["attach"] = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        subject_.notify()
+        timings["notify"] = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        for observer in reversed(sample):
+            subject_.detach(observer)
+        timings["detach"] = time.perf_counter() - started_at
+
+        scale = observers / size
+        results[label] = {
+            step: seconds * (scale ** 2 if step != "notify" else scale) for step, seconds in timings.items()
+        }
+    return results
+
+
+class TestSubject(unittest.TestCase):
+    """
+    test subject.
+    """
+    def test_attach_order_and_duplicates(self) -> None:
+        """
+        observers are notified once each, in attach order.
+        """
+        calls = []
+
+        class Recording(Observer):
+            """
+            record the update order.
+            """
+            def __init__(self, name):
+                self.name = name
+
+            def update(self, subject):
+                calls.append(self.name)
+
+        first, second, third = Recording("first"), Recording("second"), Recording("third")
+        subject_ = Subject()
+        for observer in (first, second, first, third):
+            subject_.attach(observer)
+        subject_.detach(second)
+        subject_.detach(second)
+        subject_.state = 1
+        self.assertEqual(calls, ["first", "third"])
+
+    def test_dead_observers_are_dropped(self) -> None:
+        """
+        an observer nobody else references leaves the registry.
+        """
+        subject_ = Subject()
+        kept = CountingObserver()
+        subject_.attach(kept)
+        subject_.attach(CountingObserver())
+        self.assertEqual(subject_.observers, [kept])
+        subject_.state = 5
+        self.assertEqual(kept.updates, 1)
+
+    def test_detach_during_notify(self) -> None:
+        """
+        observers may detach themselves while being notified.
+        """
+        class Once(CountingObserver):
+            """
+            detach after the first update.
+            """
+            def update(self, subject):
+                super().update(subject)
+                subject.detach(self)
+
+        subject_ = Subject()
+        observers = [Once() for _ in range(3)]
+        for observer in observers:
+            subject_.attach(observer)
+        subject_.state = 1
+        subject_.state = 2
+        self.assertEqual([observer.updates for observer in observers], [1, 1, 1])
+
+    def test_benchmark(self) -> None:
+        """
+        the registry is faster than the list at scale.
+        """
+        results = benchmark(observers=20_000)
+        print(results)
+        self.assertLess(results["registry"]["detach"], results["list"]["detach"])
+
+
+class TestPredicateIndex(unittest.TestCase):
+    """
+    test predicate subscriptions.
+    """
+    def test_only_matching_observers_are_called(self) -> None:
+        """
+        equality and range predicates select the observers.
+        """
+        low, high, three, every = (CountingObserver() for _ in range(4))
+        subject_ = Subject()
+        subject_.attach(low, Range(high=3))
+        subject_.attach(high, Range(low=3))
+        subject_.attach(three, Equals(3))
+        subject_.attach(every)
+        for state in (1, 2, 3, 7):
+            subject_.state = state
+        self.assertEqual([low.updates, high.updates, three.updates, every.updates], [2, 2, 1, 4])
+
+    def test_declared_predicates(self) -> None:
+        """
+        the concrete observers declare their predicate and see the same events.
+        """
+        subject_ = Subject()
+        observer_a, observer_b = ConcreteObserverA(), ConcreteObserverB()
+        subject_.attach(observer_a)
+        subject_.attach(observer_b)
+        self.assertEqual(subject_.matching(2), [observer_a])
+        self.assertEqual(subject_.matching(3), [observer_b])
+
+    def test_order_detach_and_dead_observers(self) -> None:
+        """
+        matches come in subscription order; detached and dead ones are gone.
+        """
+        subject_ = Subject()
+        first, second, third = (CountingObserver() for _ in range(3))
+        subject_.attach(first, Range(0, 10))
+        subject_.attach(second, Equals(5))
+        subject_.attach(third, Range(5, 6))
+        subject_.attach(CountingObserver(), Equals(5))
+        self.assertEqual(subject_.matching(5), [first, second, third])
+        subject_.detach(second)
+        self.assertEqual(subject_.matching(5), [first, third])
+        self.assertEqual(subject_.matching("not comparable"), [])
+        subject_.attach(first)
+        self.assertEqual(subject_.matching(50), [first])
+
+    def test_incremental_updates(self) -> None:
+        """
+        attach and detach keep the index in step without rebuilding it
+        every time, and it agrees with checking every predicate.
+        """
+        rnd = random.Random(4)
+        index = PredicateIndex()
+        predicates = {}
+        for step in range(3_000):
+            key = rnd.randrange(400)
+            if rnd.random() < 0.3:
+                index.discard(key)
+                predicates.pop(key, None)
+            else:
+                low = rnd.randrange(100)
+                predicate = rnd.choice((Equals(low), Range(low, low + rnd.randrange(1, 30)), Range(high=low)))
+                index.add(key, predicate)
+                predicates.pop(key, None)
+                predicates[key] = predicate
+            if step % 10 == 0:
+                state = rnd.randrange(-5, 130)
+                expected = [key for key, predicate in predicates.items() if predicate.matches(state)]
+                self.assertEqual(index.match(state), expected)
+        self.assertLess(index.rebuilds, 40)
+
+    def test_selectivity_benchmark(self) -> None:
+        """
+        the index is cheaper than fan-out with many observers.
+        """
+        results = selectivity_benchmark(observer_counts=(100, 10_000), notifications=200)
+        for row in results:
+            print(row)
+        self.assertLess(results[-1]["indexed_seconds_per_notify"], results[-1]["fan_out_seconds_per_notify"])
+
+
+class TestBatch(unittest.TestCase):
+    """
+    test deferred notifications.
+    """
+    def test_batch_delivers_final_state_once(self) -> None:
+        """
+        a batch notifies once, after the outermost block.
+        """
+        subject_ = Subject()
+        seen = []
+
+        class Recording(Observer):
+            """
+            record the notified states.
+            """
+            def update(self, subject):
+                seen.append(subject.state)
+
+        observer = Recording()
+        subject_.attach(observer)
+        with subject_.batch():
+            for value in range(100):
+                subject_.state = value
+            with subject_.batch():
+                subject_.state = 7
+            self.assertEqual(seen, [])
+        self.assertEqual(seen, [7])
+        with subject_.batch():
+            pass
+        subject_.state = 8
+        self.assertEqual(seen, [7, 8])
+
+    def test_change_list(self) -> None:
+        """
+        change list observers get the compressed history, also when only
+        an intermediate state matched their predicate.
+        """
+        subject_ = Subject()
+        everything, threes = ChangeListObserver(), ChangeListObserver()
+        subject_.attach(everything)
+        subject_.attach(threes, Equals(3))
+        with subject_.batch():
+            for value in (1, 1, 2, 3, 3, 1):
+                subject_.state = value
+        self.assertEqual(everything.received, [[1, 2, 3, 1]])
+        self.assertEqual(threes.received, [[1, 2, 3, 1]])
+
+    def test_intermediate_states_query_only_the_index(self) -> None:
+        """
+        a batch fans out to the unconditional observers once, not per change.
+        """
+        subject_ = Subject()
+        population = [CountingObserver() for _ in range(1_000)]
+        for observer in population:
+            subject_.attach(observer)
+        subject_.attach(ChangeListObserver(), Equals(3))
+        calls = []
+        original = subject_.matching
+        subject_.matching = lambda state: calls.append(state) or original(state)
+        with subject_.batch():
+            for value in range(500):
+                subject_.state = value
+        self.assertEqual(calls, [499])
+
+    def test_debounced_flush_races_attach(self) -> None:
+        """
+        the timer thread's flush and attach/detach on the caller's thread
+        share the registry safely.
+        """
+        errors = []
+        hook, threading.excepthook = threading.excepthook, errors.append
+        try:
+            subject_ = Subject()
+            subject_.debounce(0.001)
+            kept = []
+            deadline = time.monotonic() + 0.5
+            while time.monotonic() < deadline:
+                observer = ChangeListObserver()
+                kept.append(observer)
+                subject_.attach(observer, Range(0, len(kept) % 50 + 1))
+                subject_.state = len(kept) % 50
+                if len(kept) > 20:
+                    subject_.detach(kept.pop(0))
+            subject_.debounce(None)
+        finally:
+            threading.excepthook = hook
+        self.assertEqual(errors, [])
+
+    def test_debounce(self) -> None:
+        """
+        a burst of changes is delivered once after the quiet period.
+        """
+        subject_ = Subject()
+        observer = ChangeListObserver()
+        subject_.attach(observer)
+        subject_.debounce(0.05)
+        for value in range(50):
+            subject_.state = value
+        self.assertEqual(observer.updates, 0)
+        deadline = time.monotonic() + 2
+        while not observer.updates and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(observer.received, [list(range(50))])
+        subject_.debounce(None)
+        subject_.state = 99
+        self.assertEqual(observer.updates, 2)
+
+    def test_batch_benchmark(self) -> None:
+        """
+        batching cuts the update calls to one per observer.
+        """
+        results = batch_benchmark(observers=50, changes=1_000)
+        print(results)
+        self.assertEqual(results["immediate"]["update_calls"], 50_000)
+        self.assertEqual(results["batch"]["update_calls"], 50)
+        self.assertLessEqual(results["debounce"]["update_calls"], 100)
+
 
+if __name__ == "__main__":
+    subject = Subject()
 
-observer_a = ConcreteObserverA()
-observer_b = ConcreteObserverB()
+    observer_a = ConcreteObserverA()
+    observer_b = ConcreteObserverB()
 
-subject.attach(observer_a)
-subject.attach(observer_b)
+    subject.attach(observer_a)
+    subject.attach(observer_b)
 
-# Change the state of the subject
-subject.state = 2
-subject.state = 3
+    # Change the state of the subject
+    subject.state = 2
+    subject.state = 3
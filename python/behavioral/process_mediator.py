@@ -0,0 +1,709 @@
+"""
+The process mediator connects components that live in different
+processes, so that Driver and Payment can use more than one core while
+the rest of the code keeps calling mediator.notify(event=...).
+
+Every component class runs in its own worker process and owns an inbound
+ring buffer in a multiprocessing.shared_memory block:
+
+    offset 0   head       uint64, bytes ever written (producer only)
+    offset 8   tail       uint64, bytes ever read (consumer only)
+    offset 16  processed  uint64, messages handled (consumer only)
+    offset 24  errors     uint64, handlers that raised (consumer only)
+    offset 64  data       `capacity` bytes
+
+A message is a 4-byte length followed by a 1-byte event name length, the
+event name and the payload encoded with marshal; a message never wraps,
+the producer skips to the start of the ring instead. The producer writes
+the message before it publishes the new head and the consumer reads it
+before it publishes the new tail, which is enough on x86 where aligned
+8-byte stores are atomic and not reordered with each other. Other
+architectures (ARM64 among them) may make the new head visible before the
+message bytes, so there the head and tail are published and read under a
+shared lock, whose acquire and release act as memory barriers. The counters
+go through a native memoryview.cast("Q"), which stores all 8 bytes at
+once; struct "<Q" packs byte by byte and the other side could see a torn
+counter. Each ring has a single producer (the mediator, guarded by a
+lock) and a single consumer (the worker), so no other synchronisation is
+needed. An empty ring is polled with a short back-off.
+
+Delivery keeps the notify semantics of ConcreteMediator: notify(event)
+calls the routed component method, fire-and-forget, in order per
+component. flush() waits until everything sent has been handled. A
+handler that raises is counted in errors() and the worker carries on;
+a worker that died makes notify, flush and close raise ConnectionError
+instead of waiting for it forever.
+
+usage:
+    with ProcessMediator({"driver": (Driver, "finish_trip"), "payment": (Payment, "pay")}) as mediator:
+        mediator.notify(event="driver")
+        mediator.notify(event="payment")
+"""
+import marshal
+import multiprocessing
+import platform
+import queue
+import struct
+import threading
+import time
+import typing
+import unittest
+from multiprocessing import shared_memory
+
+from .mediator import Driver, Payment
+
+HEADER_SIZE = 64
+HEAD, TAIL, PROCESSED, ERRORS = 0, 1, 2, 3
+LENGTH = struct.Struct("<I")
+WRAP = 0xFFFFFFFF
+STOP = ""
+MAX_EVENT_NAME = 255
+
+# x86 never reorders stores with other stores
+ORDERED_STORES = platform.machine().lower() in ("x86_64", "amd64", "i386", "i686", "x86")
+
+Routes = typing.Dict[str, typing.Tuple[type, str]]
+
+
+def encode(event: str, payload: typing.Any) -> bytes:
+    """
+    compact message encoding.
+    """
+    name = event.encode()
+    if len(name) > MAX_EVENT_NAME:
+        raise ValueError(f"event name {event[:32]!r}... is {len(name)} bytes, at most {MAX_EVENT_NAME} fit")
+    return bytes((len(name),)) + name + marshal.dumps(payload)
+
+
+def decode(message: bytes) -> typing.Tuple[str, typing.Any]:
+    """
+    inverse of encode.
+    """
+    size = message[0]
+    return message[1:1 + size].decode(), marshal.loads(message[1 + size:])
+
+
+class SharedRing:
+    """
+    single-producer single-consumer byte ring in shared memory.
+    """
+    def __init__(self, capacity: int = 1 << 20, name: typing.Optional[str] = None, lock=None) -> None:
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + capacity)
+            self.memory.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.capacity = capacity
+        self.buffer = self.memory.buf
+        self.counters = self.buffer[:32].cast("Q")
+        self.lock = lock
+
+    def _load(self, index: int) -> int:
+        if self.lock is None:
+            return self.counters[index]
+        with self.lock:
+            return self.counters[index]
+
+    def _publish(self, index: int, value: int) -> None:
+        if self.lock is None:
+            self.counters[index] = value
+            return
+        with self.lock:
+            self.counters[index] = value
+
+    @property
+    def name(self) -> str:
+        """
+        the shared memory name to attach from another process.
+        """
+        return self.memory.name
+
+    @property
+    def processed(self) -> int:
+        """
+        messages the consumer has handled.
+        """
+        return self.counters[PROCESSED]
+
+    def mark_processed(self) -> None:
+        """
+        count one more handled message.
+        """
+        self.counters[PROCESSED] += 1
+
+    @property
+    def errors(self) -> int:
+        """
+        messages whose handler raised.
+        """
+        return self.counters[ERRORS]
+
+    def mark_failed(self) -> None:
+        """
+        count one more handler error.
+        """
+        self.counters[ERRORS] += 1
+
+    def put(
+        self,
+        message: bytes,
+        alive: typing.Optional[typing.Callable[[], bool]] = None,
+        timeout: typing.Optional[float] = None,
+    ) -> None:
+        """
+        append a message, waiting while the ring is full; raises
+        ConnectionError once alive() says the consumer is gone and
+        TimeoutError after timeout seconds.
+        """
+        size = LENGTH.size + len(message)
+        if size > self.capacity // 2:
+            raise ValueError(f"message of {len(message)} bytes does not fit the ring")
+
+        head = self.counters[HEAD]
+        position = head % self.capacity
+        skip = self.capacity - position if position + size > self.capacity else 0
+        backoff = Backoff()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.capacity - (head - self._load(TAIL)) < skip + size:
+            if alive is not None and not alive():
+                raise ConnectionError("the consumer of the ring is gone")
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("the ring stayed full")
+            backoff.wait()
+
+        if skip:
+            if skip >= LENGTH.size:
+                LENGTH.pack_into(self.buffer, HEADER_SIZE + position, WRAP)
+            head += skip
+            position = 0
+        start = HEADER_SIZE + position
+        LENGTH.pack_into(self.buffer, start, len(message))
+        self.buffer[start + LENGTH.size:start + size] = message
+        self._publish(HEAD, head + size)
+
+    def get(self) -> typing.Optional[bytes]:
+        """
+        pop the next message, None when the ring is empty.
+        """
+        tail = self.counters[TAIL]
+        while tail != self._load(HEAD):
+            position = tail % self.capacity
+            if self.capacity - position < LENGTH.size:
+                tail += self.capacity - position
+                continue
+            length = LENGTH.unpack_from(self.buffer, HEADER_SIZE + position)[0]
+            if length == WRAP:
+                tail += self.capacity - position
+                continue
+            start = HEADER_SIZE + position + LENGTH.size
+            message = bytes(self.buffer[start:start + length])
+            self._publish(TAIL, tail + LENGTH.size + length)
+            return message
+        self._publish(TAIL, tail)
+        return None
+
+    def close(self, unlink: bool = False) -> None:
+        """
+        detach, and destroy the block when unlink is set.
+        """
+        self.counters.release()
+        self.buffer.release()
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class Backoff:
+    """
+    poll quickly first, then sleep longer and longer up to 1ms.
+    """
+    def __init__(self) -> None:
+        self.attempts = 0
+
+    def wait(self) -> None:
+        """
+        wait before polling again.
+        """
+        self.attempts += 1
+        time.sleep(0 if self.attempts < 50 else min(0.00001 * (self.attempts - 49), 0.001))
+
+    def reset(self) -> None:
+        """
+        back to fast polling after a message arrived.
+        """
+        self.attempts = 0
+
+
+def component_handlers(routes: Routes) -> typing.Tuple[dict, list]:
+    """
+    one instance per component class and the bound method per event.
+    """
+    instances: typing.Dict[type, typing.Any] = {}
+    handlers = {}
+    for event, (component_class, method) in routes.items():
+        if component_class not in instances:
+            instances[component_class] = component_class()
+        handlers[event] = getattr(instances[component_class], method)
+    return handlers, list(instances.values())
+
+
+def report_of(components: list) -> dict:
+    """
+    the report() of every component that has one.
+    """
+    return {
+        type(component).__name__: component.report()
+        for component in components if hasattr(component, "report")
+    }
+
+
+def serve_ring(ring_name: str, capacity: int, routes: Routes, results, lock=None) -> None:
+    """
+    worker loop: handle the messages of one ring until STOP.
+    """
+    ring = SharedRing(capacity, name=ring_name, lock=lock)
+    handlers, components = component_handlers(routes)
+    backoff = Backoff()
+    try:
+        while True:
+            message = ring.get()
+            if message is None:
+                backoff.wait()
+                continue
+            backoff.reset()
+            event, payload = decode(message)
+            if event == STOP:
+                break
+            try:
+                if payload is None:
+                    handlers[event]()
+                else:
+                    handlers[event](payload)
+            except Exception:  # pylint: disable=W0718
+                ring.mark_failed()
+            ring.mark_processed()
+    finally:
+        results.put(report_of(components))
+        ring.close()
+
+
+class ProcessMediator:
+    """
+    mediator whose components run in worker processes.
+
+    locked publishes the ring counters under a lock; by default only on
+    platforms that may reorder stores.
+    """
+    def __init__(
+        self, routes: Routes, capacity: int = 1 << 20, context=None, locked: typing.Optional[bool] = None
+    ) -> None:
+        for event in routes:
+            if event == STOP or len(event.encode()) > MAX_EVENT_NAME:
+                raise ValueError(f"event name must be 1 to {MAX_EVENT_NAME} bytes: {event[:32]!r}")
+        self.routes = routes
+        self.locked = not ORDERED_STORES if locked is None else locked
+        self.capacity = capacity
+        self.context = context or multiprocessing.get_context()
+        self.reports: typing.Dict[str, typing.Any] = {}
+        self._lock = threading.Lock()
+        self._rings: typing.Dict[str, SharedRing] = {}
+        self._sent: typing.Dict[str, int] = {}
+        self._processes: typing.Dict[str, typing.Any] = {}
+        self._workers: typing.List[typing.Tuple[SharedRing, typing.Any]] = []
+        self._results = None
+
+    def start(self) -> "ProcessMediator":
+        """
+        start one worker process per component class.
+        """
+        self._results = self.context.Queue()
+        by_component: typing.Dict[type, Routes] = {}
+        for event, route in self.routes.items():
+            by_component.setdefault(route[0], {})[event] = route
+
+        for component_routes in by_component.values():
+            ring = SharedRing(self.capacity, lock=self.context.Lock() if self.locked else None)
+            process = self.context.Process(
+                target=serve_ring,
+                args=(ring.name, self.capacity, component_routes, self._results, ring.lock),
+                daemon=True,
+            )
+            process.start()
+            self._workers.append((ring, process))
+            self._sent[ring.name] = 0
+            self._processes[ring.name] = process
+            for event in component_routes:
+                self._rings[event] = ring
+        return self
+
+    def notify(self, event, payload=None) -> None:
+        """
+        deliver the event to the component in its process.
+        """
+        ring = self._rings[event]
+        message = encode(event, payload)
+        with self._lock:
+            ring.put(message, alive=self._processes[ring.name].is_alive)
+            self._sent[ring.name] += 1
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """
+        wait until every notified event has been handled.
+        """
+        deadline = time.monotonic() + timeout
+        backoff = Backoff()
+        for ring, process in self._workers:
+            while ring.processed < self._sent[ring.name]:
+                if not process.is_alive():
+                    raise ConnectionError(f"worker {process.name} died")
+                if time.monotonic() > deadline:
+                    raise TimeoutError("components did not catch up in time")
+                backoff.wait()
+
+    def errors(self) -> int:
+        """
+        number of handler calls that raised in the workers.
+        """
+        return sum(ring.errors for ring, _ in self._workers)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        stop the workers, collect their reports and free the rings;
+        raises ConnectionError when a worker had died.
+        """
+        dead = []
+        with self._lock:
+            for ring, process in self._workers:
+                try:
+                    ring.put(encode(STOP, None), alive=process.is_alive, timeout=timeout)
+                except (ConnectionError, TimeoutError):
+                    dead.append(process)
+        for _ in range(len(self._workers) - len(dead)):
+            try:
+                self.reports.update(self._results.get(timeout=timeout))
+            except queue.Empty:
+                break
+        for ring, process in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            ring.close(unlink=True)
+        self._workers.clear()
+        if dead:
+            raise ConnectionError(f"{len(dead)} worker(s) died before close")
+
+    def __enter__(self) -> "ProcessMediator":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.close()
+
+
+def serve_queue(inbox, routes: Routes, results, errors, processed) -> None:
+    """
+    worker loop of the multiprocessing.Queue baseline.
+    """
+    handlers, components = component_handlers(routes)
+    while True:
+        event, payload = inbox.get()
+        if event == STOP:
+            inbox.task_done()
+            break
+        try:
+            if payload is None:
+                handlers[event]()
+            else:
+                handlers[event](payload)
+        except Exception:  # pylint: disable=W0718
+            with errors.get_lock():
+                errors.value += 1
+        with processed.get_lock():
+            processed.value += 1
+        inbox.task_done()
+    results.put(report_of(components))
+
+
+class QueueMediator(ProcessMediator):
+    """
+    the same mediator over multiprocessing.JoinableQueue, the baseline.
+    """
+    def start(self) -> "QueueMediator":
+        self._results = self.context.Queue()
+        self._errors = self.context.Value("Q", 0)
+        self._processed = self.context.Value("Q", 0)
+        self._total = 0
+        by_component: typing.Dict[type, Routes] = {}
+        for event, route in self.routes.items():
+            by_component.setdefault(route[0], {})[event] = route
+        for component_routes in by_component.values():
+            inbox = self.context.JoinableQueue()
+            process = self.context.Process(
+                target=serve_queue,
+                args=(inbox, component_routes, self._results, self._errors, self._processed),
+                daemon=True,
+            )
+            process.start()
+            self._workers.append((inbox, process))
+            for event in component_routes:
+                self._rings[event] = inbox
+        return self
+
+    def notify(self, event, payload=None) -> None:
+        inbox = self._rings[event]
+        with self._lock:
+            inbox.put((event, payload))
+            self._total += 1
+
+    def flush(self, timeout: float = 10.0) -> None:
+        deadline = time.monotonic() + timeout
+        backoff = Backoff()
+        while self._processed.value < self._total:
+            for _, process in self._workers:
+                if not process.is_alive():
+                    raise ConnectionError(f"worker {process.name} died")
+            if time.monotonic() > deadline:
+                raise TimeoutError("components did not catch up in time")
+            backoff.wait()
+
+    def errors(self) -> int:
+        return self._errors.value
+
+    def close(self, timeout: float = 10.0) -> None:
+        for inbox, _ in self._workers:
+            inbox.put((STOP, None))
+        for _ in self._workers:
+            self.reports.update(self._results.get(timeout=timeout))
+        for _, process in self._workers:
+            process.join()
+        self._workers.clear()
+
+
+class LatencyProbe:
+    """
+    component that measures how long messages took to arrive.
+    """
+    def __init__(self) -> None:
+        self.samples: typing.List[float] = []
+
+    def record(self, sent_at: float) -> None:
+        """
+        one message sent at sent_at (time.monotonic).
+        """
+        self.samples.append(time.monotonic() - sent_at)
+
+    def report(self) -> dict:
+        """
+        count, mean and p99 latency in seconds.
+        """
+        ordered = sorted(self.samples)
+        return {
+            "count": len(ordered),
+            "mean": sum(ordered) / len(ordered) if ordered else 0.0,
+            "p99": ordered[int(len(ordered) * 0.99)] if ordered else 0.0,
+        }
+
+
+class Picky:
+    """
+    component whose handler rejects odd payloads.
+    """
+    def __init__(self) -> None:
+        self.accepted: typing.List[int] = []
+
+    def take(self, payload: int) -> None:
+        """
+        keep even payloads, raise on odd ones.
+        """
+        if payload % 2:
+            raise ValueError(f"odd payload {payload}")
+        self.accepted.append(payload)
+
+    def report(self) -> list:
+        """
+        the accepted payloads.
+        """
+        return self.accepted
+
+
+class Sleeper:
+    """
+    component with a slow handler.
+    """
+    def sleep(self, seconds: float) -> None:
+        """
+        block the worker for a while.
+        """
+        time.sleep(seconds)
+
+
+class Recorder:
+    """
+    component that remembers the order of its messages.
+    """
+    def __init__(self) -> None:
+        self.seen: typing.List[typing.Any] = []
+
+    def note(self, payload) -> None:
+        """
+        store one message.
+        """
+        self.seen.append(payload)
+
+    def report(self) -> list:
+        """
+        every message in arrival order.
+        """
+        return self.seen
+
+
+def benchmark(messages: int = 20_000) -> typing.Dict[str, dict]:
+    """
+    throughput and one-way latency of the shared-memory rings against
+    multiprocessing.Queue.
+    """
+    results = {}
+    for label, mediator_class in (("shared_memory", ProcessMediator), ("queue", QueueMediator)):
+        mediator = mediator_class({"probe": (LatencyProbe, "record")}).start()
+        started_at = time.perf_counter()
+        for _ in range(messages):
+            mediator.notify("probe", time.monotonic())
+        mediator.flush()
+        elapsed = time.perf_counter() - started_at
+        mediator.close()
+        results[label] = dict(mediator.reports["LatencyProbe"], messages_per_second=messages / elapsed)
+    return results
+
+
+class TestSharedRing(unittest.TestCase):
+    """
+    test shared ring.
+    """
+    def test_wrap_around(self) -> None:
+        """
+        messages survive many trips around a small ring.
+        """
+        ring = SharedRing(capacity=64)
+        try:
+            for index in range(200):
+                message = bytes([index % 256]) * (index % 13 + 1)
+                ring.put(message)
+                self.assertEqual(ring.get(), message)
+            self.assertIsNone(ring.get())
+        finally:
+            ring.close(unlink=True)
+
+    def test_encoding(self) -> None:
+        """
+        event and payload round-trip through the compact encoding.
+        """
+        payload = {"amount": 15000, "currency": "UZS", "items": [1, 2.5, None]}
+        self.assertEqual(decode(encode("payment", payload)), ("payment", payload))
+        self.assertLess(len(encode("driver", None)), 10)
+        self.assertEqual(decode(encode("e" * 255, 1)), ("e" * 255, 1))
+        with self.assertRaisesRegex(ValueError, "at most 255"):
+            encode("e" * 256, None)
+
+    def test_locked_ring(self) -> None:
+        """
+        the lock-published counters carry the same messages.
+        """
+        ring = SharedRing(capacity=64, lock=multiprocessing.Lock())
+        try:
+            for index in range(100):
+                ring.put(bytes([index]) * (index % 7 + 1))
+                self.assertEqual(ring.get(), bytes([index]) * (index % 7 + 1))
+        finally:
+            ring.close(unlink=True)
+
+
+class TestProcessMediator(unittest.TestCase):
+    """
+    test process mediator.
+    """
+    def test_notify_semantics(self) -> None:
+        """
+        the driver and payment components react in their own process.
+        """
+        with ProcessMediator({"driver": (Driver, "finish_trip"), "payment": (Payment, "pay")}) as mediator:
+            mediator.notify(event="driver")
+            mediator.notify(event="payment")
+            mediator.flush()
+
+    def test_order_per_component(self) -> None:
+        """
+        a component sees its messages in the order they were sent.
+        """
+        with ProcessMediator({"note": (Recorder, "note")}, capacity=256) as mediator:
+            for index in range(2_000):
+                mediator.notify("note", index)
+            mediator.flush()
+        self.assertEqual(mediator.reports["Recorder"], list(range(2_000)))
+
+    def test_locked_mediator(self) -> None:
+        """
+        the mediator used on weakly ordered platforms keeps order too.
+        """
+        with ProcessMediator({"note": (Recorder, "note")}, capacity=256, locked=True) as mediator:
+            for index in range(500):
+                mediator.notify("note", index)
+            mediator.flush()
+        self.assertEqual(mediator.reports["Recorder"], list(range(500)))
+
+    def test_event_names_are_validated(self) -> None:
+        """
+        names that cannot be encoded are rejected when routes are given.
+        """
+        for mediator_class in (ProcessMediator, QueueMediator):
+            with self.assertRaisesRegex(ValueError, "event name"):
+                mediator_class({"e" * 256: (Recorder, "note")})
+
+    def test_queue_flush_deadline(self) -> None:
+        """
+        the queue baseline honours the flush timeout.
+        """
+        with QueueMediator({"sleep": (Sleeper, "sleep")}) as mediator:
+            mediator.notify("sleep", 0.5)
+            with self.assertRaises(TimeoutError):
+                mediator.flush(timeout=0.05)
+            mediator.flush()
+
+    def test_handler_errors_are_counted(self) -> None:
+        """
+        a raising handler does not take the worker down.
+        """
+        for mediator_class in (ProcessMediator, QueueMediator):
+            with mediator_class({"take": (Picky, "take")}) as mediator:
+                for index in range(10):
+                    mediator.notify("take", index)
+                mediator.flush()
+                self.assertEqual(mediator.errors(), 5)
+            self.assertEqual(mediator.reports["Picky"], [0, 2, 4, 6, 8])
+
+    def test_dead_worker_does_not_hang(self) -> None:
+        """
+        notify and close fail instead of waiting for a dead worker.
+        """
+        mediator = ProcessMediator({"note": (Recorder, "note")}, capacity=256).start()
+        _, process = mediator._workers[0]  # pylint: disable=W0212
+        process.terminate()
+        process.join()
+        with self.assertRaises(ConnectionError):
+            for index in range(1_000):
+                mediator.notify("note", index)
+        with self.assertRaises(ConnectionError):
+            mediator.flush()
+        with self.assertRaises(ConnectionError):
+            mediator.close(timeout=1)
+
+    def test_benchmark(self) -> None:
+        """
+        print the comparison with multiprocessing.Queue.
+        """
+        for label, result in benchmark(messages=5_000).items():
+            print(label, result)
+            self.assertEqual(result["count"], 5_000)
+
+
+if __name__ == "__main__":
+    unittest.main()
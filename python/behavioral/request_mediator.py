@@ -0,0 +1,258 @@
+"""
+Request/reply through the mediator. notify is fire-and-forget, but the
+driver/payment flows need answers, e.g. whether the payment went through
+before the trip is finished.
+
+request() publishes the event with a RequestEnvelope payload carrying a
+correlation id and returns an asyncio future. A subscriber answers either
+by returning a value (or a coroutine producing it) or, when the answer
+comes later from somewhere else, by calling mediator.reply(correlation_id,
+value), which is safe from any thread. The first reply wins; replies to
+expired or unknown ids are dropped. Every request has its own timeout and
+any number of requests can be outstanding at once.
+
+usage:
+    mediator = RequestReplyMediator()
+    mediator.subscribe("payment.charge", lambda sender, event, envelope: payment.pay() or True)
+    paid = await mediator.request(driver, "payment.charge", {"amount": 15000}, timeout=2.0)
+"""
+import asyncio
+import inspect
+import itertools
+import threading
+import time
+import typing
+import unittest
+
+from .event_mediator import EventMediator
+
+
+class RequestEnvelope:
+    """
+    the payload of a request.
+    """
+    __slots__ = ("correlation_id", "payload")
+
+    def __init__(self, correlation_id: int, payload: typing.Any) -> None:
+        self.correlation_id = correlation_id
+        self.payload = payload
+
+
+class RequestReplyMediator(EventMediator):
+    """
+    event mediator with request/reply matched by correlation id.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self._ids = itertools.count(1)
+        self._pending: typing.Dict[int, typing.Tuple[asyncio.Future, asyncio.TimerHandle]] = {}
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        # the loop keeps only weak references to tasks, so hold them until done
+        self._tasks: typing.Set[asyncio.Future] = set()
+
+    @property
+    def outstanding(self) -> int:
+        """
+        number of requests waiting for a reply.
+        """
+        return len(self._pending)
+
+    def request(self, sender, event: str, payload=None, timeout: float = 1.0) -> asyncio.Future:
+        """
+        publish a request and return the future of its reply.
+        """
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        future = loop.create_future()
+        subscriptions = self.handlers(event)
+        if not subscriptions:
+            future.set_exception(LookupError(f"nobody answers {event!r}"))
+            return future
+
+        correlation_id = next(self._ids)
+        handle = loop.call_later(timeout, self._expire, correlation_id, event, timeout)
+        self._pending[correlation_id] = (future, handle)
+        envelope = RequestEnvelope(correlation_id, payload)
+
+        for subscription in subscriptions:
+            try:
+                answer = subscription.handler(sender, event, envelope)
+            except Exception as exc:  # pylint: disable=W0718
+                self._settle(correlation_id, exception=exc)
+                break
+            if inspect.isawaitable(answer):
+                task = asyncio.ensure_future(answer)
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                task.add_done_callback(lambda task, cid=correlation_id: self._from_task(cid, task))
+            elif answer is not None:
+                self._settle(correlation_id, result=answer)
+        return future
+
+    def reply(self, correlation_id: int, result: typing.Any) -> bool:
+        """
+        answer a request, from any thread; False when nobody waits for it.
+        """
+        loop = self._loop
+        if loop is None:
+            return False
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return self._settle(correlation_id, result=result)
+        if correlation_id not in self._pending:
+            return False
+        loop.call_soon_threadsafe(lambda: self._settle(correlation_id, result=result))
+        return True
+
+    def _from_task(self, correlation_id: int, task: asyncio.Future) -> None:
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self._settle(correlation_id, exception=task.exception())
+        elif task.result() is not None:
+            self._settle(correlation_id, result=task.result())
+
+    def _settle(self, correlation_id: int, result=None, exception=None) -> bool:
+        entry = self._pending.pop(correlation_id, None)
+        if entry is None:
+            return False
+        future, handle = entry
+        handle.cancel()
+        if not future.done():
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        return True
+
+    def _expire(self, correlation_id: int, event: str, timeout: float) -> None:
+        self._settle(
+            correlation_id,
+            exception=asyncio.TimeoutError(f"no reply to {event!r} within {timeout}s"),
+        )
+
+
+async def benchmark(
+    concurrency: int = 1_000,
+    round_trips: int = 20_000,
+    mediator: typing.Optional[RequestReplyMediator] = None,
+) -> float:
+    """
+    round trips per second with `concurrency` requests outstanding at once.
+    """
+    mediator = mediator or RequestReplyMediator()
+
+    async def responder(sender, event, envelope) -> int:
+        await asyncio.sleep(0)
+        return envelope.payload + 1
+
+    mediator.subscribe("echo", responder)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            if await mediator.request(None, "echo", index) != index + 1:
+                raise RuntimeError(f"reply mismatch for request {index}")
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(round_trips)))
+    return round_trips / (time.perf_counter() - started_at)
+
+
+class TestRequestReplyMediator(unittest.TestCase):
+    """
+    test request/reply mediator.
+    """
+    def test_sync_responder(self) -> None:
+        """
+        a subscriber's return value is the reply.
+        """
+        mediator = RequestReplyMediator()
+        mediator.subscribe("payment.charge", lambda sender, event, envelope: envelope.payload >= 100)
+
+        async def flow() -> tuple:
+            return (
+                await mediator.request(None, "payment.charge", 150),
+                await mediator.request(None, "payment.charge", 50),
+            )
+
+        self.assertEqual(asyncio.run(flow()), (True, False))
+        self.assertEqual(mediator.outstanding, 0)
+
+    def test_delayed_reply_from_thread(self) -> None:
+        """
+        a component can answer later, from another thread.
+        """
+        mediator = RequestReplyMediator()
+
+        def charge(sender, event, envelope) -> None:
+            threading.Timer(0.01, mediator.reply, (envelope.correlation_id, "paid")).start()
+
+        mediator.subscribe("payment.charge", charge)
+
+        async def flow() -> str:
+            return await mediator.request(None, "payment.charge", timeout=1.0)
+
+        self.assertEqual(asyncio.run(flow()), "paid")
+
+    def test_timeout(self) -> None:
+        """
+        an unanswered request times out and late replies are dropped.
+        """
+        mediator = RequestReplyMediator()
+        ids = []
+        mediator.subscribe(
+            "payment.charge", lambda sender, event, envelope: ids.append(envelope.correlation_id)
+        )
+
+        async def flow() -> None:
+            with self.assertRaises(asyncio.TimeoutError):
+                await mediator.request(None, "payment.charge", timeout=0.02)
+            self.assertFalse(mediator.reply(ids[0], True))
+
+        asyncio.run(flow())
+        self.assertEqual(mediator.outstanding, 0)
+
+    def test_errors_and_missing_responder(self) -> None:
+        """
+        responder errors and unknown events reach the caller.
+        """
+        mediator = RequestReplyMediator()
+
+        async def failing(sender, event, envelope) -> None:
+            raise ValueError("card declined")
+
+        mediator.subscribe("payment.charge", failing)
+
+        async def flow() -> None:
+            with self.assertRaises(ValueError):
+                await mediator.request(None, "payment.charge")
+            with self.assertRaises(LookupError):
+                await mediator.request(None, "driver.rate")
+
+        asyncio.run(flow())
+
+    def test_concurrent_requests_are_matched(self) -> None:
+        """
+        many outstanding requests each get their own answer.
+        """
+        self.assertGreater(asyncio.run(benchmark(concurrency=500, round_trips=2_000)), 0)
+
+    def test_benchmark(self) -> None:
+        """
+        every round trip is answered and nothing is left pending, at any concurrency.
+        """
+        for concurrency in (1, 100, 1_000):
+            mediator = RequestReplyMediator()
+            round_trips = asyncio.run(benchmark(concurrency, 3_000, mediator))
+            print(f"concurrency {concurrency}: {round_trips:.0f} round trips/s")
+            self.assertGreater(round_trips, 0)
+            self.assertEqual(mediator.outstanding, 0)
+            self.assertFalse(mediator._tasks)  # pylint: disable=W0212
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,8 +11,22 @@ components of the strategy pattern:
         It declares a method the Context uses to execute a strategy.
     3) Concrete Strategies: Implementations of the Strategy interface,
         each representing a different algorithm.
+
+Context.execute_many streams an iterable of records through the strategy
+in chunks of chunk_size, yielding the results in input order while only a
+bounded number of chunks is held in memory. Strategies that define
+execute_batch(records) get whole chunks instead of one call per record.
+With processes=N the chunks run on a process pool (the strategy must be
+picklable); at most two chunks per process are in flight and results
+still come out in input order.
 """
 import abc
+import collections
+import concurrent.futures
+import itertools
+import time
+import typing
+import unittest
 
 
 class Strategy:
@@ -61,6 +75,163 @@ class Context:
         """
         return self._strategy.execute(data)
 
+    def execute_many(self, records, chunk_size=1_000, processes=None):
+        """
+        execute the strategy for every record, as a generator.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        if processes is not None and processes < 1:
+            raise ValueError("processes must be positive")
+        return self._stream(records, chunk_size, processes)
+
+    def _stream(self, records, chunk_size, processes):
+        records = iter(records)
+        chunks = iter(lambda: list(itertools.islice(records, chunk_size)), [])
+        if processes is None:
+            batch = getattr(self._strategy, "execute_batch", None)
+            for chunk in chunks:
+                if batch is not None:
+                    yield from batch(chunk)
+                else:
+                    for data in chunk:
+                        yield self.execute_strategy(data)
+            return
+
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            pending = collections.deque()
+            for chunk in chunks:
+                pending.append(executor.submit(run_chunk, self._strategy, chunk))
+                if len(pending) >= 2 * processes:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+
+def run_chunk(strategy, chunk):
+    """
+    run one chunk in a worker process.
+    """
+    batch = getattr(strategy, "execute_batch", None)
+    if batch is not None:
+        return list(batch(chunk))
+    return [strategy.execute(data) for data in chunk]
+
+
+class FieldCountStrategy(Strategy):
+    """
+    count the non-empty fields of a record.
+    """
+    def execute(self, data):
+        return sum(1 for value in data.values() if value)
+
+
+class BatchFieldCountStrategy(FieldCountStrategy):
+    """
+    the same count over whole chunks.
+    """
+    def execute_batch(self, records):
+        """
+        execute for a chunk of records.
+        """
+        return [sum(map(bool, data.values())) for data in records]
+
+
+def benchmark(records: int = 200_000, chunk_size: int = 1_000, processes: int = 2) -> typing.Dict[str, float]:
+    """
+    records per second one by one, chunked with a batch method and chunked
+    over a process pool.
+    """
+    def stream():
+        return ({"name": "Muhammadali", "telegram": "", "id": index} for index in range(records))
+
+    results = {}
+    runs = (
+        ("per_record", FieldCountStrategy(), None),
+        ("batched", BatchFieldCountStrategy(), None),
+        ("process_pool", BatchFieldCountStrategy(), processes),
+    )
+    for label, strategy, pool in runs:
+        context = Context(strategy)
+        started_at = time.perf_counter()
+        if label == "per_record":
+            for data in stream():
+                context.execute_strategy(data)
+        else:
+            collections.deque(context.execute_many(stream(), chunk_size, pool), maxlen=0)
+        results[f"{label}_records_per_second"] = records / (time.perf_counter() - started_at)
+    return results
+
+
+class TestExecuteMany(unittest.TestCase):
+    """
+    test streaming execution.
+    """
+    @staticmethod
+    def records(count, consumed=None):
+        """
+        a stream of records counting how many were pulled.
+        """
+        for index in range(count):
+            if consumed is not None:
+                consumed.append(index)
+            yield {"name": "record", "index": index, "flag": index % 2}
+
+    def test_results_in_order(self) -> None:
+        """
+        per record, batched and pooled runs give the same ordered results.
+        """
+        expected = [1 + bool(index) + index % 2 for index in range(2_500)]
+        for strategy, processes in (
+            (FieldCountStrategy(), None), (BatchFieldCountStrategy(), None), (BatchFieldCountStrategy(), 2)
+        ):
+            results = list(Context(strategy).execute_many(self.records(2_500), 100, processes))
+            self.assertEqual(results, expected)
+
+    def test_streams_with_bounded_memory(self) -> None:
+        """
+        the input is pulled one chunk at a time.
+        """
+        consumed = []
+        results = Context(BatchFieldCountStrategy()).execute_many(self.records(10_000, consumed), 100)
+        for produced, _ in enumerate(results, 1):
+            self.assertLessEqual(len(consumed) - produced, 100)
+
+    def test_batch_method_gets_chunks(self) -> None:
+        """
+        strategies with execute_batch are called once per chunk.
+        """
+        sizes = []
+
+        class Recording(BatchFieldCountStrategy):
+            """
+            record the chunk sizes.
+            """
+            def execute_batch(self, records):
+                sizes.append(len(records))
+                return super().execute_batch(records)
+
+        list(Context(Recording()).execute_many(self.records(250), chunk_size=100))
+        self.assertEqual(sizes, [100, 100, 50])
+
+    def test_invalid_arguments(self) -> None:
+        """
+        a chunk size or process count below one is rejected on the call.
+        """
+        context = Context(FieldCountStrategy())
+        with self.assertRaises(ValueError):
+            context.execute_many(self.records(10), chunk_size=0)
+        with self.assertRaises(ValueError):
+            context.execute_many(self.records(10), processes=0)
+
+    def test_benchmark(self) -> None:
+        """
+        the batch method beats one call per record.
+        """
+        results = benchmark(records=50_000)
+        print(results)
+        self.assertGreater(results["batched_records_per_second"], results["per_record_records_per_second"])
+
 
 if __name__ == "__main__":
     data = {
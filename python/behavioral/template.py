@@ -5,22 +5,257 @@ deferring some steps to subclasses. This pattern lets subclasses
 redefine certain steps of an algorithm without changing the algorithm's structure.
 It's particularly useful when there is a common workflow or series of steps,
 but some steps may vary in their implementation across different contexts or subclasses.
+
+process_payments(amounts) is the batch template: it authenticates once,
+reusing the session for session_ttl seconds across batches, validates the
+whole batch with validate_many, then calls create_checks and pay_checks.
+By default the bulk steps loop over create_check/pay_check; providers with
+bulk APIs override them.
+
+Every step of both templates runs through _step. When `metrics` is a
+StepMetrics the step is timed into a per-provider, per-step latency
+histogram, and before_step/after_step are called around it; subclasses
+override those callbacks instead of the old hook(). With metrics None
+and no callbacks overridden, _step is a plain call. StepMetrics.export()
+hands a snapshot of the histograms to pluggable exporters such as
+TextExporter or PrometheusExporter.
 """
 import abc
+import bisect
+import sys
+import threading
+import time
+import typing
+import unittest
+from io import StringIO
+from unittest.mock import patch
+
+# upper bounds in seconds: 50us doubling up to about 1.6s, then the rest
+BUCKETS = tuple(0.00005 * 2 ** index for index in range(16)) + (float("inf"),)
+
+
+class LatencyHistogram:
+    """
+    latency histogram with fixed exponential buckets.
+    """
+    __slots__ = ("counts", "count", "total", "errors")
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def record(self, seconds: float, failed: bool = False) -> None:
+        """
+        add one sample.
+        """
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.errors += failed
+
+    def quantile(self, fraction: float) -> float:
+        """
+        upper bound of the bucket holding the quantile.
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return bound
+        return 0.0
+
+
+class StepMetrics:
+    """
+    latency histograms by provider and step, with pluggable exporters.
+    """
+    def __init__(self, exporters: typing.Sequence[typing.Callable[[list], None]] = ()) -> None:
+        self.exporters = list(exporters)
+        self.histograms: typing.Dict[typing.Tuple[str, str], LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, step: str, seconds: float, failed: bool = False) -> None:
+        """
+        add one step timing.
+        """
+        with self._lock:
+            histogram = self.histograms.get((provider, step))
+            if histogram is None:
+                histogram = self.histograms[(provider, step)] = LatencyHistogram()
+            histogram.record(seconds, failed)
+
+    def snapshot(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        one row per provider and step.
+        """
+        with self._lock:
+            return [
+                {
+                    "provider": provider,
+                    "step": step,
+                    "count": histogram.count,
+                    "errors": histogram.errors,
+                    "sum": histogram.total,
+                    "p50": histogram.quantile(0.5),
+                    "p99": histogram.quantile(0.99),
+                    "buckets": list(zip(BUCKETS, histogram.counts)),
+                }
+                for (provider, step), histogram in sorted(self.histograms.items())
+            ]
+
+    def export(self) -> None:
+        """
+        hand the snapshot to every exporter.
+        """
+        rows = self.snapshot()
+        for exporter in self.exporters:
+            exporter(rows)
+
+
+class TextExporter:
+    """
+    exporter writing one human readable line per provider and step.
+    """
+    def __init__(self, stream: typing.Optional[typing.TextIO] = None) -> None:
+        self.stream = stream
+
+    def __call__(self, rows: list) -> None:
+        stream = self.stream or sys.stdout
+        for row in rows:
+            mean = row["sum"] / row["count"] if row["count"] else 0.0
+            stream.write(
+                f"{row['provider']}.{row['step']}: count={row['count']} errors={row['errors']} "
+                f"mean={mean * 1000:.3f}ms p50<={row['p50'] * 1000:.3f}ms p99<={row['p99'] * 1000:.3f}ms\n"
+            )
+
+
+class PrometheusExporter:
+    """
+    exporter rendering the Prometheus text format into `text`.
+    """
+    def __init__(self, name: str = "payment_step_seconds") -> None:
+        self.name = name
+        self.text = ""
+
+    def __call__(self, rows: list) -> None:
+        lines = [f"# TYPE {self.name} histogram"]
+        for row in rows:
+            labels = f'provider="{row["provider"]}",step="{row["step"]}"'
+            cumulative = 0
+            for bound, count in row["buckets"]:
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {row['sum']}")
+            lines.append(f"{self.name}_count{{{labels}}} {row['count']}")
+        self.text = "\n".join(lines) + "\n"
 
 
 class PaymentProcessor(abc.ABC):
     """
     the payment processor template.
     """
+    session_ttl = 300.0
+    clock = staticmethod(time.monotonic)
+    metrics: typing.Optional[StepMetrics] = None
+    _session: typing.Any = None
+    _session_expires_at = 0.0
+    _callbacks = False
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._callbacks = (
+            cls.before_step is not PaymentProcessor.before_step
+            or cls.after_step is not PaymentProcessor.after_step
+        )
+
     def process_payment(self, amount) -> None:
         """
         the template methods
         """
-        self.authenticate()
+        self._step("authenticate", self.authenticate)
+        self._step("validate", self.validate)
+        self._step("create_check", self.create_check, amount)
+        self._step("pay_check", self.pay_check, amount)
+
+    def _step(self, step: str, function: typing.Callable, *args) -> typing.Any:
+        metrics = self.metrics
+        if metrics is None and not self._callbacks:
+            return function(*args)
+
+        self.before_step(step)
+        error = None
+        started_at = time.perf_counter()
+        try:
+            return function(*args)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            seconds = time.perf_counter() - started_at
+            if metrics is not None:
+                metrics.record(type(self).__name__, step, seconds, error is not None)
+            self.after_step(step, seconds, error)
+
+    def before_step(self, step: str) -> None:
+        """
+        called before every template step; override in your child class.
+        """
+
+    def after_step(self, step: str, seconds: float, error: typing.Optional[BaseException]) -> None:
+        """
+        called after every template step with its duration and error.
+        """
+
+    def process_payments(self, amounts: typing.Sequence[float]) -> list:
+        """
+        the batch template method: one authentication per session.
+        """
+        amounts = list(amounts)
+        if not amounts:
+            return []
+        self.session()
+        self._step("validate_many", self.validate_many, amounts)
+        self._step("create_checks", self.create_checks, amounts)
+        return self._step("pay_checks", self.pay_checks, amounts)
+
+    def session(self) -> typing.Any:
+        """
+        the cached session, authenticating again once it expired.
+        """
+        now = self.clock()
+        if self._session is None or now >= self._session_expires_at:
+            session = self._step("authenticate", self.authenticate)
+            self._session = True if session is None else session
+            self._session_expires_at = now + self.session_ttl
+        return self._session
+
+    def invalidate_session(self) -> None:
+        """
+        forget the session, e.g. after the provider rejected it.
+        """
+        self._session = None
+
+    def validate_many(self, amounts: typing.Sequence[float]) -> None:
+        """
+        validation of a whole batch, by default a single validate().
+        """
         self.validate()
-        self.create_check(amount)
-        self.pay_check(amount)
+
+    def create_checks(self, amounts: typing.Sequence[float]) -> list:
+        """
+        create the checks of a batch; override for bulk provider APIs.
+        """
+        return [self.create_check(amount) for amount in amounts]
+
+    def pay_checks(self, amounts: typing.Sequence[float]) -> list:
+        """
+        pay the checks of a batch; override for bulk provider APIs.
+        """
+        return [self.pay_check(amount) for amount in amounts]
 
     def authenticate(self):
         """
@@ -46,11 +281,6 @@ class PaymentProcessor(abc.ABC):
         pay check method.
         """
 
-    def hook(self):
-        """
-        override this method in your child classe
-        """
-
 
 class Payme(PaymentProcessor):
     """
@@ -95,6 +325,228 @@ def client_code(payment_processor: PaymentProcessor, amount: float):
     payment_processor.process_payment(amount)
 
 
+class SimulatedProvider(PaymentProcessor):
+    """
+    quiet provider with the latencies of a remote API.
+    """
+    def __init__(self, auth_latency: float = 0.005, step_latency: float = 0.0002) -> None:
+        self.auth_latency = auth_latency
+        self.step_latency = step_latency
+        self.calls = {"authenticate": 0, "validate": 0, "create_check": 0, "pay_check": 0}
+
+    def authenticate(self):
+        self.calls["authenticate"] += 1
+        time.sleep(self.auth_latency)
+        return f"session-{self.calls['authenticate']}"
+
+    def validate(self):
+        self.calls["validate"] += 1
+        time.sleep(self.step_latency)
+
+    def create_check(self, amount):
+        self.calls["create_check"] += 1
+        time.sleep(self.step_latency)
+
+    def pay_check(self, amount):
+        self.calls["pay_check"] += 1
+        time.sleep(self.step_latency)
+        return amount
+
+
+class BulkProvider(SimulatedProvider):
+    """
+    provider with bulk endpoints: one round trip per batch.
+    """
+    def create_checks(self, amounts):
+        self.calls["create_check"] += 1
+        time.sleep(self.step_latency)
+        return list(amounts)
+
+    def pay_checks(self, amounts):
+        self.calls["pay_check"] += 1
+        time.sleep(self.step_latency)
+        return list(amounts)
+
+
+def benchmark(payments: int = 200, batch_size: int = 50) -> typing.Dict[str, float]:
+    """
+    seconds for `payments` payments one by one, batched, and batched with
+    bulk endpoints.
+    """
+    amounts = [100 + index for index in range(payments)]
+    batches = [amounts[start:start + batch_size] for start in range(0, payments, batch_size)]
+    results = {}
+
+    provider = SimulatedProvider()
+    started_at = time.perf_counter()
+    for amount in amounts:
+        provider.process_payment(amount)
+    results["per_payment_seconds"] = time.perf_counter() - started_at
+
+    for label, provider in (("batched", SimulatedProvider()), ("bulk", BulkProvider())):
+        started_at = time.perf_counter()
+        for batch in batches:
+            provider.process_payments(batch)
+        results[f"{label}_seconds"] = time.perf_counter() - started_at
+    return results
+
+
+def overhead_benchmark(
+    payments: int = 100_000, metrics: typing.Optional[StepMetrics] = None
+) -> typing.Dict[str, float]:
+    """
+    microseconds per process_payment of a no-op provider, without and with
+    step metrics; `metrics` receives the timings of the enabled run.
+    """
+    results = {}
+    for label, metrics in (("disabled", None), ("enabled", metrics or StepMetrics())):
+        provider = SimulatedProvider(auth_latency=0, step_latency=0)
+        provider.authenticate = provider.validate = lambda: None
+        provider.create_check = provider.pay_check = lambda amount: None
+        provider.metrics = metrics
+        started_at = time.perf_counter()
+        for amount in range(payments):
+            provider.process_payment(amount)
+        results[f"{label}_us_per_payment"] = (time.perf_counter() - started_at) / payments * 1e6
+    return results
+
+
+class TestProcessPayments(unittest.TestCase):
+    """
+    test batch payments.
+    """
+    def test_one_authentication_per_session(self) -> None:
+        """
+        batches share the session until it expires.
+        """
+        now = [0.0]
+        provider = SimulatedProvider(auth_latency=0, step_latency=0)
+        provider.clock = lambda: now[0]
+        provider.session_ttl = 60
+        self.assertEqual(provider.process_payments([10, 20, 30]), [10, 20, 30])
+        provider.process_payments([40])
+        self.assertEqual(
+            provider.calls, {"authenticate": 1, "validate": 2, "create_check": 4, "pay_check": 4}
+        )
+        now[0] = 61
+        provider.process_payments([50])
+        self.assertEqual(provider.calls["authenticate"], 2)
+        provider.invalidate_session()
+        provider.process_payments([60])
+        self.assertEqual(provider.calls["authenticate"], 3)
+        self.assertEqual(provider.process_payments([]), [])
+
+    def test_bulk_overrides(self) -> None:
+        """
+        bulk providers make one call per batch.
+        """
+        provider = BulkProvider(auth_latency=0, step_latency=0)
+        provider.process_payments(range(100))
+        self.assertEqual(
+            provider.calls, {"authenticate": 1, "validate": 1, "create_check": 1, "pay_check": 1}
+        )
+
+    def test_providers_keep_their_steps(self) -> None:
+        """
+        the shipped providers print their own steps once per batch.
+        """
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            UniPost().process_payments([100, 200])
+        self.assertEqual(stdout.getvalue().splitlines(), [
+            "Authentication successful.",
+            "Validation successfull using UniPost",
+            "creating check with UniPost amount: 100",
+            "creating check with UniPost amount: 200",
+            "paying check with UniPost amount: 100",
+            "paying check with UniPost amount: 200",
+        ])
+
+    def test_benchmark(self) -> None:
+        """
+        batching beats the per-payment loop.
+        """
+        results = benchmark(payments=40, batch_size=20)
+        print(results)
+        self.assertLess(results["batched_seconds"], results["per_payment_seconds"])
+
+
+class TestStepMetrics(unittest.TestCase):
+    """
+    test step instrumentation.
+    """
+    def test_histograms_per_provider_and_step(self) -> None:
+        """
+        every step of both templates is timed per provider.
+        """
+        metrics = StepMetrics()
+        provider = SimulatedProvider(auth_latency=0.002, step_latency=0)
+        provider.metrics = metrics
+        provider.process_payment(100)
+        provider.process_payments([1, 2, 3])
+        rows = {(row["provider"], row["step"]): row for row in metrics.snapshot()}
+        self.assertEqual(sorted(step for _, step in rows), sorted([
+            "authenticate", "validate", "create_check", "pay_check",
+            "validate_many", "create_checks", "pay_checks",
+        ]))
+        self.assertEqual(rows[("SimulatedProvider", "authenticate")]["count"], 2)
+        self.assertEqual(rows[("SimulatedProvider", "create_check")]["count"], 1)
+        self.assertEqual(rows[("SimulatedProvider", "create_checks")]["count"], 1)
+        self.assertGreaterEqual(rows[("SimulatedProvider", "authenticate")]["p50"], 0.002)
+
+    def test_callbacks_and_errors(self) -> None:
+        """
+        before/after callbacks run without metrics and see step errors.
+        """
+        events = []
+
+        class Audited(SimulatedProvider):
+            """
+            provider recording its steps; paying fails.
+            """
+            def before_step(self, step):
+                events.append(("before", step))
+
+            def after_step(self, step, seconds, error):
+                events.append(("after", step, type(error).__name__ if error else None))
+
+            def pay_check(self, amount):
+                raise ConnectionError("provider is down")
+
+        with self.assertRaises(ConnectionError):
+            Audited(auth_latency=0, step_latency=0).process_payment(10)
+        self.assertEqual(events[-2:], [("before", "pay_check"), ("after", "pay_check", "ConnectionError")])
+        self.assertEqual(len(events), 8)
+        self.assertFalse(Payme._callbacks)  # pylint: disable=W0212
+
+    def test_exporters(self) -> None:
+        """
+        exporters receive the snapshot.
+        """
+        prometheus = PrometheusExporter()
+        stream = StringIO()
+        metrics = StepMetrics(exporters=[prometheus, TextExporter(stream)])
+        metrics.record("Payme", "authenticate", 0.0003)
+        metrics.record("Payme", "authenticate", 0.5, failed=True)
+        metrics.export()
+        labels = 'provider="Payme",step="authenticate"'
+        self.assertIn(f'payment_step_seconds_bucket{{{labels},le="+Inf"}} 2', prometheus.text)
+        self.assertIn(f'payment_step_seconds_count{{{labels}}} 2', prometheus.text)
+        self.assertTrue(stream.getvalue().startswith("Payme.authenticate: count=2 errors=1"))
+
+    def test_overhead(self) -> None:
+        """
+        the instrumented run records every step of every payment.
+        """
+        metrics = StepMetrics()
+        results = overhead_benchmark(payments=20_000, metrics=metrics)
+        print(results)
+        self.assertGreater(results["enabled_us_per_payment"], 0)
+        self.assertEqual(
+            {row["step"]: row["count"] for row in metrics.snapshot()},
+            {"authenticate": 20_000, "validate": 20_000, "create_check": 20_000, "pay_check": 20_000},
+        )
+
+
 if __name__ == "__main__":
     client_code(Payme(), 100)
     client_code(Payze(), 100)
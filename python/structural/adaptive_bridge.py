@@ -0,0 +1,240 @@
+"""
+The adaptive bridge keeps several interchangeable implementors behind one
+abstraction and routes every operation to the one that is currently the
+fastest. For each implementor it tracks an exponentially weighted moving
+average and the p99 of the recent latencies; implementors that fail are
+taken out of rotation for a cooldown, and a small share of the calls
+explores the other implementors so that a backend that got faster again
+is noticed.
+
+usage:
+    abstraction = AdaptiveAbstraction([ConcreteImplementorA(), ConcreteImplementorB()])
+    print(abstraction.operation())
+"""
+import collections
+import random
+import time
+import typing
+import unittest
+
+from .bridge import Abstraction, Implementor
+
+
+class LatencyStats:
+    """
+    latency statistics of one implementor.
+    """
+    def __init__(self, alpha: float = 0.2, window: int = 200) -> None:
+        self.alpha = alpha
+        self.ewma: typing.Optional[float] = None
+        self.samples: typing.Deque[float] = collections.deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+        self.unhealthy_until = 0.0
+
+    def record(self, latency: float) -> None:
+        """
+        add a latency sample.
+        """
+        self.calls += 1
+        self.failures = 0
+        self.samples.append(latency)
+        if self.ewma is None:
+            self.ewma = latency
+        else:
+            self.ewma += self.alpha * (latency - self.ewma)
+
+    @property
+    def p99(self) -> typing.Optional[float]:
+        """
+        p99 of the recent samples.
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)]
+
+
+class AdaptiveAbstraction(Abstraction):
+    """
+    abstraction that routes to the fastest healthy implementor.
+    """
+    def __init__(
+        self,
+        implementors: typing.Sequence[Implementor],
+        exploration: float = 0.05,
+        max_failures: int = 3,
+        cooldown: float = 5.0,
+        clock: typing.Callable[[], float] = time.perf_counter,
+        rng: typing.Optional[random.Random] = None,
+    ) -> None:
+        if not implementors:
+            raise ValueError("at least one implementor is required")
+        super().__init__(implementors[0])
+        self.implementors = list(implementors)
+        self.stats = [LatencyStats() for _ in self.implementors]
+        self.exploration = exploration
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self.rng = rng or random.Random()
+
+    def _healthy(self, now: float) -> typing.List[int]:
+        healthy = [
+            index for index, stats in enumerate(self.stats)
+            if stats.unhealthy_until <= now
+        ]
+        return healthy or list(range(len(self.implementors)))
+
+    def choose(self) -> int:
+        """
+        index of the implementor for the next operation.
+        """
+        healthy = self._healthy(self.clock())
+        unmeasured = [index for index in healthy if self.stats[index].ewma is None]
+        if unmeasured:
+            return unmeasured[0]
+        if len(healthy) > 1 and self.rng.random() < self.exploration:
+            return self.rng.choice(healthy)
+        return min(healthy, key=lambda index: self.stats[index].ewma)
+
+    def operation(self) -> str:
+        index = self.choose()
+        stats = self.stats[index]
+        self.implementor = self.implementors[index]
+
+        started_at = self.clock()
+        try:
+            result = self.implementor.operation()
+        except Exception:
+            stats.failures += 1
+            if stats.failures >= self.max_failures:
+                stats.unhealthy_until = self.clock() + self.cooldown
+            raise
+        stats.record(self.clock() - started_at)
+        return f"Abstraction operation using {result}"
+
+    def report(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        the statistics of every implementor for inspection.
+        """
+        now = self.clock()
+        return [
+            {
+                "implementor": type(implementor).__name__,
+                "calls": stats.calls,
+                "ewma": stats.ewma,
+                "p99": stats.p99,
+                "healthy": stats.unhealthy_until <= now,
+            }
+            for implementor, stats in zip(self.implementors, self.stats)
+        ]
+
+
+class SimulatedClock:
+    """
+    virtual clock advanced by the simulated implementors.
+    """
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class SimulatedImplementor(Implementor):
+    """
+    backend whose latency drifts with the simulated time of day.
+    """
+    def __init__(self, name: str, clock: SimulatedClock, latency: typing.Callable[[float], float]) -> None:
+        self.name = name
+        self.clock = clock
+        self.latency = latency
+
+    def operation(self) -> str:
+        self.clock.now += self.latency(self.clock.now)
+        return f"implemented with {self.name}"
+
+
+def simulate(route: str, operations: int = 20_000, seed: int = 7) -> float:
+    """
+    mean latency of `operations` calls over two backends whose latency
+    drifts in opposite directions; route is "adaptive", "a" or "b".
+    """
+    rnd = random.Random(seed)
+    clock = SimulatedClock()
+    day = operations * 0.003
+
+    def drifting(peak_at: float) -> typing.Callable[[float], float]:
+        return lambda now: 0.001 + 0.004 * abs((now / day) - peak_at) + rnd.expovariate(2000)
+
+    backend_a = SimulatedImplementor("a", clock, drifting(0.0))
+    backend_b = SimulatedImplementor("b", clock, drifting(1.0))
+
+    if route == "adaptive":
+        abstraction: Abstraction = AdaptiveAbstraction(
+            [backend_a, backend_b], clock=clock, rng=random.Random(seed)
+        )
+    else:
+        abstraction = Abstraction(backend_a if route == "a" else backend_b)
+
+    for _ in range(operations):
+        abstraction.operation()
+    return clock.now / operations
+
+
+class FlakyImplementor(Implementor):
+    """
+    implementor that always fails.
+    """
+    def operation(self) -> str:
+        raise ConnectionError("backend is down")
+
+
+class TestAdaptiveAbstraction(unittest.TestCase):
+    """
+    test adaptive abstraction.
+    """
+    def test_routes_to_fastest(self) -> None:
+        """
+        after measuring every backend the fastest one gets the calls.
+        """
+        clock = SimulatedClock()
+        slow = SimulatedImplementor("slow", clock, lambda now: 0.010)
+        fast = SimulatedImplementor("fast", clock, lambda now: 0.001)
+        abstraction = AdaptiveAbstraction([slow, fast], exploration=0.0, clock=clock)
+        for _ in range(100):
+            result = abstraction.operation()
+        self.assertEqual(result, "Abstraction operation using implemented with fast")
+        self.assertEqual(abstraction.stats[0].calls, 1)
+        self.assertAlmostEqual(abstraction.report()[1]["p99"], 0.001)
+
+    def test_unhealthy_implementor_skipped(self) -> None:
+        """
+        an implementor that keeps failing is taken out of rotation.
+        """
+        clock = SimulatedClock()
+        backup = SimulatedImplementor("backup", clock, lambda now: 0.001)
+        abstraction = AdaptiveAbstraction(
+            [FlakyImplementor(), backup], exploration=0.0, max_failures=2, clock=clock
+        )
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                abstraction.operation()
+        self.assertFalse(abstraction.report()[0]["healthy"])
+        self.assertIn("backup", abstraction.operation())
+
+    def test_drifting_latency_simulation(self) -> None:
+        """
+        the adaptive routing beats every fixed backend under drift.
+        """
+        adaptive = simulate("adaptive")
+        fixed_a = simulate("a")
+        fixed_b = simulate("b")
+        print(f"mean latency adaptive {adaptive:.5f} a {fixed_a:.5f} b {fixed_b:.5f}")
+        self.assertLess(adaptive, fixed_a)
+        self.assertLess(adaptive, fixed_b)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+"""
+The async bridge lets one abstraction serve both synchronous worker code
+and an asyncio service. Implementors are either the regular synchronous
+ones or async-capable ones that expose `aoperation`. The abstraction offers
+both `operation()` and `await aoperation()`: async implementors are awaited
+natively, synchronous ones are moved onto a bounded thread pool so that
+they never block the event loop.
+
+usage:
+    abstraction = AsyncAbstraction(ConcreteImplementorA())
+    print(abstraction.operation())
+    print(await abstraction.aoperation())
+"""
+import abc
+import asyncio
+import concurrent.futures
+import threading
+import time
+import unittest
+
+from .bridge import Abstraction, Implementor
+
+
+class AsyncImplementor(Implementor):
+    """
+    abstract implementor with a native coroutine operation.
+    """
+    @abc.abstractmethod
+    async def aoperation(self) -> str:
+        """
+        abstract async operation.
+        """
+        raise NotImplementedError(
+            "not implemented yet!"
+        )
+
+    def operation(self) -> str:
+        """
+        run the coroutine to completion for synchronous callers.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aoperation())
+        raise RuntimeError("use `await aoperation()` inside a running event loop")
+
+
+class AsyncConcreteImplementorC(AsyncImplementor):
+    """
+    way to to implement with asyncio.
+    """
+    async def aoperation(self) -> str:
+        await asyncio.sleep(0)
+        return "implemented with way c"
+
+
+class AsyncAbstraction(Abstraction):
+    """
+    abstraction with both synchronous and asynchronous operation.
+    """
+    def __init__(self, implementor: Implementor, max_workers: int = 4) -> None:
+        super().__init__(implementor)
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """
+        the bounded pool for synchronous implementors, created on first use.
+        """
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="bridge"
+                    )
+        return self._executor
+
+    async def aoperation(self) -> str:
+        """
+        the operation without blocking the event loop.
+        """
+        if isinstance(self.implementor, AsyncImplementor):
+            result = await self.implementor.aoperation()
+        else:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, self.implementor.operation)
+        return f"Abstraction operation using {result}"
+
+    def close(self) -> None:
+        """
+        shut the thread pool down.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class SlowImplementor(Implementor):
+    """
+    blocking implementor, like a driver without asyncio support.
+    """
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.threads = set()
+
+    def operation(self) -> str:
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        return "implemented with blocking way"
+
+
+async def max_loop_stall(coroutine, tick: float = 0.005) -> float:
+    """
+    run the coroutine next to a heartbeat and return the longest gap
+    between two heartbeats beyond the tick.
+    """
+    stall = 0.0
+    done = False
+
+    async def heartbeat() -> None:
+        nonlocal stall
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(tick)
+            now = time.perf_counter()
+            stall = max(stall, now - last - tick)
+            last = now
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0)
+    try:
+        await coroutine
+    finally:
+        done = True
+        await beat
+    return stall
+
+
+class TestAsyncAbstraction(unittest.TestCase):
+    """
+    test async abstraction.
+    """
+    def test_sync_operation_with_sync_implementor(self) -> None:
+        """
+        synchronous callers keep the plain bridge behaviour.
+        """
+        abstraction = AsyncAbstraction(SlowImplementor(0))
+        self.assertEqual(abstraction.operation(), "Abstraction operation using implemented with blocking way")
+
+    def test_sync_operation_with_async_implementor(self) -> None:
+        """
+        synchronous callers can use an async implementor outside a loop.
+        """
+        abstraction = AsyncAbstraction(AsyncConcreteImplementorC())
+        self.assertEqual(abstraction.operation(), "Abstraction operation using implemented with way c")
+
+    def test_sync_operation_inside_loop_rejected(self) -> None:
+        """
+        a blocking call on an async implementor inside a loop is an error.
+        """
+        abstraction = AsyncAbstraction(AsyncConcreteImplementorC())
+
+        async def call() -> None:
+            abstraction.operation()
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(call())
+
+    def test_async_implementor_awaited_natively(self) -> None:
+        """
+        async implementors never touch the thread pool.
+        """
+        abstraction = AsyncAbstraction(AsyncConcreteImplementorC())
+        result = asyncio.run(abstraction.aoperation())
+        self.assertEqual(result, "Abstraction operation using implemented with way c")
+        self.assertIsNone(abstraction._executor)  # pylint: disable=W0212
+
+    def test_sync_implementor_does_not_block_loop(self) -> None:
+        """
+        blocking implementors run on the pool while the loop keeps ticking.
+        """
+        implementor = SlowImplementor(0.05)
+        abstraction = AsyncAbstraction(implementor, max_workers=2)
+
+        async def calls() -> list:
+            return await asyncio.gather(*(abstraction.aoperation() for _ in range(6)))
+
+        stall = asyncio.run(max_loop_stall(calls()))
+        abstraction.close()
+        self.assertLess(stall, 0.03)
+        self.assertLessEqual(len(implementor.threads), 2)
+        self.assertTrue(all(name.startswith("bridge") for name in implementor.threads))
+
+    def test_blocking_call_stalls_loop(self) -> None:
+        """
+        the heartbeat notices a blocking call made directly on the loop.
+        """
+        implementor = SlowImplementor(0.05)
+
+        async def blocking() -> None:
+            implementor.operation()
+
+        stall = asyncio.run(max_loop_stall(blocking()))
+        self.assertGreater(stall, 0.03)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,258 @@
+"""
+The asyncio flavour of the trip facade. In production the payment and the
+trip subsystems are network calls, so waiting for the debt check before
+preparing the trip doubles the latency of every trip start. This facade
+runs both subsystems concurrently, cancels the trip as soon as debt is
+found and bounds every subsystem call with its own timeout.
+
+usage:
+    facade = AsyncTripFacade(AsyncTrip(), AsyncPayment())
+    started = asyncio.run(facade.start_trip())
+"""
+import asyncio
+import random
+import time
+import typing
+import unittest
+
+
+class AsyncTrip:
+    """
+    the asynchronous trip system.
+    """
+    def __init__(self, latency: typing.Callable[[], float] = lambda: 0.0) -> None:
+        self.latency = latency
+        self.prepared = 0
+        self.started = 0
+        self.cancelled = 0
+
+    async def prepare(self) -> bool:
+        """
+        reserve the driver and build the route.
+        """
+        await asyncio.sleep(self.latency())
+        self.prepared += 1
+        return True
+
+    async def start(self) -> None:
+        """
+        start the prepared trip.
+        """
+        self.started += 1
+
+    async def cancel(self) -> None:
+        """
+        release everything reserved by prepare.
+        """
+        self.cancelled += 1
+
+
+class AsyncPayment:
+    """
+    the asynchronous payment system.
+    """
+    def __init__(self, debt: bool = False, latency: typing.Callable[[], float] = lambda: 0.0) -> None:
+        self.debt = debt
+        self.latency = latency
+
+    async def has_debt(self) -> bool:
+        """
+        checks client's debt
+        """
+        await asyncio.sleep(self.latency())
+        return self.debt
+
+
+class AsyncTripFacade:
+    """
+    the trip facade that overlaps the debt check and the trip preparation.
+
+    a debt check that times out is treated as debt: the trip is never
+    started for a client we could not verify.
+    """
+    def __init__(
+        self,
+        trip: AsyncTrip,
+        payment: AsyncPayment,
+        debt_timeout: float = 1.0,
+        trip_timeout: float = 1.0,
+    ) -> None:
+        self.trip = trip
+        self.payment = payment
+        self.debt_timeout = debt_timeout
+        self.trip_timeout = trip_timeout
+
+    async def _check_debt(self) -> bool:
+        try:
+            return await asyncio.wait_for(self.payment.has_debt(), self.debt_timeout)
+        except asyncio.TimeoutError:
+            return True
+
+    async def _prepare_trip(self) -> bool:
+        try:
+            return await asyncio.wait_for(self.trip.prepare(), self.trip_timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    async def start_trip(self) -> bool:
+        """
+        start the trip.
+        """
+        debt_task = asyncio.create_task(self._check_debt())
+        prepare_task = asyncio.create_task(self._prepare_trip())
+
+        try:
+            done, _ = await asyncio.wait(
+                {debt_task, prepare_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if debt_task in done and debt_task.result() is True:
+                prepare_task.cancel()
+                await asyncio.gather(prepare_task, return_exceptions=True)
+                await self.trip.cancel()
+                return False
+
+            has_debt = await debt_task
+            prepared = await prepare_task
+        except BaseException:
+            debt_task.cancel()
+            prepare_task.cancel()
+            raise
+
+        if has_debt is True or prepared is False:
+            await self.trip.cancel()
+            return False
+
+        await self.trip.start()
+        return True
+
+
+class SequentialTripFacade(AsyncTripFacade):
+    """
+    the facade that calls the subsystems one after another, like TripFacade.
+    kept as the baseline of the load test.
+    """
+    async def start_trip(self) -> bool:
+        if await self._check_debt() is True:
+            await self.trip.cancel()
+            return False
+
+        if await self._prepare_trip() is False:
+            await self.trip.cancel()
+            return False
+
+        await self.trip.start()
+        return True
+
+
+def percentile(samples: typing.List[float], pct: float) -> float:
+    """
+    nearest-rank percentile of the samples.
+    """
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[rank]
+
+
+def simulated_latency(seed: int, base: float, tail: float) -> typing.Callable[[], float]:
+    """
+    network latency: mostly `base` seconds, one call in twenty takes `tail`.
+    """
+    rnd = random.Random(seed)
+    return lambda: tail if rnd.random() < 0.05 else base * (0.5 + rnd.random())
+
+
+async def load_test(facade_class, trips: int = 500, concurrency: int = 50) -> typing.Dict[str, float]:
+    """
+    start `trips` trips with simulated subsystem latency and measure
+    the trip-start time percentiles.
+    """
+    facade = facade_class(
+        AsyncTrip(latency=simulated_latency(1, base=0.004, tail=0.02)),
+        AsyncPayment(latency=simulated_latency(2, base=0.004, tail=0.02)),
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: typing.List[float] = []
+
+    async def one_trip() -> None:
+        async with semaphore:
+            started_at = time.perf_counter()
+            await facade.start_trip()
+            samples.append(time.perf_counter() - started_at)
+
+    await asyncio.gather(*(one_trip() for _ in range(trips)))
+    return {
+        "p50": percentile(samples, 50),
+        "p99": percentile(samples, 99),
+    }
+
+
+class TestAsyncTripFacade(unittest.TestCase):
+    """
+    test async trip facade.
+    """
+    def test_start_trip_without_debt(self) -> None:
+        """
+        the trip starts when the client has no debt.
+        """
+        trip = AsyncTrip()
+        facade = AsyncTripFacade(trip, AsyncPayment(debt=False))
+        self.assertTrue(asyncio.run(facade.start_trip()))
+        self.assertEqual(trip.started, 1)
+        self.assertEqual(trip.cancelled, 0)
+
+    def test_debt_cancels_preparation(self) -> None:
+        """
+        debt found first cancels the still running preparation.
+        """
+        trip = AsyncTrip(latency=lambda: 0.5)
+        facade = AsyncTripFacade(trip, AsyncPayment(debt=True))
+        started_at = time.perf_counter()
+        self.assertFalse(asyncio.run(facade.start_trip()))
+        self.assertLess(time.perf_counter() - started_at, 0.25)
+        self.assertEqual(trip.prepared, 0)
+        self.assertEqual(trip.cancelled, 1)
+
+    def test_debt_found_after_preparation(self) -> None:
+        """
+        a prepared trip is cancelled when the debt check answers later.
+        """
+        trip = AsyncTrip()
+        facade = AsyncTripFacade(trip, AsyncPayment(debt=True, latency=lambda: 0.01))
+        self.assertFalse(asyncio.run(facade.start_trip()))
+        self.assertEqual(trip.prepared, 1)
+        self.assertEqual(trip.started, 0)
+        self.assertEqual(trip.cancelled, 1)
+
+    def test_debt_timeout(self) -> None:
+        """
+        an unanswered debt check refuses the trip within the timeout.
+        """
+        trip = AsyncTrip()
+        payment = AsyncPayment(latency=lambda: 5.0)
+        facade = AsyncTripFacade(trip, payment, debt_timeout=0.05)
+        started_at = time.perf_counter()
+        self.assertFalse(asyncio.run(facade.start_trip()))
+        self.assertLess(time.perf_counter() - started_at, 1.0)
+        self.assertEqual(trip.started, 0)
+
+    def test_trip_timeout(self) -> None:
+        """
+        a slow preparation refuses the trip within the timeout.
+        """
+        trip = AsyncTrip(latency=lambda: 5.0)
+        facade = AsyncTripFacade(trip, AsyncPayment(), trip_timeout=0.05)
+        self.assertFalse(asyncio.run(facade.start_trip()))
+        self.assertEqual(trip.cancelled, 1)
+
+    def test_load_test_p99(self) -> None:
+        """
+        overlapping the subsystems lowers the p99 trip-start time.
+        """
+        sequential = asyncio.run(load_test(SequentialTripFacade, trips=200))
+        concurrent = asyncio.run(load_test(AsyncTripFacade, trips=200))
+        print(f"sequential {sequential} concurrent {concurrent}")
+        self.assertLess(concurrent["p99"], sequential["p99"])
+
+
+if __name__ == "__main__":
+    unittest.main()
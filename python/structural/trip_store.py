@@ -0,0 +1,385 @@
+"""
+The trip state store keeps the lifecycle of millions of live trips behind
+the trip facade. A python object per trip costs a few hundred bytes, so the
+store keeps every field in its own typed column indexed by the trip id:
+
+    started_at  float64
+    stopped_at  float64
+    amount      int64 (minor units)
+    status      uint8
+
+which is 25 bytes per trip. The columns live in one buffer: a bytearray for
+an in-memory store or a memory-mapped file for a store that survives a
+restart without replaying anything.
+
+usage:
+    store = TripStateStore(capacity=1_000_000)
+    store.start(42, amount=15000)
+    store.stop(42)
+    store.ids_with_status(STOPPED)
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import typing
+import unittest
+
+from .facade import Payment
+
+IDLE = 0
+STARTED = 1
+STOPPED = 2
+CANCELLED = 3
+
+STATUSES = (IDLE, STARTED, STOPPED, CANCELLED)
+
+TRANSITIONS = {
+    STARTED: frozenset({IDLE}),
+    STOPPED: frozenset({STARTED}),
+    CANCELLED: frozenset({IDLE, STARTED}),
+}
+
+FINAL = frozenset({STOPPED, CANCELLED})
+
+MAGIC = b"TRIPSTOR"
+HEADER = struct.Struct("<8sQ")
+BYTES_PER_TRIP = 8 + 8 + 8 + 1
+
+
+class TripStateStore:
+    """
+    the array-backed trip state store.
+    """
+    def __init__(self, capacity: int, buffer=None) -> None:
+        size = HEADER.size + capacity * BYTES_PER_TRIP
+        if buffer is None:
+            buffer = bytearray(size)
+            HEADER.pack_into(buffer, 0, MAGIC, capacity)
+        if len(buffer) != size:
+            raise ValueError(f"buffer of {len(buffer)} bytes does not hold {capacity} trips")
+
+        self.capacity = capacity
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+
+        offset = HEADER.size
+        self.started_at = self._column(offset, capacity, "d")
+        offset += capacity * 8
+        self.stopped_at = self._column(offset, capacity, "d")
+        offset += capacity * 8
+        self.amount = self._column(offset, capacity, "q")
+        offset += capacity * 8
+        self._status_offset = offset
+        self.status = self._column(offset, capacity, "B")
+
+        self._counts = [0] * len(STATUSES)
+        for status in STATUSES[1:]:
+            self._counts[status] = len(self.ids_with_status(status))
+        self._counts[IDLE] = capacity - sum(self._counts)
+
+    def _column(self, offset: int, length: int, fmt: str) -> memoryview:
+        itemsize = struct.calcsize(fmt)
+        return self._view[offset:offset + length * itemsize].cast(fmt)
+
+    @classmethod
+    def open(cls, path: str, capacity: int) -> "TripStateStore":
+        """
+        open the memory-mapped store at path, creating it when missing.
+        """
+        size = HEADER.size + capacity * BYTES_PER_TRIP
+        exists = os.path.exists(path)
+        with open(path, "a+b") as file:
+            if not exists:
+                file.truncate(size)
+            if os.fstat(file.fileno()).st_size != size:
+                raise ValueError(f"{path} is not a trip store of {capacity} trips")
+            buffer = mmap.mmap(file.fileno(), 0)
+
+        try:
+            magic, stored_capacity = HEADER.unpack_from(buffer, 0)
+            if not exists:
+                HEADER.pack_into(buffer, 0, MAGIC, capacity)
+            elif magic != MAGIC or stored_capacity != capacity:
+                raise ValueError(f"{path} is not a trip store of {capacity} trips")
+            return cls(capacity, buffer)
+        except BaseException:
+            buffer.close()
+            raise
+
+    def _check(self, trip_id: int) -> int:
+        if not 0 <= trip_id < self.capacity:
+            raise IndexError(f"trip id {trip_id} is outside the store (capacity {self.capacity})")
+        return trip_id
+
+    def _transition(self, trip_id: int, status: int) -> None:
+        current = self.status[self._check(trip_id)]
+        if current not in TRANSITIONS[status]:
+            raise ValueError(f"trip {trip_id} cannot move from {current} to {status}")
+        self.status[trip_id] = status
+        self._counts[current] -= 1
+        self._counts[status] += 1
+
+    def start(self, trip_id: int, amount: int, now: typing.Optional[float] = None) -> None:
+        """
+        start the trip.
+        """
+        self._transition(trip_id, STARTED)
+        self.started_at[trip_id] = time.time() if now is None else now
+        self.amount[trip_id] = amount
+
+    def stop(self, trip_id: int, now: typing.Optional[float] = None) -> None:
+        """
+        stop the trip.
+        """
+        self._transition(trip_id, STOPPED)
+        self.stopped_at[trip_id] = time.time() if now is None else now
+
+    def cancel(self, trip_id: int, now: typing.Optional[float] = None) -> None:
+        """
+        cancel the trip.
+        """
+        self._transition(trip_id, CANCELLED)
+        self.stopped_at[trip_id] = time.time() if now is None else now
+
+    def reset(self, trip_id: int) -> None:
+        """
+        free the slot of a finished trip for reuse.
+        """
+        current = self.status[self._check(trip_id)]
+        if current not in FINAL:
+            raise ValueError(f"trip {trip_id} is not finished (status {current})")
+        self.status[trip_id] = IDLE
+        self.started_at[trip_id] = 0.0
+        self.stopped_at[trip_id] = 0.0
+        self.amount[trip_id] = 0
+        self._counts[current] -= 1
+        self._counts[IDLE] += 1
+
+    def get(self, trip_id: int) -> typing.Tuple[int, float, float, int]:
+        """
+        status, started_at, stopped_at and amount of the trip.
+        """
+        self._check(trip_id)
+        return (
+            self.status[trip_id],
+            self.started_at[trip_id],
+            self.stopped_at[trip_id],
+            self.amount[trip_id],
+        )
+
+    def count(self, status: int) -> int:
+        """
+        number of trips in the status.
+        """
+        return self._counts[status]
+
+    def ids_with_status(self, status: int) -> typing.List[int]:
+        """
+        ids of all trips in the status, scanned at C speed with find.
+        """
+        needle = bytes((status,))
+        start = self._status_offset
+        end = start + self.capacity
+        find = self._buffer.find
+        ids = []
+        position = find(needle, start, end)
+        while position != -1:
+            ids.append(position - start)
+            position = find(needle, position + 1, end)
+        return ids
+
+    def memory_per_trip(self) -> float:
+        """
+        bytes of buffer used per trip slot.
+        """
+        return len(self._buffer) / self.capacity
+
+    def flush(self) -> None:
+        """
+        write a memory-mapped store to disk.
+        """
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.flush()
+
+    def close(self) -> None:
+        """
+        release the columns and unmap the file.
+        """
+        for column in (self.started_at, self.stopped_at, self.amount, self.status):
+            column.release()
+        self._view.release()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+
+class TrackedTripFacade:
+    """
+    the trip facade that records every trip in the state store.
+    """
+    def __init__(self, store: TripStateStore, payment: Payment) -> None:
+        self.store = store
+        self.payment = payment
+
+    def start_trip(self, trip_id: int, amount: int) -> bool:
+        """
+        start the trip.
+        """
+        if self.payment.has_debt() is True:
+            self.store.cancel(trip_id)
+            return False
+
+        self.store.start(trip_id, amount)
+        return True
+
+    def finish_trip(self, trip_id: int) -> None:
+        """
+        stop the trip.
+        """
+        self.store.stop(trip_id)
+
+
+class NoDebtPayment(Payment):
+    """
+    the payment system of a client without debt.
+    """
+    def has_debt(self) -> bool:
+        return False
+
+
+class PythonTrip:
+    """
+    a trip as a regular python object, the baseline of the memory report.
+    """
+    __slots__ = ("status", "started_at", "stopped_at", "amount")
+
+    def __init__(self) -> None:
+        self.status = IDLE
+        self.started_at = time.time()
+        self.stopped_at = time.time()
+        self.amount = 15000 * 10 ** 6
+
+
+class TestTripStateStore(unittest.TestCase):
+    """
+    test trip state store.
+    """
+    def test_lifecycle(self) -> None:
+        """
+        start, stop and cancel update status, timestamps and counts.
+        """
+        store = TripStateStore(capacity=10)
+        store.start(3, amount=15000, now=100.0)
+        store.stop(3, now=160.0)
+        store.cancel(4, now=170.0)
+        self.assertEqual(store.get(3), (STOPPED, 100.0, 160.0, 15000))
+        self.assertEqual(store.count(IDLE), 8)
+        self.assertEqual(store.count(STOPPED), 1)
+        self.assertEqual(store.count(CANCELLED), 1)
+
+    def test_invalid_transition(self) -> None:
+        """
+        a trip cannot be stopped before it has been started.
+        """
+        store = TripStateStore(capacity=10)
+        with self.assertRaises(ValueError):
+            store.stop(1)
+        store.start(1, amount=1)
+        with self.assertRaises(ValueError):
+            store.start(1, amount=1)
+
+    def test_reset(self) -> None:
+        """
+        a reset slot can host a new trip.
+        """
+        store = TripStateStore(capacity=2)
+        store.start(0, amount=1)
+        store.stop(0)
+        store.reset(0)
+        store.start(0, amount=2)
+        self.assertEqual(store.count(STARTED), 1)
+        self.assertEqual(store.count(STOPPED), 0)
+        with self.assertRaises(ValueError):
+            store.reset(0)
+        with self.assertRaises(ValueError):
+            store.reset(1)
+        self.assertEqual(store.get(0)[0], STARTED)
+
+    def test_trip_id_bounds(self) -> None:
+        """
+        negative and too large ids are rejected instead of wrapping around.
+        """
+        store = TripStateStore(capacity=2)
+        for trip_id in (-1, 2):
+            with self.assertRaises(IndexError):
+                store.start(trip_id, amount=1)
+            with self.assertRaises(IndexError):
+                store.get(trip_id)
+        self.assertEqual(store.count(IDLE), 2)
+
+    def test_ids_with_status(self) -> None:
+        """
+        bulk status query returns the matching ids in order.
+        """
+        store = TripStateStore(capacity=100_000)
+        for trip_id in range(0, 100_000, 7):
+            store.start(trip_id, amount=trip_id)
+        ids = store.ids_with_status(STARTED)
+        self.assertEqual(ids, list(range(0, 100_000, 7)))
+        self.assertEqual(len(store.ids_with_status(IDLE)), store.count(IDLE))
+
+    def test_memory_mapped_restart(self) -> None:
+        """
+        a reopened store sees the trips of the previous process.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trips.bin")
+            store = TripStateStore.open(path, capacity=1000)
+            store.start(7, amount=42, now=1.0)
+            store.cancel(8)
+            store.flush()
+            store.close()
+
+            store = TripStateStore.open(path, capacity=1000)
+            self.assertEqual(store.get(7), (STARTED, 1.0, 0.0, 42))
+            self.assertEqual(store.count(STARTED), 1)
+            self.assertEqual(store.count(CANCELLED), 1)
+            store.close()
+
+            with self.assertRaises(ValueError):
+                TripStateStore.open(path, capacity=10)
+
+            with open(path, "r+b") as file:
+                file.truncate(HEADER.size + 1000 * BYTES_PER_TRIP - 1)
+            with self.assertRaises(ValueError):
+                TripStateStore.open(path, capacity=1000)
+
+    def test_tracked_facade(self) -> None:
+        """
+        the facade records started, finished and refused trips.
+        """
+        store = TripStateStore(capacity=10)
+        self.assertTrue(TrackedTripFacade(store, NoDebtPayment()).start_trip(1, 500))
+        TrackedTripFacade(store, NoDebtPayment()).finish_trip(1)
+        self.assertFalse(TrackedTripFacade(store, Payment()).start_trip(2, 500))
+        self.assertEqual(store.status[1], STOPPED)
+        self.assertEqual(store.status[2], CANCELLED)
+
+    def test_memory_per_trip(self) -> None:
+        """
+        report bytes per trip against a python object per trip.
+        """
+        store = TripStateStore(capacity=1_000_000)
+        trip = PythonTrip()
+        object_size = sys.getsizeof(trip) + sum(
+            sys.getsizeof(getattr(trip, name)) for name in PythonTrip.__slots__
+        )
+        print(f"store: {store.memory_per_trip():.1f} bytes/trip, python object: {object_size} bytes/trip")
+        self.assertLess(store.memory_per_trip(), BYTES_PER_TRIP + 1)
+        self.assertLess(store.memory_per_trip() * 4, object_size)
+
+
+if __name__ == "__main__":
+    unittest.main()